@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+'''
+a stub of the parts of the DigitalOcean API that `provision` uses, for trying it out
+(and timing it) without creating real droplets
+
+every request takes `--latency` seconds, the `ratelimit-*` headers count down from
+`--rate-limit` per `--rate-limit-window` seconds (and requests past that get a 429), and
+droplets turn active `--active-after` seconds after they are created
+
+usage:
+
+    python benchmarks/digitalocean_stub_api.py --port 8089 &
+    DIGITALOCEAN_ACCESS_TOKEN=stub python cli.py --config some.conf provision --api-url http://127.0.0.1:8089/v2/ \
+        --count 50 --name-prefix web --region nyc3 --size s-1vcpu-1gb --image ubuntu-22-04-x64 --poll-interval 1
+'''
+
+import argparse
+import http.server
+import itertools
+import json
+import math
+import threading
+import time
+import urllib.parse
+
+
+class StubApiState:
+
+    def __init__(self, args):
+
+        self.args = args
+        self.lock = threading.Lock()
+        self.droplets = dict()
+        self.droplet_ids = itertools.count(1000)
+        self.request_count = 0
+        self.rate_limited_count = 0
+
+        self.window_start = time.time()
+        self.window_used = 0
+
+    def take_rate_limit(self) -> tuple:
+        '''
+        @return whether the request is allowed, the remaining requests and the reset time
+        '''
+
+        with self.lock:
+
+            self.request_count += 1
+            now = time.time()
+
+            if now - self.window_start >= self.args.rate_limit_window:
+                self.window_start = now
+                self.window_used = 0
+
+            reset = math.ceil(self.window_start + self.args.rate_limit_window)
+
+            if self.window_used >= self.args.rate_limit:
+                self.rate_limited_count += 1
+                return False, 0, reset
+
+            self.window_used += 1
+
+            return True, self.args.rate_limit - self.window_used, reset
+
+    def create_droplets(self, request_body:dict) -> list:
+
+        created_droplets = []
+
+        with self.lock:
+            for iter_name in request_body["names"]:
+
+                droplet_id = next(self.droplet_ids)
+                droplet = {
+                    "id": droplet_id,
+                    "name": iter_name,
+                    "status": "new",
+                    "tags": request_body.get("tags", []),
+                    "networks": {"v4": []},
+                    "created_at_epoch": time.time(),
+                    "user_data_size": len(request_body.get("user_data", "")),
+                }
+
+                self.droplets[droplet_id] = droplet
+                created_droplets.append(droplet)
+
+        return created_droplets
+
+    def list_droplets(self, tag_name) -> list:
+
+        now = time.time()
+
+        with self.lock:
+            for iter_droplet in self.droplets.values():
+                if iter_droplet["status"] == "new" and now - iter_droplet["created_at_epoch"] >= self.args.active_after:
+                    iter_droplet["status"] = "active"
+                    iter_droplet["networks"]["v4"] = [{"type": "public", "ip_address": f"203.0.113.{iter_droplet['id'] % 250 + 1}"}]
+
+            return [iter_droplet for iter_droplet in self.droplets.values() if tag_name is None or tag_name in iter_droplet["tags"]]
+
+
+def make_handler(state:StubApiState):
+
+    class StubApiHandler(http.server.BaseHTTPRequestHandler):
+
+        # keep the connections open, like the real API does
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if state.args.verbose:
+                super().log_message(format, *args)
+
+        def _send_json(self, status_code:int, body:dict, headers:dict):
+
+            body_bytes = json.dumps(body).encode("utf-8")
+
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body_bytes)))
+            for iter_name, iter_value in headers.items():
+                self.send_header(iter_name, str(iter_value))
+            self.end_headers()
+            self.wfile.write(body_bytes)
+
+        def _handle(self, method:str):
+
+            request_body = None
+            content_length = int(self.headers.get("Content-Length", 0))
+            if content_length:
+                request_body = json.loads(self.rfile.read(content_length))
+
+            time.sleep(state.args.latency)
+
+            allowed, remaining, reset = state.take_rate_limit()
+            headers = {"ratelimit-limit": state.args.rate_limit, "ratelimit-remaining": remaining, "ratelimit-reset": reset}
+
+            if not allowed:
+                self._send_json(429, {"id": "too_many_requests", "message": "API Rate limit exceeded."}, headers)
+                return
+
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self._send_json(401, {"id": "unauthorized", "message": "Unable to authenticate you."}, headers)
+                return
+
+            parsed_url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(parsed_url.query)
+
+            if method == "POST" and parsed_url.path == "/v2/droplets":
+
+                if len(request_body.get("names", [])) > 10:
+                    self._send_json(422, {"id": "unprocessable_entity", "message": "too many names"}, headers)
+                    return
+
+                self._send_json(202, {"droplets": state.create_droplets(request_body)}, headers)
+
+            elif method == "GET" and parsed_url.path == "/v2/droplets":
+
+                droplets = state.list_droplets(query.get("tag_name", [None])[0])
+
+                per_page = int(query.get("per_page", ["20"])[0])
+                page = int(query.get("page", ["1"])[0])
+                page_droplets = droplets[(page - 1) * per_page:page * per_page]
+
+                links = dict()
+                if page * per_page < len(droplets):
+                    next_query = dict((iter_key, iter_values[0]) for iter_key, iter_values in query.items())
+                    next_query["page"] = page + 1
+                    links["pages"] = {"next": f"http://{self.headers['Host']}/v2/droplets?{urllib.parse.urlencode(next_query)}"}
+
+                self._send_json(200, {"droplets": page_droplets, "links": links, "meta": {"total": len(droplets)}}, headers)
+
+            else:
+                self._send_json(404, {"id": "not_found", "message": "The resource you were accessing could not be found."}, headers)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return StubApiHandler
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="a stub of the DigitalOcean API for the provision subcommand")
+    parser.add_argument("--port", type=int, default=8089, help="the port to listen on")
+    parser.add_argument("--latency", type=float, default=0.2, help="how many seconds every request takes")
+    parser.add_argument("--rate-limit", dest="rate_limit", type=int, default=250, help="how many requests are allowed per window")
+    parser.add_argument("--rate-limit-window", dest="rate_limit_window", type=float, default=60, help="how long the rate limit window is in seconds")
+    parser.add_argument("--active-after", dest="active_after", type=float, default=3, help="how many seconds a droplet takes to become active")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    state = StubApiState(args)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+
+    print(f"listening on http://127.0.0.1:{args.port}/v2/", flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"handled `{state.request_count}` requests, `{state.rate_limited_count}` of them were rate limited, "
+            f"`{len(state.droplets)}` droplets were created", flush=True)
+
+
+if __name__ == "__main__":
+    main()
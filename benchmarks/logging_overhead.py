@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+'''
+benchmark for the cost of logging on the thread that logs
+
+logs the same records through the old arrow based formatter (if arrow is installed, it
+isn't a dependency anymore), then through utils.LocalTimeLoggingFormatter and
+utils.JsonLinesLoggingFormatter, both written out synchronously and through the queue
+that main() sets up, and reports how long each record held up the logging thread, and
+for the queued ones how long the listener took to write them all out
+
+usage: python benchmarks/logging_overhead.py [--records N] [--runs N] [--json-output results.json]
+'''
+
+import argparse
+import importlib.util
+import json
+import logging
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from cloud_init_utils import utils
+
+
+LOG_FORMAT = "%(asctime)s %(threadName)-10s %(name)-20s %(levelname)-8s: %(message)s"
+
+
+class ArrowLoggingFormatter(logging.Formatter):
+    '''
+    what utils.ArrowLoggingFormatter used to do, as the baseline
+    '''
+
+    def formatTime(self, record, datefmt=None):
+        import arrow
+
+        return arrow.get("{}".format(record.created), "X").to("local").isoformat()
+
+
+def time_logging(formatter:logging.Formatter, use_queue:bool, records:int, log_path:pathlib.Path) -> tuple:
+    '''
+    @return how long the logging thread spent logging, and how long it took until every record was written
+    '''
+
+    file_handler = logging.FileHandler(log_path, mode="w", encoding="utf-8")
+    file_handler.setFormatter(formatter)
+
+    # not the root logger, so nothing else sees these
+    benchmark_logger = logging.Logger("cloud_init_utils.modules.create_yaml_fleet")
+
+    queue_listener = None
+
+    if use_queue:
+        queue_listener = utils.start_logging_listener(benchmark_logger, [file_handler])
+    else:
+        benchmark_logger.addHandler(file_handler)
+
+    start = time.perf_counter()
+
+    for iter_index in range(records):
+        benchmark_logger.info("host `%s`: wrote yaml file to `%s`", f"host{iter_index}", f"/tmp/fleet/host{iter_index}.yaml")
+
+    logged_s = time.perf_counter() - start
+
+    if queue_listener is not None:
+        queue_listener.stop()
+
+    written_s = time.perf_counter() - start
+
+    file_handler.close()
+
+    return logged_s, written_s
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="benchmark for the cost of logging on the thread that logs")
+    parser.add_argument("--records", type=int, default=50000, help="how many records to log in each run")
+    parser.add_argument("--runs", type=int, default=3, help="how many times to log with each setting, the median is reported")
+    parser.add_argument("--json-output", dest="json_output", type=pathlib.Path, help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    settings = [
+        ("cached tz, synchronous", lambda: utils.LocalTimeLoggingFormatter(LOG_FORMAT), False),
+        ("cached tz, queued", lambda: utils.LocalTimeLoggingFormatter(LOG_FORMAT), True),
+        ("json lines, synchronous", utils.JsonLinesLoggingFormatter, False),
+        ("json lines, queued", utils.JsonLinesLoggingFormatter, True),
+    ]
+
+    if importlib.util.find_spec("arrow") is not None:
+        settings.insert(0, ("arrow, synchronous", lambda: ArrowLoggingFormatter(LOG_FORMAT), False))
+    else:
+        print("arrow isn't installed, skipping the arrow baseline")
+
+    results = {"records": args.records, "settings": []}
+
+    print(f"{args.records} records per run, median of {args.runs} runs")
+    print(f"{'':>24}  {'us/record on the logging thread':>32}  {'until written':>14}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        log_path = pathlib.Path(temp_dir) / "benchmark.log"
+
+        for iter_name, iter_make_formatter, iter_use_queue in settings:
+
+            timings = [time_logging(iter_make_formatter(), iter_use_queue, args.records, log_path) for _ in range(args.runs)]
+
+            logged_s = statistics.median(iter_timing[0] for iter_timing in timings)
+            written_s = statistics.median(iter_timing[1] for iter_timing in timings)
+
+            results["settings"].append({
+                "name": iter_name,
+                "logged_seconds": logged_s,
+                "written_seconds": written_s,
+                "logged_us_per_record": logged_s / args.records * 1_000_000,
+            })
+
+            print(f"{iter_name:>24}  {logged_s / args.records * 1_000_000:32.2f}  {written_s:13.3f}s")
+
+    if args.json_output:
+        args.json_output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
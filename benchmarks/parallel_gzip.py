@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+'''
+throughput benchmark for ParallelGzipCompressor
+
+compresses a synthetic payload with the plain single threaded gzip that
+model.gzip_compress() uses, then with ParallelGzipCompressor at 1, 2, 4, ... threads
+(up to the number of CPUs), and reports the throughput, the speedup over the single
+threaded gzip and the compressed size of each
+
+usage: python benchmarks/parallel_gzip.py [--size-mb N] [--chunk-size BYTES] [--runs N] [--json-output results.json]
+'''
+
+import argparse
+import json
+import os
+import pathlib
+import random
+import statistics
+import sys
+import time
+import zlib
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import gzip_compress
+from cloud_init_utils.parallel_gzip import ParallelGzipCompressor
+
+
+def make_payload(size_bytes:int, random_fraction:float, seed:int) -> bytes:
+    '''
+    make a payload that compresses something like real artifacts do, a mix of
+    text made out of a small vocabulary and incompressible random bytes
+    '''
+
+    random_generator = random.Random(seed)
+
+    vocabulary = [
+        bytes(random_generator.choice(b"abcdefghijklmnopqrstuvwxyz_/.") for _ in range(random_generator.randint(2, 12)))
+        for _ in range(2000)]
+
+    pieces = []
+    current_size = 0
+
+    while current_size < size_bytes:
+
+        if random_generator.random() < random_fraction:
+            piece = random_generator.randbytes(4096)
+        else:
+            piece = b" ".join(random_generator.choice(vocabulary) for _ in range(512)) + b"\n"
+
+        pieces.append(piece)
+        current_size += len(piece)
+
+    return b"".join(pieces)[:size_bytes]
+
+
+def time_compress(compress_func, runs:int) -> tuple:
+
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        compressed_bytes = compress_func()
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings), compressed_bytes
+
+
+def get_thread_counts(cpu_count:int) -> list:
+
+    thread_counts = [1]
+    while thread_counts[-1] * 2 <= cpu_count:
+        thread_counts.append(thread_counts[-1] * 2)
+
+    if thread_counts[-1] != cpu_count:
+        thread_counts.append(cpu_count)
+
+    return thread_counts
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="throughput benchmark for ParallelGzipCompressor")
+    parser.add_argument("--size-mb", dest="size_mb", type=int, default=128, help="how big the payload is")
+    parser.add_argument("--random-fraction", dest="random_fraction", type=float, default=0.25,
+        help="roughly how much of the payload is incompressible random bytes")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=constants.PARALLEL_GZIP_DEFAULT_CHUNK_SIZE,
+        help="the chunk size for ParallelGzipCompressor")
+    parser.add_argument("--level", type=int, default=constants.GZIP_COMPRESSION_LEVEL, help="the gzip compression level")
+    parser.add_argument("--threads", type=int, nargs="+", help="the thread counts to try, defaults to powers of 2 up to the number of CPUs")
+    parser.add_argument("--runs", type=int, default=3, help="how many times to compress with each setting, the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the synthetic payload")
+    parser.add_argument("--json-output", dest="json_output", type=pathlib.Path, help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    thread_counts = args.threads or get_thread_counts(cpu_count)
+
+    payload = make_payload(args.size_mb * 1024 * 1024, args.random_fraction, args.seed)
+    payload_mb = len(payload) / (1024 * 1024)
+
+    print(f"payload: {payload_mb:.1f} MB, level {args.level}, chunk size {args.chunk_size}, {cpu_count} CPUs")
+
+    baseline_s, baseline_bytes = time_compress(lambda: gzip_compress(payload, args.level), args.runs)
+
+    results = {
+        "payload_bytes": len(payload),
+        "random_fraction": args.random_fraction,
+        "level": args.level,
+        "chunk_size": args.chunk_size,
+        "cpu_count": cpu_count,
+        "single_stream": {"seconds": baseline_s, "mb_per_s": payload_mb / baseline_s, "compressed_bytes": len(baseline_bytes)},
+        "parallel": [],
+    }
+
+    print(f"{'single stream':>16}: {payload_mb / baseline_s:8.1f} MB/s  {len(baseline_bytes):>12} bytes")
+
+    for iter_threads in thread_counts:
+
+        with ParallelGzipCompressor(iter_threads, args.chunk_size) as parallel_gzip:
+            parallel_s, parallel_bytes = time_compress(lambda: parallel_gzip.compress(payload, args.level), args.runs)
+
+        # the whole point is that this is still one normal gzip stream
+        if zlib.decompress(parallel_bytes, 31) != payload:
+            raise Exception(f"the output with `{iter_threads}` threads didn't decompress back to the payload")
+
+        results["parallel"].append({
+            "threads": iter_threads,
+            "seconds": parallel_s,
+            "mb_per_s": payload_mb / parallel_s,
+            "speedup": baseline_s / parallel_s,
+            "compressed_bytes": len(parallel_bytes),
+            "size_vs_single_stream": len(parallel_bytes) / len(baseline_bytes),
+        })
+
+        print(f"{f'{iter_threads} threads':>16}: {payload_mb / parallel_s:8.1f} MB/s  {len(parallel_bytes):>12} bytes  "
+            f"{baseline_s / parallel_s:5.2f}x, {(len(parallel_bytes) / len(baseline_bytes) - 1) * 100:+.2f}% size")
+
+    if args.json_output:
+        args.json_output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+'''
+benchmark suite for the render pipeline
+
+generates synthetic configs that vary one thing at a time from a small base config (the
+number of files_to_write, the payload size, the length of the package list and whether
+the payloads are mustache templates) and times each phase of a render on its own:
+
+    hocon_parse                      - pyhocon parsing the config file
+    parse_config                     - utils.parse_config()
+    format_as_yaml_dict              - CloudInitSettings.format_as_yaml_dict()
+    get_yaml_file_string_from_dict   - utils.get_yaml_file_string_from_dict()
+    write_yaml_file_from_dict        - utils.write_yaml_file_from_dict() to /dev/null
+    create_yaml_run                  - loading the config and CreateYaml.run(), end to end
+
+each scenario runs in its own process, so the peak RSS reported for it is its own, and
+the peak memory of each phase is measured with tracemalloc in a separate run so the
+tracing doesn't slow down the timed runs
+
+the JSON results include the git commit and the versions of the dependencies, and
+`--compare` prints how a run compares to the results saved from another commit
+
+usage: python benchmarks/render_pipeline.py [--quick] [--scenario NAME ...] [--runs N]
+    [--json-output results.json] [--compare baseline.json]
+'''
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+PHASES = [
+    "hocon_parse",
+    "parse_config",
+    "format_as_yaml_dict",
+    "get_yaml_file_string_from_dict",
+    "write_yaml_file_from_dict",
+    "create_yaml_run",
+]
+
+# payloads bigger than this are written to their own file and referenced with
+# payload_source_path rather than put in the config
+INLINE_PAYLOAD_MAX_SIZE = 256 * 1024
+
+KB = 1024
+MB = 1024 * 1024
+
+BASE_SCENARIO = {"files_count": 10, "payload_size": 1 * KB, "packages_count": 10, "use_templates": False}
+
+
+def make_scenarios(quick:bool) -> list:
+    '''
+    @return the list of scenarios, each one changes a single thing from BASE_SCENARIO
+    '''
+
+    if quick:
+        files_counts = [1, 100, 1000]
+        payload_sizes = [1 * KB, 1 * MB, 8 * MB]
+        packages_counts = [10, 1000]
+    else:
+        files_counts = [1, 10, 100, 1000, 10000]
+        payload_sizes = [1 * KB, 64 * KB, 1 * MB, 16 * MB, 100 * MB]
+        packages_counts = [10, 100, 1000, 10000]
+
+    scenarios = []
+
+    for iter_files_count in files_counts:
+        scenarios.append({"name": f"files_{iter_files_count}", **BASE_SCENARIO, "files_count": iter_files_count})
+
+    for iter_payload_size in payload_sizes:
+        scenarios.append({"name": f"payload_{iter_payload_size // KB}kb", **BASE_SCENARIO, "files_count": 1, "payload_size": iter_payload_size})
+
+    for iter_packages_count in packages_counts:
+        scenarios.append({"name": f"packages_{iter_packages_count}", **BASE_SCENARIO, "packages_count": iter_packages_count})
+
+    for iter_use_templates in (False, True):
+        scenarios.append({"name": f"templates_{'on' if iter_use_templates else 'off'}", **BASE_SCENARIO,
+            "files_count": 100, "payload_size": 4 * KB, "use_templates": iter_use_templates})
+
+    return scenarios
+
+
+def make_payload(size:int, index:int, use_templates:bool) -> str:
+    '''
+    make a payload of roughly `size` bytes that looks something like a config file, so it
+    compresses about as well as a real one would, it ends on a whole line so a template
+    tag never gets cut in half
+    '''
+
+    random_generator = random.Random(index)
+
+    lines = []
+    current_size = 0
+
+    while current_size < size:
+
+        if use_templates and random_generator.random() < 0.2:
+            line = f"host_{len(lines)} = {{{{hostname}}}}.{{{{domain}}}}"
+        else:
+            line = f"setting_{random_generator.randint(0, 5000)} = {random_generator.getrandbits(48):x}"
+
+        lines.append(line)
+        current_size += len(line) + 1
+
+    return "\n".join(lines) + "\n"
+
+
+def write_scenario_config(scenario:dict, folder:pathlib.Path) -> pathlib.Path:
+    '''
+    write the HOCON config (and any payload files) for a scenario
+
+    @return the path of the config file
+    '''
+
+    files_to_write = []
+
+    for iter_index in range(scenario["files_count"]):
+
+        payload = make_payload(scenario["payload_size"], iter_index, scenario["use_templates"])
+
+        entry = {
+            "file_path": f"/opt/benchmark/file_{iter_index}.conf",
+            "owner_username": "root",
+            "owner_group": "root",
+            "permission_octal": "0644",
+            "use_mustache_template": scenario["use_templates"],
+            "payload_is_base64": False,
+        }
+
+        if len(payload) > INLINE_PAYLOAD_MAX_SIZE:
+            payload_path = folder / f"payload_{iter_index}.conf"
+            payload_path.write_text(payload, encoding="utf-8")
+            entry["payload_source_path"] = str(payload_path)
+        else:
+            entry["payload_content"] = payload
+
+        files_to_write.append(entry)
+
+    # JSON is valid HOCON, and it takes care of the escaping
+    config = {
+        "cloud_init_utils": {
+            "bootstrap_script_settings": {
+                "root_folder": "/opt/bootstrap",
+                "zip_url": "https://example.com/bootstrap.zip",
+                "zip_root_folder": "bootstrap",
+                "commands_to_run": [{"command_line": ["true"], "acceptable_status_codes": [0]}],
+                "files_to_write": [],
+            },
+            "cloud_init_yaml_settings": {
+                "user_name": "benchmark",
+                "ssh_authorized_keys": ["ssh-ed25519 AAAA benchmark@localhost"],
+                "password": "benchmark",
+                "byobu_enable": False,
+                "packages_to_install": [f"package-{iter_index}" for iter_index in range(scenario["packages_count"])],
+                "files_to_write": files_to_write,
+            },
+            "template_variables": {"hostname": "benchmark-host", "domain": "example.com"},
+        }
+    }
+
+    config_path = folder / "benchmark.conf"
+    config_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    return config_path
+
+
+def run_phases(config_path:pathlib.Path, output_path:pathlib.Path, phases:list, traced:bool) -> dict:
+    '''
+    run each phase once, passing the result of each on to the next
+
+    @return a dict of phase name -> seconds, or -> peak bytes if `traced`
+    '''
+
+    from cloud_init_utils import main, utils
+    from cloud_init_utils.template_cache import MustacheTemplateCache
+
+    results = dict()
+    state = dict()
+
+    def _phase(name, func):
+
+        if traced:
+            tracemalloc.reset_peak()
+            start_size, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+
+        if traced:
+            _, peak_size = tracemalloc.get_traced_memory()
+            results[name] = peak_size - start_size
+        elif name in phases:
+            results[name] = elapsed
+
+        return value
+
+    # the later phases need the results of the earlier ones, so those always run
+    def _hocon_parse():
+        utils.clear_parsed_config_memos()
+        return utils.parse_hocon_file(config_path)
+
+    state["config_obj"] = _phase("hocon_parse", _hocon_parse)
+    state["config"] = _phase("parse_config", lambda: utils.parse_config(state["config_obj"]))
+
+    settings = state["config"]
+    state["yaml_dict"] = _phase("format_as_yaml_dict",
+        lambda: settings.cloud_init_settings.format_as_yaml_dict(None, MustacheTemplateCache(), settings.template_variables))
+
+    if "get_yaml_file_string_from_dict" in phases:
+        _phase("get_yaml_file_string_from_dict", lambda: utils.get_yaml_file_string_from_dict(state["yaml_dict"]))
+
+    if "write_yaml_file_from_dict" in phases:
+        def _write_yaml():
+            with open(os.devnull, "w", encoding="utf-8") as f:
+                utils.write_yaml_file_from_dict(state["yaml_dict"], f)
+
+        _phase("write_yaml_file_from_dict", _write_yaml)
+
+    if "create_yaml_run" in phases:
+        def _create_yaml_run():
+
+            # otherwise the write-if-changed check would skip writing it after the first run
+            output_path.unlink(missing_ok=True)
+            utils.clear_parsed_config_memos()
+
+            parsed_args = main.get_argument_parser().parse_args(
+                ["--no-cache", "--config", str(config_path), "create_yaml", "--output-file", str(output_path)])
+            config = utils.load_config_settings(parsed_args.config, None)
+            parsed_args.func_to_run(config, parsed_args)
+
+        _phase("create_yaml_run", _create_yaml_run)
+
+    return results
+
+
+def run_scenario_in_this_process(scenario:dict, phases:list, runs:int, trace_memory:bool) -> dict:
+
+    sys.path.insert(0, str(REPO_ROOT))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        folder = pathlib.Path(temp_dir)
+        config_path = write_scenario_config(scenario, folder)
+        output_path = folder / "benchmark.yaml"
+
+        timed_runs = [run_phases(config_path, output_path, phases, traced=False) for _ in range(runs)]
+
+        peak_traced_bytes = dict()
+        if trace_memory:
+            tracemalloc.start()
+            peak_traced_bytes = run_phases(config_path, output_path, phases, traced=True)
+            tracemalloc.stop()
+
+        result = {
+            "scenario": scenario,
+            "config_bytes": config_path.stat().st_size,
+            "output_bytes": output_path.stat().st_size if output_path.exists() else None,
+            "phases": dict(),
+            # ru_maxrss is in KB on linux
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+    for iter_phase in phases:
+
+        timings = [iter_run[iter_phase] for iter_run in timed_runs]
+
+        result["phases"][iter_phase] = {
+            "seconds_median": statistics.median(timings),
+            "seconds_min": min(timings),
+            "peak_traced_bytes": peak_traced_bytes.get(iter_phase),
+        }
+
+    return result
+
+
+def run_scenario(scenario:dict, phases:list, runs:int, trace_memory:bool) -> dict:
+    '''
+    run a scenario in a fresh python process and return its results
+    '''
+
+    child_args = {"scenario": scenario, "phases": phases, "runs": runs, "trace_memory": trace_memory}
+
+    completed = subprocess.run([sys.executable, __file__, "--child", json.dumps(child_args)],
+        cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    if completed.returncode != 0:
+        raise Exception(f"the scenario `{scenario['name']}` failed:\n{completed.stderr[-4000:]}")
+
+    return json.loads(completed.stdout)
+
+
+def get_environment() -> dict:
+
+    import importlib.metadata
+
+    environment = {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+    for iter_package in ("pyhocon", "ruamel.yaml", "attrs", "chevron"):
+        try:
+            environment[iter_package] = importlib.metadata.version(iter_package)
+        except importlib.metadata.PackageNotFoundError:
+            environment[iter_package] = None
+
+    try:
+        environment["git_commit"] = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        environment["git_commit"] = None
+
+    return environment
+
+
+def print_results(results:list):
+
+    for iter_result in results:
+
+        print(f"{iter_result['scenario']['name']}: config {iter_result['config_bytes']} bytes, "
+            f"output {iter_result['output_bytes']} bytes, peak RSS {iter_result['peak_rss_bytes'] / MB:.1f} MB")
+
+        for iter_phase, iter_phase_result in iter_result["phases"].items():
+
+            peak_traced = iter_phase_result["peak_traced_bytes"]
+            peak_traced_text = f"{peak_traced / MB:9.1f} MB peak" if peak_traced is not None else ""
+
+            print(f"    {iter_phase:<32} {iter_phase_result['seconds_median'] * 1000:10.2f} ms  {peak_traced_text}")
+
+
+def print_comparison(results:list, baseline:dict):
+
+    baseline_results = {iter_result["scenario"]["name"]: iter_result for iter_result in baseline["results"]}
+
+    print(f"compared to `{baseline['environment'].get('git_commit')}` (new / old, median time):")
+
+    for iter_result in results:
+
+        baseline_result = baseline_results.get(iter_result["scenario"]["name"])
+        if baseline_result is None:
+            continue
+
+        print(f"{iter_result['scenario']['name']}:")
+
+        for iter_phase, iter_phase_result in iter_result["phases"].items():
+
+            baseline_phase_result = baseline_result["phases"].get(iter_phase)
+            if baseline_phase_result is None or not baseline_phase_result["seconds_median"]:
+                continue
+
+            ratio = iter_phase_result["seconds_median"] / baseline_phase_result["seconds_median"]
+            print(f"    {iter_phase:<32} {ratio:6.2f}x")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="benchmark suite for the render pipeline")
+    parser.add_argument("--quick", action="store_true", help="use smaller scenarios, for a quick check")
+    parser.add_argument("--scenario", dest="scenarios", action="append",
+        help="only run the scenario with this name, can be given more than once")
+    parser.add_argument("--phase", dest="phases", action="append", choices=PHASES,
+        help="only time this phase, can be given more than once, defaults to all of them")
+    parser.add_argument("--runs", type=int, default=3, help="how many times to run each scenario, the median is reported")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+        help="skip the extra tracemalloc run that measures the peak memory of each phase")
+    parser.add_argument("--list", dest="list_scenarios", action="store_true", help="list the scenarios and exit")
+    parser.add_argument("--json-output", dest="json_output", type=pathlib.Path, help="where to save the results as JSON")
+    parser.add_argument("--compare", dest="compare", type=pathlib.Path, help="JSON results from an earlier run to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_args = json.loads(args.child)
+        print(json.dumps(run_scenario_in_this_process(
+            child_args["scenario"], child_args["phases"], child_args["runs"], child_args["trace_memory"])))
+        return
+
+    scenarios = make_scenarios(args.quick)
+
+    if args.list_scenarios:
+        for iter_scenario in scenarios:
+            print(iter_scenario)
+        return
+
+    if args.scenarios:
+        unknown_names = set(args.scenarios) - set(iter_scenario["name"] for iter_scenario in scenarios)
+        if unknown_names:
+            parser.error(f"unknown scenarios: `{sorted(unknown_names)}`, see --list")
+        scenarios = [iter_scenario for iter_scenario in scenarios if iter_scenario["name"] in args.scenarios]
+
+    phases = args.phases or PHASES
+
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+
+    results = []
+    for iter_scenario in scenarios:
+        start = time.perf_counter()
+        results.append(run_scenario(iter_scenario, phases, args.runs, args.trace_memory))
+        print(f"ran `{iter_scenario['name']}` in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    print_results(results)
+
+    if baseline is not None:
+        print_comparison(results, baseline)
+
+    if args.json_output:
+        args.json_output.write_text(json.dumps({"environment": get_environment(), "results": results}, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+'''
+throughput benchmark for renderer.UserDataRenderer
+
+renders the user-data for a number of hosts (each one with its own overrides, and a
+template that uses them) with one renderer that every thread shares, then with a new
+renderer for every render, at each thread count, and reports the renders per second of
+each. The same hosts are also rendered by running `cli.py create_yaml` for each one, like
+a program that can't use the library has to, for comparison
+
+usage: python benchmarks/renderer_throughput.py [--renders N] [--threads N ...] [--runs N] [--subprocess-renders N] [--json-output results.json]
+'''
+
+import argparse
+import concurrent.futures
+import json
+import os
+import pathlib
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from cloud_init_utils import constants
+from cloud_init_utils import utils
+from cloud_init_utils.compression_cache import CompressionCache
+from cloud_init_utils.renderer import UserDataRenderer
+
+
+CLI_PATH = REPO_ROOT / "cli.py"
+
+CONFIG_TEMPLATE = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "benchmark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA benchmark@localhost"]
+    password = "benchmark"
+    byobu_enable = false
+    packages_to_install = ["htop", "git"]
+    files_to_write = [
+      { file_path = "/etc/motd", owner_username = "root", owner_group = "root",
+        permission_octal = "0644", use_mustache_template = true, payload_is_base64 = false,
+        payload_content = "welcome to {{hostname}} in {{region}}\\n" }
+      { file_path = "/etc/app/config.toml", owner_username = "root", owner_group = "root",
+        permission_octal = "0644", use_mustache_template = false, payload_is_base64 = false,
+        payload_content = """PAYLOAD_CONTENT""" }
+    ]
+  }
+  template_variables {
+    hostname = "benchmark"
+    region = "nyc1"
+  }
+}
+'''
+
+
+def make_payload(size_bytes:int, seed:int) -> bytes:
+    '''
+    a text payload that compresses about as well as a real config file does
+    '''
+
+    random_generator = random.Random(seed)
+
+    lines = []
+    current_size = 0
+
+    while current_size < size_bytes:
+        line = f"setting_{random_generator.randint(0, 5000)} = \"{random_generator.randbytes(8).hex()}\"\n"
+        lines.append(line)
+        current_size += len(line)
+
+    return "".join(lines)[:size_bytes].encode("utf-8")
+
+
+def get_host_overrides(host_index:int) -> dict:
+
+    return {
+        "cloud_init_yaml_settings.user_name": f"user{host_index}",
+        "template_variables.hostname": f"host{host_index}",
+    }
+
+
+def time_renders(render_func, renders:int, threads:int) -> tuple:
+    '''
+    @return the seconds it took, and the user-data of each host
+    '''
+
+    start = time.perf_counter()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(render_func, range(renders)))
+
+    return time.perf_counter() - start, results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="throughput benchmark for renderer.UserDataRenderer")
+    parser.add_argument("--renders", type=int, default=2000, help="how many hosts to render with each setting")
+    parser.add_argument("--threads", type=int, nargs="+", help="the thread counts to try, defaults to 1 and the number of CPUs")
+    parser.add_argument("--runs", type=int, default=3, help="how many times to render with each setting, the median is reported")
+    parser.add_argument("--payload-kb", dest="payload_kb", type=int, default=64, help="how big the (not templated) payload is")
+    parser.add_argument("--subprocess-renders", dest="subprocess_renders", type=int, default=10,
+        help="how many hosts to render by running cli.py, 0 to skip it")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the synthetic payload")
+    parser.add_argument("--json-output", dest="json_output", type=pathlib.Path, help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    thread_counts = args.threads or sorted(set([1, cpu_count]))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        temp_dir = pathlib.Path(temp_dir)
+
+        # inline rather than a payload_source_path, since those are streamed and never go through the compression cache
+        payload = make_payload(args.payload_kb * 1024, args.seed)
+
+        config_path = temp_dir / "benchmark.conf"
+        config_path.write_text(CONFIG_TEMPLATE.replace("PAYLOAD_CONTENT", payload.decode("utf-8")), encoding="utf-8")
+
+        config_settings = utils.load_config_settings([config_path])
+
+        cache_dir = temp_dir / "compression_cache"
+        max_size_bytes = constants.COMPRESSION_CACHE_DEFAULT_MAX_SIZE_MB * 1024 * 1024
+
+        shared_renderer = UserDataRenderer(compression_cache=CompressionCache(cache_dir, max_size_bytes))
+
+        def _render_reused(host_index):
+            return shared_renderer.render(config_settings, get_host_overrides(host_index))
+
+        def _render_per_call(host_index):
+            renderer = UserDataRenderer(compression_cache=CompressionCache(cache_dir, max_size_bytes))
+            return renderer.render(config_settings, get_host_overrides(host_index))
+
+        # fill the compression cache (and import everything) first, so neither setting pays for that
+        _render_reused(0)
+
+        results = {"renders": args.renders, "payload_bytes": len(payload), "cpu_count": cpu_count, "settings": []}
+
+        print(f"{args.renders} renders per run, median of {args.runs} runs, {args.payload_kb} KB payload, {cpu_count} CPUs")
+
+        for iter_threads in thread_counts:
+
+            reused_timings = [time_renders(_render_reused, args.renders, iter_threads) for _ in range(args.runs)]
+            per_call_timings = [time_renders(_render_per_call, args.renders, iter_threads) for _ in range(args.runs)]
+
+            if any(iter_timing[1] != reused_timings[0][1] for iter_timing in reused_timings + per_call_timings):
+                raise Exception(f"the reused and per call renderers rendered different user-data with `{iter_threads}` threads")
+
+            reused_s = statistics.median(iter_timing[0] for iter_timing in reused_timings)
+            per_call_s = statistics.median(iter_timing[0] for iter_timing in per_call_timings)
+
+            results["settings"].append({
+                "threads": iter_threads,
+                "reused_renders_per_s": args.renders / reused_s,
+                "per_call_renders_per_s": args.renders / per_call_s,
+                "speedup": per_call_s / reused_s,
+            })
+
+            print(f"{f'{iter_threads} threads':>12}: reused {args.renders / reused_s:8.1f}/s  "
+                f"per call {args.renders / per_call_s:8.1f}/s  {per_call_s / reused_s:5.2f}x")
+
+        if args.subprocess_renders:
+
+            output_path = temp_dir / "user-data.yaml"
+
+            start = time.perf_counter()
+
+            for _ in range(args.subprocess_renders):
+                subprocess.run([sys.executable, str(CLI_PATH), "--no-stdout", "--cache-dir", str(temp_dir / "cli_cache"),
+                    "--config", str(config_path), "create_yaml", "--output-file", str(output_path)], check=True)
+
+            subprocess_s = time.perf_counter() - start
+
+            results["subprocess_renders_per_s"] = args.subprocess_renders / subprocess_s
+
+            print(f"{'cli.py':>12}: {args.subprocess_renders / subprocess_s:8.1f}/s")
+
+        if args.json_output:
+            args.json_output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+'''
+cold start benchmark for cli.py
+
+runs `cli.py --help` and `cli.py ... create_yaml` in fresh interpreters with
+`python -X importtime`, and reports the wall time of each run along with the
+modules that took the longest to import
+
+usage: python benchmarks/startup.py [--runs N] [--json-output results.json]
+'''
+
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+CLI_PATH = REPO_ROOT / "cli.py"
+
+MINIMAL_CONFIG = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "benchmark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA benchmark@localhost"]
+    password = "benchmark"
+    byobu_enable = false
+    packages_to_install = ["htop"]
+    files_to_write = [
+      { file_path = "/etc/motd", owner_username = "root", owner_group = "root",
+        permission_octal = "0644", use_mustache_template = false, payload_is_base64 = false,
+        payload_content = "hello\\n" }
+    ]
+  }
+}
+'''
+
+
+def parse_importtime_output(stderr_text:str) -> dict:
+    '''
+    parse the `-X importtime` output into a dict of module name -> cumulative microseconds
+    '''
+
+    import_times = dict()
+
+    for iter_line in stderr_text.splitlines():
+
+        if not iter_line.startswith("import time:") or "cumulative" in iter_line:
+            continue
+
+        _, _, rest = iter_line.partition(":")
+        _, cumulative_us, module_name = [iter_part.strip() for iter_part in rest.split("|")]
+
+        # the same module only shows up once, the first time it is imported
+        import_times[module_name] = int(cumulative_us)
+
+    return import_times
+
+
+def run_once(cli_args:list) -> dict:
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", str(CLI_PATH), *cli_args],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall_time_s = time.perf_counter() - start
+
+    if completed.returncode != 0:
+        raise Exception(f"`{cli_args}` exited with `{completed.returncode}`:\n{completed.stderr[-2000:]}")
+
+    return {"wall_time_s": wall_time_s, "import_times_us": parse_importtime_output(completed.stderr)}
+
+
+def benchmark_scenario(name:str, cli_args:list, runs:int, top:int) -> dict:
+
+    results = [run_once(cli_args) for _ in range(runs)]
+
+    wall_times = [iter_result["wall_time_s"] for iter_result in results]
+
+    # only report the top level modules, nested ones are included in their cumulative time
+    last_import_times = results[-1]["import_times_us"]
+    slowest_imports = sorted(last_import_times.items(), key=lambda x: x[1], reverse=True)[:top]
+
+    return {
+        "scenario": name,
+        "runs": runs,
+        "wall_time_s_min": min(wall_times),
+        "wall_time_s_median": statistics.median(wall_times),
+        "cloud_init_utils_main_import_us": last_import_times.get("cloud_init_utils.main"),
+        "slowest_imports_us": dict(slowest_imports),
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="cold start benchmark for cli.py")
+    parser.add_argument("--runs", type=int, default=10, help="how many times to run each scenario")
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest imports to report")
+    parser.add_argument("--json-output", dest="json_output", type=pathlib.Path, help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        config_path = pathlib.Path(temp_dir) / "benchmark.conf"
+        config_path.write_text(MINIMAL_CONFIG, encoding="utf-8")
+        output_path = pathlib.Path(temp_dir) / "benchmark.yaml"
+
+        scenarios = [
+            ("help", ["--help"]),
+            ("create_yaml", ["--no-stdout", "--no-cache", "--config", str(config_path), "create_yaml", "--output-file", str(output_path)]),
+        ]
+
+        results = [benchmark_scenario(iter_name, iter_args, args.runs, args.top) for iter_name, iter_args in scenarios]
+
+    for iter_result in results:
+        print(f"{iter_result['scenario']}: min {iter_result['wall_time_s_min'] * 1000:.1f} ms, "
+            f"median {iter_result['wall_time_s_median'] * 1000:.1f} ms over {iter_result['runs']} runs, "
+            f"cloud_init_utils.main import {iter_result['cloud_init_utils_main_import_us'] / 1000:.1f} ms")
+
+        for iter_module, iter_us in iter_result["slowest_imports_us"].items():
+            print(f"    {iter_us / 1000:8.1f} ms  {iter_module}")
+
+    if args.json_output:
+        args.json_output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+import re
+import gzip
+import json
+import pathlib
+import tarfile
+import datetime
+import logging
+import collections
+import typing
+
+import attr
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import BootDurationCategoryEnum
+
+
+logger = logging.getLogger(__name__)
+
+# `2023-05-01 12:00:00,123 - handlers.py[DEBUG]: start: init-local: searching for local datasources`
+_LOG_LINE_REGEX = re.compile(r"^(?P<timestamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - [^\[]+\[\w+\]: (?P<message>.*)$")
+_EVENT_REGEX = re.compile(r"^(?P<event_type>start|finish): (?P<event_name>[^:\s]+): ")
+_WRITING_TO_REGEX = re.compile(r"^Writing to (?P<path>\S+) - ")
+
+# every boot appends to the same logs, only the last boot is looked at
+_BOOT_START_REGEX = re.compile(r"Cloud-init v\. \S+ running 'init-local'")
+_FINISHED_REGEX = re.compile(r"Cloud-init v\. \S+ finished at .* Up (?P<uptime>[\d.]+) seconds")
+
+# what bootstrap_runner prints, see _run_command() and main() there
+_BOOTSTRAP_COMMAND_REGEX = re.compile(r"^\[bootstrap\] `(?P<name>[^`]+)`: exited with `-?\d+` after `(?P<seconds>[\d.]+)` seconds")
+_BOOTSTRAP_FINISHED_REGEX = re.compile(r"^\[bootstrap\] (?:finished|failed) after `(?P<seconds>[\d.]+)` seconds")
+
+_WRITE_FILES_MODULE_SUFFIXES = ("/config-write_files", "/config-write_files_deferred")
+_MODULE_EVENT_PREFIX = "config-"
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class BootReport:
+
+    hostname:str = attr.ib()
+
+    # (BootDurationCategoryEnum value, name, seconds) tuples, plain tuples since there
+    # are a lot of them and they get pickled back from the worker processes
+    durations:typing.Sequence[typing.Tuple[str, str, float]] = attr.ib()
+
+    # the errors cloud-init recorded in result.json
+    errors:typing.Sequence[str] = attr.ib()
+
+    # anything that stopped us from reading the bundle, like missing files
+    problems:typing.Sequence[str] = attr.ib()
+
+
+def _parse_timestamp(timestamp_text:str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(timestamp_text.replace(",", "."))
+
+
+def _parse_cloud_init_log(lines:typing.Iterable[str]) -> list:
+    '''
+    get the duration of each stage, module and other event out of the start and finish
+    events in cloud-init.log, and of each file that write_files wrote from how long it was
+    until the next one was started
+
+    @param lines - the lines of the log
+    @return a list of (category, name, seconds) tuples for the last boot in the log
+    '''
+
+    durations = []
+    event_starts = dict()
+    in_write_files = False
+    pending_write = None
+
+    for iter_line in lines:
+
+        line_match = _LOG_LINE_REGEX.match(iter_line)
+        if line_match is None:
+            continue
+
+        message = line_match["message"]
+
+        if _BOOT_START_REGEX.search(message):
+            durations = []
+            event_starts = dict()
+            in_write_files = False
+            pending_write = None
+            continue
+
+        event_match = _EVENT_REGEX.match(message)
+
+        if event_match is not None:
+
+            event_name = event_match["event_name"]
+            timestamp = _parse_timestamp(line_match["timestamp"])
+
+            if event_match["event_type"] == "start":
+                event_starts[event_name] = timestamp
+                in_write_files = in_write_files or event_name.endswith(_WRITE_FILES_MODULE_SUFFIXES)
+                continue
+
+            if event_name.endswith(_WRITE_FILES_MODULE_SUFFIXES):
+
+                if pending_write is not None:
+                    durations.append((BootDurationCategoryEnum.WRITE_FILE.value, pending_write[0], (timestamp - pending_write[1]).total_seconds()))
+
+                in_write_files = False
+                pending_write = None
+
+            started = event_starts.pop(event_name, None)
+            if started is None:
+                continue
+
+            stage, _, sub_event_name = event_name.partition("/")
+
+            if not sub_event_name:
+                category = BootDurationCategoryEnum.STAGE
+            elif sub_event_name.startswith(_MODULE_EVENT_PREFIX) and "/" not in sub_event_name:
+                category = BootDurationCategoryEnum.MODULE
+                event_name = f"{stage}/{sub_event_name[len(_MODULE_EVENT_PREFIX):]}"
+            else:
+                category = BootDurationCategoryEnum.EVENT
+
+            durations.append((category.value, event_name, (timestamp - started).total_seconds()))
+            continue
+
+        if in_write_files:
+
+            writing_to_match = _WRITING_TO_REGEX.match(message)
+
+            if writing_to_match is not None:
+
+                timestamp = _parse_timestamp(line_match["timestamp"])
+
+                # the chmod and chown after a write are part of it, so a file is done once the next one starts
+                if pending_write is not None:
+                    durations.append((BootDurationCategoryEnum.WRITE_FILE.value, pending_write[0], (timestamp - pending_write[1]).total_seconds()))
+
+                pending_write = (writing_to_match["path"], timestamp)
+
+    return durations
+
+
+def _parse_cloud_init_output_log(lines:typing.Iterable[str]) -> list:
+    '''
+    get how long cloud-init took from boot until it finished, and how long each of the
+    bootstrap runner's commands took, out of cloud-init-output.log
+
+    @param lines - the lines of the log
+    @return a list of (category, name, seconds) tuples for the last boot in the log
+    '''
+
+    durations = []
+
+    for iter_line in lines:
+
+        if iter_line.startswith("[bootstrap] "):
+
+            command_match = _BOOTSTRAP_COMMAND_REGEX.match(iter_line)
+            if command_match is not None:
+                durations.append((BootDurationCategoryEnum.BOOTSTRAP_COMMAND.value, command_match["name"], float(command_match["seconds"])))
+                continue
+
+            finished_match = _BOOTSTRAP_FINISHED_REGEX.match(iter_line)
+            if finished_match is not None:
+                durations.append((BootDurationCategoryEnum.BOOTSTRAP_TOTAL.value, "bootstrap", float(finished_match["seconds"])))
+
+            continue
+
+        if "Cloud-init v. " not in iter_line:
+            continue
+
+        if _BOOT_START_REGEX.search(iter_line):
+            durations = []
+            continue
+
+        finished_match = _FINISHED_REGEX.search(iter_line)
+        if finished_match is not None:
+            durations.append((BootDurationCategoryEnum.TIME_TO_READY.value, "cloud-init", float(finished_match["uptime"])))
+
+    return durations
+
+
+def _parse_result_json(file_obj) -> list:
+
+    result = json.load(file_obj)
+
+    return [str(iter_error) for iter_error in result.get("v1", dict()).get("errors", [])]
+
+
+def _iter_text_lines(binary_file_obj) -> typing.Iterator[str]:
+
+    # not a TextIOWrapper, since that wants to know if it can seek, which the members of a
+    # tar file being streamed can't answer. Logs get cut off and mangled, that shouldn't
+    # stop the rest of them being read
+    for iter_line in binary_file_obj:
+        yield iter_line.decode("utf-8", errors="replace")
+
+
+_FILE_PARSERS = {
+    constants.ANALYZE_BOOT_CLOUD_INIT_LOG_FILE_NAME: lambda file_obj: _parse_cloud_init_log(_iter_text_lines(file_obj)),
+    constants.ANALYZE_BOOT_CLOUD_INIT_OUTPUT_LOG_FILE_NAME: lambda file_obj: _parse_cloud_init_output_log(_iter_text_lines(file_obj)),
+    constants.ANALYZE_BOOT_RESULT_JSON_FILE_NAME: _parse_result_json,
+}
+
+
+def get_bundle_hostname(bundle_path:pathlib.Path) -> str:
+    '''
+    @return the hostname for a bundle, its name without the tar extension
+    '''
+
+    for iter_suffix in constants.ANALYZE_BOOT_BUNDLE_TAR_SUFFIXES:
+        if bundle_path.name.endswith(iter_suffix):
+            return bundle_path.name[:-len(iter_suffix)]
+
+    return bundle_path.name
+
+
+def get_bundle_paths(bundles_dir:pathlib.Path) -> list:
+    '''
+    @return the log bundles in a folder, each one is either a folder or a tar file of the
+    logs from one host
+    '''
+
+    return sorted(iter_path for iter_path in bundles_dir.iterdir()
+        if iter_path.is_dir() or iter_path.name.endswith(constants.ANALYZE_BOOT_BUNDLE_TAR_SUFFIXES))
+
+
+def _iter_bundle_files(bundle_path:pathlib.Path) -> typing.Iterator[typing.Tuple[str, typing.BinaryIO]]:
+    '''
+    @return an iterator of (file name, binary file object) for the files in a bundle that
+    we know how to parse, gzipped files are decompressed as they are read
+    '''
+
+    if bundle_path.is_dir():
+
+        for iter_file_name in _FILE_PARSERS:
+
+            for iter_path, iter_opener in ((bundle_path / iter_file_name, open), (bundle_path / f"{iter_file_name}.gz", gzip.open)):
+                if iter_path.exists():
+                    with iter_opener(iter_path, "rb") as f:
+                        yield iter_file_name, f
+                    break
+
+        return
+
+    # read the tar file front to back without seeking, so it works on compressed ones too
+    with tarfile.open(bundle_path, "r|*") as tar_file:
+
+        for iter_member in tar_file:
+
+            if not iter_member.isfile():
+                continue
+
+            member_name = pathlib.PurePosixPath(iter_member.name).name
+            is_gzipped = member_name.endswith(".gz")
+            if is_gzipped:
+                member_name = member_name[:-len(".gz")]
+
+            if member_name not in _FILE_PARSERS:
+                continue
+
+            member_file = tar_file.extractfile(iter_member)
+            yield member_name, gzip.GzipFile(fileobj=member_file) if is_gzipped else member_file
+
+
+def analyze_bundle(bundle_path:pathlib.Path) -> BootReport:
+    '''
+    read the logs of one host, this runs in a worker process, so it is a module level
+    function so it can be pickled
+
+    @param bundle_path - a folder or tar file with the cloud-init logs and result.json of a host
+    @return the BootReport
+    '''
+
+    hostname = get_bundle_hostname(bundle_path)
+
+    durations = []
+    errors = []
+    problems = []
+    found_file_names = set()
+
+    try:
+        for iter_file_name, iter_file_obj in _iter_bundle_files(bundle_path):
+
+            found_file_names.add(iter_file_name)
+
+            try:
+                parsed = _FILE_PARSERS[iter_file_name](iter_file_obj)
+            except Exception as e:
+                problems.append(f"failed to parse `{iter_file_name}`: `{e}`")
+                continue
+
+            if iter_file_name == constants.ANALYZE_BOOT_RESULT_JSON_FILE_NAME:
+                errors.extend(parsed)
+            else:
+                durations.extend(parsed)
+
+    except Exception as e:
+        problems.append(f"failed to read the bundle: `{e}`")
+
+    for iter_file_name in _FILE_PARSERS:
+        if iter_file_name not in found_file_names:
+            problems.append(f"`{iter_file_name}` is missing")
+
+    return BootReport(hostname=hostname, durations=durations, errors=errors, problems=problems)
+
+
+def _percentile(sorted_values:typing.Sequence[float], percent:float) -> float:
+
+    # linear interpolation between the closest ranks, like numpy's default
+    position = (len(sorted_values) - 1) * percent / 100
+    lower_index = int(position)
+    upper_index = min(lower_index + 1, len(sorted_values) - 1)
+
+    return sorted_values[lower_index] + (sorted_values[upper_index] - sorted_values[lower_index]) * (position - lower_index)
+
+
+def get_config_labels(config) -> typing.Mapping[typing.Tuple[str, str], str]:
+    '''
+    work out which part of the config each duration came from
+
+    @param config - the ConfigFileSettings the hosts were built from
+    @return a dict of (category, name) -> a description of where it is in the config, for
+    the durations that can be tied back to it. Module names don't include the stage, see
+    BootDurationStats.build_rows()
+    '''
+
+    # imported here since it is only needed to label the commands
+    from cloud_init_utils.bootstrap_script import get_command_names
+
+    cloud_init_settings = config.cloud_init_settings
+    bootstrap_script_settings = config.bootstrap_script_settings
+
+    config_labels = {
+        (BootDurationCategoryEnum.MODULE.value, "package_update_upgrade_install"):
+            f"packages_to_install ({len(cloud_init_settings.packages_to_install)} packages)",
+        (BootDurationCategoryEnum.MODULE.value, "write_files"):
+            f"files_to_write ({len(cloud_init_settings.files_to_write)} files)",
+        (BootDurationCategoryEnum.BOOTSTRAP_TOTAL.value, "bootstrap"):
+            f"commands_to_run ({len(bootstrap_script_settings.commands_to_run)} commands)",
+    }
+
+    for iter_index, iter_file in enumerate(cloud_init_settings.files_to_write):
+        config_labels[(BootDurationCategoryEnum.WRITE_FILE.value, iter_file.file_path)] = f"files_to_write[{iter_index}]"
+
+    for iter_index, iter_name in enumerate(get_command_names(bootstrap_script_settings)):
+        config_labels[(BootDurationCategoryEnum.BOOTSTRAP_COMMAND.value, iter_name)] = f"commands_to_run[{iter_index}]"
+
+    return config_labels
+
+
+class BootDurationStats:
+    '''
+    collects the durations from every host's BootReport as they come in, and works out
+    the percentiles of each
+    '''
+
+    def __init__(self):
+
+        self.host_count = 0
+        self.hosts_with_errors = dict()
+        self.hosts_with_problems = dict()
+
+        self._durations = collections.defaultdict(list)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(host_count={self.host_count!r})"
+
+    def add(self, boot_report:BootReport):
+
+        self.host_count += 1
+
+        if boot_report.errors:
+            self.hosts_with_errors[boot_report.hostname] = list(boot_report.errors)
+        if boot_report.problems:
+            self.hosts_with_problems[boot_report.hostname] = list(boot_report.problems)
+
+        for iter_category, iter_name, iter_seconds in boot_report.durations:
+            self._durations[(iter_category, iter_name)].append(iter_seconds)
+
+    def build_rows(self, config_labels:typing.Optional[typing.Mapping[typing.Tuple[str, str], str]]=None) -> list:
+        '''
+        @param config_labels - the dict from get_config_labels(), if there is a config
+        @return a dict for every (category, name), slowest p90 first
+        '''
+
+        config_labels = config_labels or dict()
+        rows = []
+
+        for (iter_category, iter_name), iter_seconds_list in self._durations.items():
+
+            sorted_seconds = sorted(iter_seconds_list)
+
+            # modules are labeled without their stage, since it's the same module whichever stage it ran in
+            label_name = iter_name.partition("/")[2] if iter_category == BootDurationCategoryEnum.MODULE.value else iter_name
+
+            row = {
+                "category": iter_category,
+                "name": iter_name,
+                "config": config_labels.get((iter_category, label_name)),
+                "count": len(sorted_seconds),
+                "mean": sum(sorted_seconds) / len(sorted_seconds),
+                "max": sorted_seconds[-1],
+            }
+
+            for iter_percent in constants.ANALYZE_BOOT_PERCENTILES:
+                row[f"p{iter_percent}"] = _percentile(sorted_seconds, iter_percent)
+
+            rows.append(row)
+
+        rows.sort(key=lambda x: (x[f"p{constants.ANALYZE_BOOT_PERCENTILES[1]}"], x["max"]), reverse=True)
+
+        return rows
+
+
+def format_rows_table(rows:typing.Sequence[dict]) -> str:
+    '''
+    @return a table of the rows from BootDurationStats.build_rows()
+    '''
+
+    percentile_headers = "".join(f" {f'p{iter_percent}':>9}" for iter_percent in constants.ANALYZE_BOOT_PERCENTILES)
+    lines = [f"{'category':<18} {'count':>6}{percentile_headers} {'max':>9}  {'name':<48} config"]
+
+    for iter_row in rows:
+
+        percentile_values = "".join(f" {iter_row[f'p{iter_percent}']:>9.2f}" for iter_percent in constants.ANALYZE_BOOT_PERCENTILES)
+        lines.append(f"{iter_row['category']:<18} {iter_row['count']:>6}{percentile_values} {iter_row['max']:>9.2f}  "
+            f"{iter_row['name']:<48} {iter_row['config'] or '-'}")
+
+    return "\n".join(lines)
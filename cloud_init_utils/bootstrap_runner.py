@@ -0,0 +1,227 @@
+# the bootstrap runner that `create_bootstrap` (and the MIME multipart output) emits
+#
+# this runs on the instance rather than where cloud_init_utils is run, so it can only use the
+# standard library. bootstrap_script.render_bootstrap_runner() copies the source of this module
+# into the script it renders, followed by a call to main() with the plan for the config
+#
+# that footer uses `json` and `sys`, so they are imported here even though nothing above it uses them
+
+import base64
+import concurrent.futures
+import gzip
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+
+
+_print_lock = threading.Lock()
+
+
+def _log(message):
+
+    with _print_lock:
+        print(f"[bootstrap] {message}", flush=True)
+
+
+def _download_and_extract_zip(plan):
+    '''
+    download the zip and extract it into root_folder, this only happens once, running
+    the script again skips it
+    '''
+
+    root_folder = plan["root_folder"]
+    marker_path = os.path.join(root_folder, plan["extracted_marker_file_name"])
+
+    if os.path.exists(marker_path):
+        _log(f"`{plan['zip_url']}` was already extracted to `{root_folder}`, skipping it")
+        return
+
+    zip_path = os.path.join(root_folder, plan["zip_file_name"])
+    partial_zip_path = f"{zip_path}.partial"
+
+    _log(f"downloading `{plan['zip_url']}` to `{zip_path}`")
+
+    for iter_attempt in range(plan["download_attempts"]):
+
+        try:
+            with urllib.request.urlopen(plan["zip_url"], timeout=60) as response, open(partial_zip_path, "wb") as f:
+                shutil.copyfileobj(response, f, 1024 * 1024)
+            break
+
+        # a connection that drops part way through raises http.client.IncompleteRead, which isn't an OSError
+        except (OSError, http.client.HTTPException) as e:
+
+            if iter_attempt == plan["download_attempts"] - 1:
+                raise
+
+            _log(f"downloading `{plan['zip_url']}` failed, trying again: `{e}`")
+            time.sleep(2 ** iter_attempt)
+
+    os.replace(partial_zip_path, zip_path)
+
+    with zipfile.ZipFile(zip_path) as zip_file:
+        zip_file.extractall(root_folder)
+
+        # extractall() doesn't keep the permissions, so scripts in the zip wouldn't be executable
+        for iter_info in zip_file.infolist():
+            mode = (iter_info.external_attr >> 16) & 0o777
+            if mode:
+                os.chmod(os.path.join(root_folder, iter_info.filename), mode)
+
+    open(marker_path, "w").close()
+
+
+def _write_file(file_entry):
+
+    file_path = file_entry["path"]
+    content_bytes = gzip.decompress(base64.b64decode(file_entry["content"]))
+
+    parent_folder = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(parent_folder, exist_ok=True)
+
+    # write to a temp file and rename it, so a command never sees half of a file
+    fd, temp_path = tempfile.mkstemp(dir=parent_folder, prefix=".bootstrap.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content_bytes)
+
+        shutil.chown(temp_path, file_entry["owner_username"], file_entry["owner_group"])
+        os.chmod(temp_path, int(file_entry["permission_octal"], 8))
+        os.replace(temp_path, file_path)
+
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    _log(f"wrote `{file_path}`")
+
+
+def _run_command(command_entry, working_folder):
+    '''
+    run a single command, with its output prefixed by its name so the output of commands
+    that run at the same time can be told apart
+
+    @return True if it exited with one of its acceptable status codes
+    '''
+
+    name = command_entry["name"]
+    started = time.monotonic()
+
+    _log(f"`{name}`: running `{command_entry['command_line']}`")
+
+    process = subprocess.Popen(command_entry["command_line"], cwd=working_folder,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+
+    for iter_line in process.stdout:
+        with _print_lock:
+            print(f"[{name}] {iter_line.decode('utf-8', errors='replace').rstrip()}", flush=True)
+
+    status_code = process.wait()
+    elapsed = time.monotonic() - started
+
+    if status_code not in command_entry["acceptable_status_codes"]:
+        _log(f"`{name}`: exited with `{status_code}` after `{elapsed:.1f}` seconds, "
+            f"which isn't one of `{command_entry['acceptable_status_codes']}`")
+        return False
+
+    _log(f"`{name}`: exited with `{status_code}` after `{elapsed:.1f}` seconds")
+    return True
+
+
+def _run_commands(commands, working_folder, max_parallel_commands):
+    '''
+    run the commands as soon as everything they depend on has finished, up to
+    `max_parallel_commands` at a time. After a command fails nothing new is started,
+    but the ones already running are waited for
+
+    @return True if every command succeeded
+    '''
+
+    remaining_dependencies = {iter_command["name"]: set(iter_command["depends_on"]) for iter_command in commands}
+    dependents = {iter_command["name"]: [] for iter_command in commands}
+    commands_by_name = {iter_command["name"]: iter_command for iter_command in commands}
+
+    for iter_command in commands:
+        for iter_dependency in iter_command["depends_on"]:
+            dependents[iter_dependency].append(iter_command["name"])
+
+    failed_names = []
+    finished_count = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_commands) as executor:
+
+        future_to_name = dict()
+
+        def _submit_ready():
+
+            for iter_name, iter_remaining in list(remaining_dependencies.items()):
+                if not iter_remaining:
+                    del remaining_dependencies[iter_name]
+                    future_to_name[executor.submit(_run_command, commands_by_name[iter_name], working_folder)] = iter_name
+
+        _submit_ready()
+
+        while future_to_name:
+
+            done_futures, _ = concurrent.futures.wait(future_to_name, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for iter_future in done_futures:
+
+                name = future_to_name.pop(iter_future)
+                finished_count += 1
+
+                try:
+                    succeeded = iter_future.result()
+                except Exception as e:
+                    _log(f"`{name}`: failed to run: `{e}`")
+                    succeeded = False
+
+                if not succeeded:
+                    failed_names.append(name)
+                    continue
+
+                for iter_dependent in dependents[name]:
+                    remaining_dependencies[iter_dependent].discard(name)
+
+            if not failed_names:
+                _submit_ready()
+
+    if failed_names:
+        _log(f"`{len(failed_names)}` command(s) failed: `{failed_names}`, "
+            f"`{len(commands) - finished_count}` command(s) were not run")
+        return False
+
+    return True
+
+
+def main(plan):
+    '''
+    @param plan - the dict that bootstrap_script.get_bootstrap_plan() creates
+    @return the exit code for the script
+    '''
+
+    started = time.monotonic()
+
+    os.makedirs(plan["root_folder"], exist_ok=True)
+
+    _download_and_extract_zip(plan)
+
+    for iter_file_entry in plan["files_to_write"]:
+        _write_file(iter_file_entry)
+
+    working_folder = os.path.join(plan["root_folder"], plan["zip_root_folder"])
+
+    succeeded = _run_commands(plan["commands_to_run"], working_folder, plan["max_parallel_commands"])
+
+    _log(f"{'finished' if succeeded else 'failed'} after `{time.monotonic() - started:.1f}` seconds")
+
+    return 0 if succeeded else 1
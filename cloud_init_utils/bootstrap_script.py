@@ -0,0 +1,158 @@
+import base64
+import json
+import inspect
+import logging
+
+from cloud_init_utils import constants
+from cloud_init_utils import bootstrap_runner
+from cloud_init_utils.model import BootstrapScriptSettings, gzip_compress
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_command_names_and_dependencies(bootstrap_script_settings:BootstrapScriptSettings) -> list:
+    '''
+    work out the name and dependencies of each of the commands_to_run, and make sure they
+    can actually all be run
+
+    @param bootstrap_script_settings - the BootstrapScriptSettings
+    @return a list of (name, list of the names it depends on) tuples, in the same order as commands_to_run
+    '''
+
+    names_and_dependencies = []
+    previous_name = None
+
+    for iter_index, iter_command in enumerate(bootstrap_script_settings.commands_to_run):
+
+        name = iter_command.name if iter_command.name is not None else f"{constants.BOOTSTRAP_RUNNER_DEFAULT_COMMAND_NAME_PREFIX}{iter_index}"
+
+        if iter_command.depends_on is not None:
+            depends_on = list(iter_command.depends_on)
+        else:
+            # without depends_on a command waits for the one before it, like it always has
+            depends_on = [previous_name] if previous_name is not None else []
+
+        names_and_dependencies.append((name, depends_on))
+        previous_name = name
+
+    all_names = [iter_name for iter_name, _ in names_and_dependencies]
+
+    duplicate_names = sorted(set(iter_name for iter_name in all_names if all_names.count(iter_name) > 1))
+    if duplicate_names:
+        raise Exception(f"More than one of the commands_to_run is named `{duplicate_names}`")
+
+    for iter_name, iter_depends_on in names_and_dependencies:
+        unknown_names = [iter_dependency for iter_dependency in iter_depends_on if iter_dependency not in all_names]
+        if unknown_names:
+            raise Exception(f"The command `{iter_name}` depends on `{unknown_names}`, which aren't in commands_to_run")
+
+    # take away the commands that have nothing left to wait for until there is nothing left,
+    # if something is left over, those commands wait on each other forever
+    remaining = {iter_name: set(iter_depends_on) for iter_name, iter_depends_on in names_and_dependencies}
+
+    while remaining:
+
+        ready_names = [iter_name for iter_name, iter_depends_on in remaining.items() if not iter_depends_on]
+
+        if not ready_names:
+            raise Exception(f"The depends_on of the commands `{sorted(remaining)}` form a cycle")
+
+        for iter_name in ready_names:
+            del remaining[iter_name]
+        for iter_depends_on in remaining.values():
+            iter_depends_on.difference_update(ready_names)
+
+    return names_and_dependencies
+
+
+def get_command_names(bootstrap_script_settings:BootstrapScriptSettings) -> list:
+    '''
+    @param bootstrap_script_settings - the BootstrapScriptSettings
+    @return the name the bootstrap runner uses for each of the commands_to_run, in order
+    '''
+
+    return [iter_name for iter_name, _ in _get_command_names_and_dependencies(bootstrap_script_settings)]
+
+
+def get_bootstrap_plan(bootstrap_script_settings:BootstrapScriptSettings, template_cache=None, template_variables=None) -> dict:
+    '''
+    turn the bootstrap settings into the plan that bootstrap_runner.main() runs
+
+    @param bootstrap_script_settings - the BootstrapScriptSettings
+    @param template_cache - an optional MustacheTemplateCache, see FileToWrite.get_raw_content_bytes()
+    @param template_variables - the context to render any mustache templates with
+    @return a dict that can be serialized as JSON
+    '''
+
+    files_to_write = []
+
+    for iter_file in bootstrap_script_settings.files_to_write:
+
+        raw_content_bytes = iter_file.get_raw_content_bytes(template_cache, template_variables)
+
+        files_to_write.append({
+            "path": str(iter_file.file_path),
+            "owner_username": iter_file.owner_username,
+            "owner_group": iter_file.owner_group,
+            "permission_octal": iter_file.permission_octal,
+            "content": base64.b64encode(gzip_compress(raw_content_bytes, constants.GZIP_COMPRESSION_LEVEL)).decode("ascii"),
+        })
+
+    commands_to_run = []
+
+    names_and_dependencies = _get_command_names_and_dependencies(bootstrap_script_settings)
+
+    for iter_command, (iter_name, iter_depends_on) in zip(bootstrap_script_settings.commands_to_run, names_and_dependencies):
+
+        commands_to_run.append({
+            "name": iter_name,
+            "command_line": [str(iter_argument) for iter_argument in iter_command.command_line],
+            "acceptable_status_codes": [int(iter_code) for iter_code in iter_command.acceptable_status_codes],
+            "depends_on": iter_depends_on,
+        })
+
+    return {
+        "root_folder": str(bootstrap_script_settings.root_folder),
+        "zip_url": bootstrap_script_settings.zip_url,
+        "zip_root_folder": bootstrap_script_settings.zip_root_folder,
+        "zip_file_name": constants.BOOTSTRAP_SCRIPT_ZIP_FILE_NAME,
+        "extracted_marker_file_name": constants.BOOTSTRAP_RUNNER_EXTRACTED_MARKER_FILE_NAME,
+        "download_attempts": constants.BOOTSTRAP_RUNNER_DOWNLOAD_ATTEMPTS,
+        "max_parallel_commands": bootstrap_script_settings.max_parallel_commands,
+        "files_to_write": files_to_write,
+        "commands_to_run": commands_to_run,
+    }
+
+
+def render_bootstrap_runner(bootstrap_script_settings:BootstrapScriptSettings, template_cache=None, template_variables=None) -> str:
+    '''
+    render the bootstrap settings as a self contained python 3 script, that downloads and
+    extracts the zip into `root_folder` once, writes out the files_to_write, then runs the
+    commands_to_run from `zip_root_folder`, running the ones whose depends_on allow it at
+    the same time
+
+    cloud-init runs it as a `text/x-shellscript` part by its `#!` line
+
+    @param bootstrap_script_settings - the BootstrapScriptSettings to render
+    @param template_cache - an optional MustacheTemplateCache, see FileToWrite.get_raw_content_bytes()
+    @param template_variables - the context to render any mustache templates with
+    @return the text of the script
+    '''
+
+    plan = get_bootstrap_plan(bootstrap_script_settings, template_cache, template_variables)
+
+    logger.debug("bootstrap plan commands: `%s`", plan["commands_to_run"])
+
+    runner_source = inspect.getsource(bootstrap_runner)
+
+    return "".join([
+        "#!/usr/bin/env python3\n",
+        "# generated by cloud_init_utils\n",
+        runner_source,
+        "\n\n",
+        f"_PLAN = json.loads({json.dumps(plan, sort_keys=True)!r})\n",
+        "\n",
+        "if __name__ == \"__main__\":\n",
+        "    sys.exit(main(_PLAN))\n",
+    ])
@@ -0,0 +1,230 @@
+import os
+import pathlib
+import hashlib
+import logging
+import tempfile
+import threading
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompressionCache:
+    '''
+    a content addressed on disk cache of compressed payloads
+
+    entries are keyed by the sha256 of the compression settings plus the raw
+    bytes, so the same payload with the same settings is only ever compressed once,
+    across runs and across the worker processes of a fleet render
+
+    the size of the cache is bounded, when it goes over `max_size_bytes` the least
+    recently used entries (by mtime, which we bump on every hit) are evicted
+    '''
+
+    def __init__(self, cache_dir:pathlib.Path, max_size_bytes:int):
+
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # lazily computed the first time we store something, since a run that
+        # only has cache hits never needs to know
+        self._current_size_bytes = None
+
+        # the files are safe to share between threads (and processes) already, this is
+        # for the counters and the size
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(cache_dir={self.cache_dir!r}, max_size_bytes={self.max_size_bytes!r})"
+
+    def __getstate__(self):
+
+        # a copy is sent with every host of a fleet render, so work out the size here once rather
+        # than having every copy scan the whole cache on its first store
+        with self._lock:
+            if self._current_size_bytes is None:
+                self._current_size_bytes = self._get_size_on_disk()
+
+        # locks can't be pickled
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_cache_key(raw_content_bytes:bytes, compression_settings:str) -> str:
+        '''
+        get the cache key for the given payload and compression settings
+
+        @param raw_content_bytes - the uncompressed payload
+        @param compression_settings - a string that uniquely describes how the payload
+        is compressed, eg `gzip:level=9:mtime=0`
+        @return the hex digest to use as the key
+        '''
+
+        hasher = hashlib.sha256()
+        hasher.update(compression_settings.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(raw_content_bytes)
+
+        return hasher.hexdigest()
+
+    def _get_entry_path(self, cache_key:str) -> pathlib.Path:
+
+        # shard by the first two characters so we don't end up with a single huge folder
+        return self.cache_dir / cache_key[:2] / cache_key
+
+    def _iter_entries(self) -> typing.Iterator[os.DirEntry]:
+
+        if not self.cache_dir.is_dir():
+            return
+
+        with os.scandir(self.cache_dir) as shard_iterator:
+            for iter_shard in shard_iterator:
+
+                if not iter_shard.is_dir():
+                    continue
+
+                with os.scandir(iter_shard.path) as entry_iterator:
+                    for iter_entry in entry_iterator:
+
+                        # skip any half written temporary files
+                        if iter_entry.is_file() and not iter_entry.name.startswith("."):
+                            yield iter_entry
+
+    def _get_size_on_disk(self) -> int:
+
+        size_bytes = 0
+
+        for iter_entry in self._iter_entries():
+            try:
+                size_bytes += iter_entry.stat().st_size
+            except FileNotFoundError:
+                # another process evicted it already
+                continue
+
+        return size_bytes
+
+    def get_or_compress(self, raw_content_bytes:bytes, compression_settings:str,
+        compress_func:typing.Callable[[bytes], bytes]) -> bytes:
+        '''
+        return the compressed bytes for the payload, either from the cache or by
+        calling `compress_func` and storing the result
+
+        @param raw_content_bytes - the uncompressed payload
+        @param compression_settings - a string that uniquely describes what `compress_func` does
+        @param compress_func - called with the raw bytes on a cache miss, returns the compressed bytes
+        @return the compressed bytes
+        '''
+
+        cache_key = CompressionCache.get_cache_key(raw_content_bytes, compression_settings)
+        entry_path = self._get_entry_path(cache_key)
+
+        try:
+            compressed_content_bytes = entry_path.read_bytes()
+        except FileNotFoundError:
+            compressed_content_bytes = None
+
+        if compressed_content_bytes is not None:
+
+            # bump the mtime so eviction treats this as recently used
+            try:
+                os.utime(entry_path)
+            except OSError as e:
+                # we already have the bytes, so this is still a hit, the entry just might be evicted sooner
+                logger.warning("failed to update the mtime of `%s` in the compression cache: `%s`", entry_path, e)
+
+            with self._lock:
+                self.hits += 1
+
+            logger.debug("compression cache hit for `%s`", cache_key)
+            return compressed_content_bytes
+
+        with self._lock:
+            self.misses += 1
+
+        logger.debug("compression cache miss for `%s`", cache_key)
+
+        compressed_content_bytes = compress_func(raw_content_bytes)
+
+        try:
+            self._store(entry_path, compressed_content_bytes)
+        except OSError as e:
+            # the cache is only an optimization, don't fail the render because of it
+            logger.warning("failed to store `%s` in the compression cache: `%s`", entry_path, e)
+
+        return compressed_content_bytes
+
+    def _store(self, entry_path:pathlib.Path, compressed_content_bytes:bytes):
+
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write to a temp file and rename it so other processes never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=entry_path.parent, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compressed_content_bytes)
+            os.replace(temp_path, entry_path)
+        except BaseException:
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+
+            if self._current_size_bytes is None:
+                self._current_size_bytes = self._get_size_on_disk()
+            else:
+                self._current_size_bytes += len(compressed_content_bytes)
+
+            if self._current_size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def evict(self):
+        '''
+        remove the least recently used entries until the cache is under its size limit
+        '''
+
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+
+        entries = []
+        for iter_entry in self._iter_entries():
+            try:
+                entry_stat = iter_entry.stat()
+            except FileNotFoundError:
+                # another process evicted it already
+                continue
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, iter_entry.path))
+
+        entries.sort()
+
+        current_size_bytes = sum(iter_size for _, iter_size, _ in entries)
+
+        for _, iter_size, iter_path in entries:
+
+            if current_size_bytes <= self.max_size_bytes:
+                break
+
+            pathlib.Path(iter_path).unlink(missing_ok=True)
+            current_size_bytes -= iter_size
+            self.evictions += 1
+
+        self._current_size_bytes = current_size_bytes
+
+    def get_stats(self) -> typing.Mapping[str, int]:
+        '''
+        @return a dict of the hit/miss/eviction counters
+        '''
+
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,297 @@
+import os
+import re
+import glob
+import time
+import pickle
+import pathlib
+import hashlib
+import logging
+import functools
+import tempfile
+import typing
+
+from cloud_init_utils import constants
+
+
+logger = logging.getLogger(__name__)
+
+# the same include syntax that pyhocon's parser accepts:
+# include "a.conf", include file("a.conf"), include required(file("a.conf")), include url(...) etc
+_HOCON_INCLUDE_REGEX = re.compile(
+    r'\binclude\s+(?:required\s*\(\s*)?(?:(url|file|package)\s*\(\s*)?"((?:[^"\\\n]|\\.)*)"', re.IGNORECASE)
+
+# `${foo}` and `${?foo}`, if `foo` isn't in the config pyhocon falls back to the environment variable
+_HOCON_SUBSTITUTION_REGEX = re.compile(r'\$\{\??\s*([^}]+?)\s*\}')
+
+
+@functools.lru_cache(maxsize=1)
+def _get_parser_digest() -> bytes:
+    '''
+    @return a hash of everything besides the config files that decides what ConfigFileSettings
+    comes out of them: the source of the modules that parse, merge and define it (the HOCON key
+    names in constants, the layer merging in utils) and the version of pyhocon
+    '''
+
+    # imported here so that the model modules aren't loaded just to compute a key
+    import importlib.metadata
+    from cloud_init_utils import model, config_schema, utils
+
+    hasher = hashlib.sha256()
+
+    for iter_module in (constants, model, config_schema, utils):
+        hasher.update(pathlib.Path(iter_module.__file__).read_bytes())
+        hasher.update(b"\0")
+
+    try:
+        hasher.update(importlib.metadata.version("pyhocon").encode("utf-8"))
+    except importlib.metadata.PackageNotFoundError:
+        hasher.update(b"<unknown pyhocon version>")
+
+    return hasher.digest()
+
+
+class ParsedConfigCache:
+    '''
+    an on disk cache of the ConfigFileSettings that parse_config() produced for a config file
+
+    the cache key is the hash of the root file and every file it (transitively) includes, plus
+    the values of any environment variables its substitutions could fall back to, plus the
+    source of the modules that parse and merge the config and define ConfigFileSettings and
+    the pyhocon version, so a hit is only ever returned when parsing would have produced the
+    same result
+    '''
+
+    def __init__(self, cache_dir:pathlib.Path):
+
+        self.cache_dir = pathlib.Path(cache_dir)
+
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(cache_dir={self.cache_dir!r})"
+
+    @staticmethod
+    def get_cache_key(root_config_path:pathlib.Path) -> typing.Optional[typing.Tuple[str, typing.Sequence[str]]]:
+        '''
+        get the cache key for a config file
+
+        @param root_config_path - the config file passed to `--config`
+        @return a tuple of the key and the list of files that went into it, or None if
+        the config can't be cached (it includes a url or a package)
+        '''
+
+        hasher = hashlib.sha256()
+        hasher.update(f"{constants.PARSED_CONFIG_CACHE_FORMAT_VERSION}\0".encode("utf-8"))
+
+        # if the models or the parsing change, the pickled settings might not match them anymore
+        hasher.update(_get_parser_digest())
+
+        root_config_path = str(pathlib.Path(root_config_path).resolve())
+        paths_to_visit = [root_config_path]
+        visited_paths = []
+        substitution_names = set()
+
+        while paths_to_visit:
+
+            current_path = paths_to_visit.pop(0)
+
+            if current_path in visited_paths:
+                continue
+            visited_paths.append(current_path)
+
+            hasher.update(f"{current_path}\0".encode("utf-8"))
+
+            try:
+                content_bytes = pathlib.Path(current_path).read_bytes()
+            except FileNotFoundError:
+                # a non required include that doesn't exist, if it shows up later the key changes
+                hasher.update(b"<missing>\0")
+                continue
+
+            hasher.update(hashlib.sha256(content_bytes).digest())
+
+            content_text = content_bytes.decode("utf-8", errors="replace")
+
+            substitution_names.update(_HOCON_SUBSTITUTION_REGEX.findall(content_text))
+
+            for iter_include_type, iter_include_value in _HOCON_INCLUDE_REGEX.findall(content_text):
+
+                iter_include_type = iter_include_type.lower()
+
+                if iter_include_type in ("url", "package") or iter_include_value.startswith(("http://", "https://", "file://")):
+                    logger.debug("`%s` includes `%s`, which can't be cached", current_path, iter_include_value)
+                    return None
+
+                include_path = os.path.join(os.path.dirname(current_path), iter_include_value)
+
+                if "*" in include_path or "?" in include_path:
+
+                    matched_paths = sorted(glob.glob(include_path, recursive=True))
+
+                    # a new file matching the glob needs to change the key too
+                    hasher.update(f"{include_path}\0{len(matched_paths)}\0".encode("utf-8"))
+                    paths_to_visit.extend(str(pathlib.Path(iter_path).resolve()) for iter_path in matched_paths)
+
+                else:
+                    paths_to_visit.append(str(pathlib.Path(include_path).resolve()))
+
+        for iter_name in sorted(substitution_names):
+            hasher.update(f"{iter_name}\0{os.environ.get(iter_name, '<unset>')}\0".encode("utf-8"))
+
+        return hasher.hexdigest(), visited_paths
+
+    @staticmethod
+    def get_layered_cache_key(config_paths:typing.Sequence[pathlib.Path],
+        list_merge_strategies:typing.Mapping[str, typing.Any]) -> typing.Optional[typing.Tuple[str, typing.Sequence[str]]]:
+        '''
+        get the cache key for the `--config` layers, merged together
+
+        @param config_paths - the config files passed to `--config`, in order
+        @param list_merge_strategies - the dict of dotted key -> ListMergeStrategyEnum they are merged with
+        @return a tuple of the key and the list of files that went into it, or None if
+        any of the layers can't be cached
+        '''
+
+        if len(config_paths) == 1:
+            return ParsedConfigCache.get_cache_key(config_paths[0])
+
+        hasher = hashlib.sha256()
+        input_paths = []
+
+        for iter_config_path in config_paths:
+
+            cache_key_and_inputs = ParsedConfigCache.get_cache_key(iter_config_path)
+            if cache_key_and_inputs is None:
+                return None
+
+            hasher.update(f"{cache_key_and_inputs[0]}\0".encode("utf-8"))
+            input_paths.extend(iter_path for iter_path in cache_key_and_inputs[1] if iter_path not in input_paths)
+
+        for iter_key, iter_strategy in sorted(list_merge_strategies.items()):
+            hasher.update(f"{iter_key}\0{iter_strategy.value}\0".encode("utf-8"))
+
+        return hasher.hexdigest(), input_paths
+
+    def _get_entry_prefix(self, config_paths:typing.Sequence[pathlib.Path]) -> str:
+
+        # entries are prefixed by the whole (ordered) list of config layers so that storing a new
+        # entry for a stack can replace the stale ones for it, but not the ones of another stack
+        # that happens to end with the same layer. A single config hashes to what it always has
+        resolved_paths = "\0".join(str(pathlib.Path(iter_path).resolve()) for iter_path in config_paths)
+        return hashlib.sha256(resolved_paths.encode("utf-8")).hexdigest()[:16]
+
+    def _get_entry_path(self, config_paths:typing.Sequence[pathlib.Path], cache_key:str) -> pathlib.Path:
+
+        return self.cache_dir / f"{self._get_entry_prefix(config_paths)}-{cache_key}{constants.PARSED_CONFIG_CACHE_FILE_EXTENSION}"
+
+    def load(self, config_paths:typing.Sequence[pathlib.Path], cache_key:str):
+        '''
+        @param config_paths - the config files passed to `--config`, in order
+        @param cache_key - the key from get_layered_cache_key()
+        @return the cached ConfigFileSettings, or None if it isn't cached
+        '''
+
+        entry_path = self._get_entry_path(config_paths, cache_key)
+
+        try:
+            with open(entry_path, "rb") as f:
+                _, config_settings = pickle.load(f)
+
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        except Exception as e:
+            # a corrupt or incompatible entry is just a miss
+            logger.warning("failed to load the cached config `%s`, ignoring it: `%s`", entry_path, e)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return config_settings
+
+    def store(self, config_paths:typing.Sequence[pathlib.Path], cache_key:str, input_paths:typing.Sequence[str], config_settings):
+        '''
+        store the ConfigFileSettings for a config, replacing any older entries for the same config layers
+
+        @param config_paths - the config files passed to `--config`, in order
+        @param cache_key - the key from get_layered_cache_key()
+        @param input_paths - the files that went into the key, from get_layered_cache_key()
+        @param config_settings - the ConfigFileSettings to store
+        '''
+
+        entry_path = self._get_entry_path(config_paths, cache_key)
+
+        metadata = {
+            "config_paths": [str(pathlib.Path(iter_path).resolve()) for iter_path in config_paths],
+            "input_paths": list(input_paths),
+            "created": time.time(),
+        }
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+            # write to a temp file and rename it so other processes never see a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((metadata, config_settings), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, entry_path)
+            except BaseException:
+                pathlib.Path(temp_path).unlink(missing_ok=True)
+                raise
+
+            for iter_stale_path in self.cache_dir.glob(f"{self._get_entry_prefix(config_paths)}-*"):
+                if iter_stale_path != entry_path:
+                    iter_stale_path.unlink(missing_ok=True)
+
+        except OSError as e:
+            # the cache is only an optimization, don't fail because of it
+            logger.warning("failed to store `%s` in the parsed config cache: `%s`", entry_path, e)
+
+    def iter_entries(self) -> typing.Iterator[typing.Tuple[pathlib.Path, typing.Optional[dict]]]:
+        '''
+        @return an iterator of (entry path, metadata dict) for every entry in the cache, the
+        metadata is None if the entry can't be read
+        '''
+
+        if not self.cache_dir.is_dir():
+            return
+
+        for iter_entry_path in sorted(self.cache_dir.glob(f"*{constants.PARSED_CONFIG_CACHE_FILE_EXTENSION}")):
+
+            try:
+                with open(iter_entry_path, "rb") as f:
+                    metadata, _ = pickle.load(f)
+            except Exception as e:
+                logger.debug("failed to read the cached config `%s`: `%s`", iter_entry_path, e)
+                metadata = None
+
+            yield iter_entry_path, metadata
+
+    def purge(self) -> int:
+        '''
+        remove every entry from the cache
+
+        @return how many entries were removed
+        '''
+
+        removed_count = 0
+
+        if not self.cache_dir.is_dir():
+            return removed_count
+
+        for iter_entry_path in self.cache_dir.iterdir():
+            if iter_entry_path.is_file():
+                iter_entry_path.unlink(missing_ok=True)
+                removed_count += 1
+
+        return removed_count
+
+    def get_stats(self) -> typing.Mapping[str, int]:
+        '''
+        @return a dict of the hit/miss counters
+        '''
+
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,290 @@
+import functools
+import typing
+
+import attr
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import HoconTypesEnum
+
+
+# marks a key that isn't in the ConfigTree
+_MISSING = object()
+
+_BOOL_CONVERSIONS = {
+    "true": True, "yes": True, "on": True,
+    "false": False, "no": False, "off": False,
+}
+
+
+# these do the same conversions as ConfigTree's get_string(), get_bool() and such, so
+# `yes`/`on` are booleans and numbers can be read as strings, but they work on a value
+# we already have rather than looking up a dotted key (which is most of the cost of those methods)
+
+def _to_string(value):
+
+    if value is None:
+        return None
+
+    if isinstance(value, bool):
+        return str(value).lower()
+
+    return str(value)
+
+def _to_int(value):
+
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        raise ValueError(f"has type `{type(value).__name__}` rather than `int`")
+
+def _to_float(value):
+
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        raise ValueError(f"has type `{type(value).__name__}` rather than `float`")
+
+def _to_bool(value):
+
+    if value is None:
+        return None
+
+    try:
+        return _BOOL_CONVERSIONS[_to_string(value).lower()]
+    except KeyError:
+        raise ValueError(f"`{value}` does not translate to a Boolean value")
+
+def _to_list(value):
+
+    if value is None or isinstance(value, list):
+        return value
+
+    raise ValueError(f"has type `{type(value).__name__}` rather than `list`")
+
+def _to_config(value):
+
+    if value is None or isinstance(value, dict):
+        return value
+
+    raise ValueError(f"has type `{type(value).__name__}` rather than `config`")
+
+def _to_any(value):
+    return value
+
+
+_HOCON_TYPE_TO_CONVERTER = {
+    HoconTypesEnum.STRING: _to_string,
+    HoconTypesEnum.INT: _to_int,
+    HoconTypesEnum.FLOAT: _to_float,
+    HoconTypesEnum.LIST: _to_list,
+    HoconTypesEnum.BOOLEAN: _to_bool,
+    HoconTypesEnum.CONFIG: _to_config,
+    HoconTypesEnum.ANY: _to_any,
+}
+
+
+class ConfigValidationException(Exception):
+    '''
+    raised when a config doesn't match the schema, it has every problem that was found
+    rather than just the first one
+    '''
+
+    def __init__(self, errors:typing.Sequence[str]):
+
+        self.errors = list(errors)
+
+        error_lines = "\n".join(f"  * {iter_error}" for iter_error in self.errors)
+        super().__init__(f"The config has `{len(self.errors)}` problem(s):\n{error_lines}")
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class _CompiledField:
+
+    attribute_name:str = attr.ib()
+    hocon_key:str = attr.ib()
+    hocon_type:HoconTypesEnum = attr.ib()
+    converter:typing.Callable = attr.ib()
+
+    # the attrs class that a CONFIG (or each item of a LIST) turns into, if any
+    hocon_model:typing.Optional[type] = attr.ib()
+
+    # fields with a default in the attrs class are optional in the config
+    required:bool = attr.ib()
+
+
+class ConfigSchema:
+    '''
+    the schema for one of the attrs classes in model.py, compiled from the
+    `hocon_field()` metadata on its fields
+
+    converting a ConfigTree reads each field straight out of the ConfigTree it lives in
+    (which is a dict), rather than having pyhocon parse and walk a dotted key every time,
+    and keeps going after a problem so that every problem in the config is reported at once
+    '''
+
+    def __init__(self, model_cls:type):
+
+        self.model_cls = model_cls
+        self.fields = []
+
+        for iter_attribute in attr.fields(model_cls):
+
+            hocon_key = iter_attribute.metadata.get(constants.ATTRS_METADATA_KEY_HOCON_KEY)
+
+            # not read from the config
+            if hocon_key is None:
+                continue
+
+            hocon_type = iter_attribute.metadata[constants.ATTRS_METADATA_KEY_HOCON_TYPE]
+
+            self.fields.append(_CompiledField(
+                attribute_name=iter_attribute.name,
+                hocon_key=hocon_key,
+                hocon_type=hocon_type,
+                converter=_HOCON_TYPE_TO_CONVERTER[hocon_type],
+                hocon_model=iter_attribute.metadata[constants.ATTRS_METADATA_KEY_HOCON_MODEL],
+                required=iter_attribute.default is attr.NOTHING))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(model_cls={self.model_cls.__name__})"
+
+    def convert(self, config_obj, key_path:str):
+        '''
+        convert the ConfigTree at `key_path` into an instance of the model class
+
+        @param config_obj - the root config object
+        @param key_path - the dotted key of the object to convert, relative to `config_obj`
+        @return an instance of the model class, or raises ConfigValidationException
+        '''
+
+        errors = []
+
+        try:
+            node_config_obj = config_obj.get_config(key_path)
+        except Exception as e:
+            raise ConfigValidationException(
+                [f"Unable to get the key `{key_path}`, using the type `{HoconTypesEnum.CONFIG}` from the config because of: `{e}`"]) from e
+
+        result = self.convert_node(node_config_obj, key_path, errors)
+
+        if errors:
+            raise ConfigValidationException(errors)
+
+        return result
+
+    def convert_node(self, node_config_obj, key_path:str, errors:list):
+        '''
+        convert a ConfigTree into an instance of the model class, appending any problems to `errors`
+
+        @param node_config_obj - the ConfigTree for this object
+        @param key_path - the full dotted key of `node_config_obj`, for error messages
+        @param errors - the list that problems get appended to
+        @return an instance of the model class, or None if there were any problems
+        '''
+
+        kwargs = dict()
+        error_count_before = len(errors)
+
+        for iter_field in self.fields:
+
+            # skip ConfigTree's own get(), that parses the key as a dotted path
+            value = dict.get(node_config_obj, iter_field.hocon_key, _MISSING)
+
+            if value is _MISSING:
+                if iter_field.required:
+                    errors.append(f"Missing the required key `{key_path}.{iter_field.hocon_key}` of type `{iter_field.hocon_type}`")
+                continue
+
+            kwargs[iter_field.attribute_name] = self.convert_field_value(iter_field, value, f"{key_path}.{iter_field.hocon_key}", errors)
+
+        if len(errors) != error_count_before:
+            return None
+
+        # the model classes check anything that involves more than one field themselves
+        try:
+            return self.model_cls(**kwargs)
+        except ValueError as e:
+            errors.append(f"`{key_path}` is invalid: {e}")
+            return None
+
+    def get_field(self, hocon_key:str) -> typing.Optional[_CompiledField]:
+        '''
+        @return the field that is read from `hocon_key`, or None if there isn't one
+        '''
+
+        for iter_field in self.fields:
+            if iter_field.hocon_key == hocon_key:
+                return iter_field
+
+        return None
+
+    def convert_field_value(self, field:_CompiledField, value, key_path:str, errors:list):
+        '''
+        convert the value of one of the fields, appending any problems to `errors`
+
+        @param field - the field, out of `fields`
+        @param value - the value out of the ConfigTree
+        @param key_path - the full dotted key of the value, for error messages
+        @param errors - the list that problems get appended to
+        @return the converted value, or None if there were any problems
+        '''
+
+        from pyhocon.config_tree import NoneValue
+
+        # pyhocon stores `null` as NoneValue, which its getters turn into None
+        if isinstance(value, NoneValue):
+            value = None
+        elif isinstance(value, list):
+            value = [None if isinstance(x, NoneValue) else x for x in value]
+
+        try:
+            value = field.converter(value)
+        except ValueError as e:
+            errors.append(
+                f"Unable to get the key `{key_path}`, using the type `{field.hocon_type}` from the config because of: `{e}`")
+            return None
+
+        if value is not None and field.hocon_model is not None:
+
+            model_schema = get_schema(field.hocon_model)
+
+            if field.hocon_type == HoconTypesEnum.LIST:
+                value = model_schema._convert_list(value, key_path, errors)
+            else:
+                value = model_schema.convert_node(value, key_path, errors)
+
+        elif value is not None and field.hocon_type == HoconTypesEnum.CONFIG:
+
+            # no model for it, so just hand back plain dicts
+            value = value.as_plain_ordered_dict()
+
+        return value
+
+    def _convert_list(self, list_value:list, key_path:str, errors:list) -> list:
+
+        result = []
+
+        for iter_index, iter_item in enumerate(list_value):
+
+            item_key_path = f"{key_path}[{iter_index}]"
+
+            # ConfigTree is a dict subclass
+            if not isinstance(iter_item, dict):
+                errors.append(f"Expected `{item_key_path}` to be an object, but it was `{type(iter_item).__name__}`")
+                continue
+
+            result.append(self.convert_node(iter_item, item_key_path, errors))
+
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema(model_cls:type) -> ConfigSchema:
+    '''
+    get the compiled schema for a model class, this is only compiled once per class
+
+    @param model_cls - one of the attrs classes from model.py
+    @return the ConfigSchema
+    '''
+
+    return ConfigSchema(model_cls)
@@ -2,6 +2,8 @@
 
 HOCON_CONFIG_KEY_TOP_LEVEL_GROUP = "cloud_init_utils"
 
+HOCON_CONFIG_KEY_TEMPLATE_VARIABLES_GROUP = "template_variables"
+
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_GROUP = "bootstrap_script_settings"
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ROOT_FOLDER = "root_folder"
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ZIP_URL = "zip_url"
@@ -10,6 +12,9 @@ HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMANDS_TO_RUN_LIST = "commands_to_r
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMAND_LINE = "command_line"
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ACCEPTABLE_STATUS_CODES_LIST = "acceptable_status_codes"
 HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_FILES_TO_WRITE_LIST = "files_to_write"
+HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMAND_NAME = "name"
+HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_DEPENDS_ON_LIST = "depends_on"
+HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_MAX_PARALLEL_COMMANDS = "max_parallel_commands"
 
 
 HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP = "cloud_init_yaml_settings"
@@ -28,5 +33,129 @@ HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PERMISSION_OCTAL = "permission_octal"
 HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_USE_MUSTACHE_TEMPLATE = "use_mustache_template"
 HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_IS_BASE64 = "payload_is_base64"
 HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_CONTENT = "payload_content"
+HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_SOURCE_PATH = "payload_source_path"
+
+
+# how the lists are combined when more than one `--config` layer is given (keys are relative to
+# the top level group), any list not in here is replaced by the later layer, like HOCON does
+CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES = {
+    f"{HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP}.{HOCON_CONFIG_KEY_CLOUD_INIT_SSH_AUTH_KEYS}": "append",
+    f"{HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP}.{HOCON_CONFIG_KEY_CLOUD_INIT_PACKAGES_TO_INSTALL_LIST}": "append",
+    f"{HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP}.{HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_LIST}": "merge_by_file_path",
+    f"{HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_GROUP}.{HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_FILES_TO_WRITE_LIST}": "merge_by_file_path",
+}
+
+
+HOCON_CONFIG_KEY_HOSTS_MANIFEST_HOSTS_LIST = "hosts"
+HOSTS_MANIFEST_KEY_HOSTNAME = "hostname"
+
+FLEET_OUTPUT_FILE_EXTENSION = ".yaml"
+
+GZIP_COMPRESSION_LEVEL = 9
+
+CACHE_ROOT_FOLDER_NAME = "cloud_init_utils"
+COMPRESSION_CACHE_FOLDER_NAME = "compression"
+PARSED_CONFIG_CACHE_FOLDER_NAME = "parsed_configs"
+PACKAGE_INDEX_CACHE_FOLDER_NAME = "package_indexes"
+COMPRESSION_CACHE_DEFAULT_MAX_SIZE_MB = 1024
+
+ATTRS_METADATA_KEY_HOCON_KEY = "hocon_key"
+ATTRS_METADATA_KEY_HOCON_TYPE = "hocon_type"
+ATTRS_METADATA_KEY_HOCON_MODEL = "hocon_model"
+
+# bump this if the format of the parsed config cache entries changes
+PARSED_CONFIG_CACHE_FORMAT_VERSION = 1
+PARSED_CONFIG_CACHE_FILE_EXTENSION = ".pickle"
+
+# how much of a payload_source_path file is read (and compressed) at a time
+PAYLOAD_SOURCE_READ_CHUNK_SIZE = 1024 * 1024
+
+# DigitalOcean (and Azure) cap user-data at 64 KiB
+USER_DATA_DEFAULT_SIZE_LIMIT_BYTES = 64 * 1024
+SIZE_OPTIMIZER_GZIP_LEVELS = (1, 6, 9)
+
+# the filenames of the parts in a MIME multipart user-data, cloud-init only uses these for logging
+MIME_MULTIPART_CLOUD_CONFIG_FILENAME = "cloud-config.yaml"
+MIME_MULTIPART_BOOTSTRAP_SCRIPT_FILENAME = "bootstrap.py"
+MIME_MULTIPART_INCLUDE_URL_FILENAME = "include.txt"
+
+BOOTSTRAP_SCRIPT_ZIP_FILE_NAME = "bootstrap.zip"
+
+# the name of the file the bootstrap runner leaves in root_folder once the zip is extracted,
+# so running it again doesn't download the zip again
+BOOTSTRAP_RUNNER_EXTRACTED_MARKER_FILE_NAME = ".bootstrap_zip_extracted"
+BOOTSTRAP_RUNNER_DEFAULT_MAX_PARALLEL_COMMANDS = 4
+BOOTSTRAP_RUNNER_DEFAULT_COMMAND_NAME_PREFIX = "command_"
+BOOTSTRAP_RUNNER_DOWNLOAD_ATTEMPTS = 5
+BOOTSTRAP_RUNNER_FILE_MODE = 0o755
+
+# how much of a payload each thread deflates at once with `--gzip-threads`, this is also
+# how much of a payload_source_path file is read at a time then
+PARALLEL_GZIP_DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+DIGITALOCEAN_API_URL = "https://api.digitalocean.com/v2/"
+DIGITALOCEAN_TOKEN_ENV_VAR = "DIGITALOCEAN_ACCESS_TOKEN"
+
+# the most droplets the API creates with one request (the `names` list)
+DIGITALOCEAN_MAX_DROPLETS_PER_CREATE_REQUEST = 10
+DIGITALOCEAN_LIST_PAGE_SIZE = 200
+DIGITALOCEAN_DROPLET_ACTIVE_STATUS = "active"
+
+DIGITALOCEAN_API_REQUEST_TIMEOUT_SECONDS = 30
+DIGITALOCEAN_API_MAX_ATTEMPTS = 6
+DIGITALOCEAN_API_BACKOFF_BASE_SECONDS = 1.0
+DIGITALOCEAN_API_BACKOFF_MAX_SECONDS = 60.0
+
+PROVISION_DEFAULT_THREADS = 4
+PROVISION_DEFAULT_POLL_INTERVAL_SECONDS = 5.0
+PROVISION_DEFAULT_TIMEOUT_SECONDS = 600.0
+
+# every droplet a `provision` run creates gets a tag of this plus a random suffix, so the
+# polling only lists that run's droplets rather than every droplet in the account
+PROVISION_RUN_TAG_PREFIX = "cloud-init-utils-provision-"
+
+# the files analyze_boot looks for in each log bundle, they can also be gzipped (with a `.gz` on the end)
+ANALYZE_BOOT_CLOUD_INIT_LOG_FILE_NAME = "cloud-init.log"
+ANALYZE_BOOT_CLOUD_INIT_OUTPUT_LOG_FILE_NAME = "cloud-init-output.log"
+ANALYZE_BOOT_RESULT_JSON_FILE_NAME = "result.json"
+ANALYZE_BOOT_BUNDLE_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz")
+ANALYZE_BOOT_PERCENTILES = (50, 90, 99)
+ANALYZE_BOOT_DEFAULT_TOP_ROWS = 30
+ANALYZE_BOOT_MAX_LOGGED_HOSTS = 20
+
+# the files cloud-init's NoCloud datasource fetches from the `seedfrom` URL, which for
+# `serve` is `http://<host>:<port>/<instance id>/`
+NOCLOUD_USER_DATA_FILE_NAME = "user-data"
+NOCLOUD_META_DATA_FILE_NAME = "meta-data"
+NOCLOUD_VENDOR_DATA_FILE_NAME = "vendor-data"
+
+# the template variable that `serve` sets to the instance id, unless the config sets it itself
+SERVE_INSTANCE_ID_TEMPLATE_VARIABLE = "instance_id"
+SERVE_DEFAULT_BIND_ADDRESS = "127.0.0.1"
+SERVE_DEFAULT_PORT = 8000
+
+# how often (at most) the files that went into an instance's responses are checked for changes
+SERVE_DEFAULT_CHECK_INTERVAL_SECONDS = 1.0
+SERVE_KEEP_ALIVE_TIMEOUT_SECONDS = 15.0
+
+# any instance id gets the base layers if it doesn't have its own config, so only this many
+# of those are kept rendered (the least recently asked for are dropped first)
+SERVE_MAX_BASE_ONLY_ENTRIES = 1024
+
+# `--watch` waits until nothing has changed for this long before rendering again, so saving
+# several files at once (or a `git checkout`) is only one render
+WATCH_DEFAULT_DEBOUNCE_SECONDS = 0.3
+
+# how often the files are checked when inotify isn't available
+WATCH_DEFAULT_POLL_INTERVAL_SECONDS = 1.0
 
+# how many characters of a base64 write_files content `verify` decodes at a time, a multiple
+# of 4 so every chunk (once the line breaks are taken out) decodes on its own
+VERIFY_BASE64_DECODE_CHUNK_SIZE = 4 * 256 * 1024
+VERIFY_MAX_LOGGED_FILES = 20
 
+# bump this if the format of the package index files changes
+PACKAGE_INDEX_FORMAT_VERSION = 1
+PACKAGE_INDEX_MAGIC = b"CIUAPTIX"
+PACKAGE_INDEX_FILE_EXTENSION = ".idx"
+PACKAGE_INDEX_MAX_SUGGESTIONS = 3
@@ -0,0 +1,231 @@
+import time
+import random
+import logging
+import threading
+import typing
+
+from cloud_init_utils import constants
+
+
+logger = logging.getLogger(__name__)
+
+
+class DigitalOceanClient:
+    '''
+    a small client for the parts of the DigitalOcean v2 API that `provision` needs
+
+    one requests.Session is shared by every thread, with a connection pool big enough
+    for all of them, so concurrent requests reuse connections rather than each one
+    doing its own TLS handshake
+
+    the `ratelimit-*` headers of every response are tracked, once the remaining requests
+    run out every thread waits for the reset rather than hammering the API, and a 429 is
+    retried after `Retry-After` (or the reset, or an exponential backoff)
+    '''
+
+    def __init__(self, token:str, api_url:str=constants.DIGITALOCEAN_API_URL, pool_size:int=constants.PROVISION_DEFAULT_THREADS,
+        max_attempts:int=constants.DIGITALOCEAN_API_MAX_ATTEMPTS):
+        '''
+        @param token - the API token
+        @param api_url - the base URL of the API, point this at a stub server for testing
+        @param pool_size - how many connections to keep open, this should be at least the number of threads using the client
+        @param max_attempts - how many times a request is tried before giving up
+        '''
+
+        # requests is only needed by this subcommand, so it isn't imported until then
+        import requests
+        import requests.adapters
+
+        self.api_url = api_url if api_url.endswith("/") else f"{api_url}/"
+        self.max_attempts = max_attempts
+
+        self._session = requests.Session()
+        self._session.headers.update({"Authorization": f"Bearer {token}", "Content-Type": "application/json"})
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_remaining = None
+        self._rate_limit_reset = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(api_url={self.api_url!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def _update_rate_limit(self, response):
+
+        remaining = response.headers.get("ratelimit-remaining")
+        reset = response.headers.get("ratelimit-reset")
+
+        if remaining is None:
+            return
+
+        with self._rate_limit_lock:
+            self._rate_limit_remaining = int(remaining)
+            self._rate_limit_reset = float(reset) if reset is not None else None
+
+    def _wait_for_rate_limit(self):
+
+        with self._rate_limit_lock:
+            remaining = self._rate_limit_remaining
+            reset = self._rate_limit_reset
+
+        if remaining is None or remaining > 0 or reset is None:
+            return
+
+        delay = min(reset - time.time(), constants.DIGITALOCEAN_API_BACKOFF_MAX_SECONDS)
+
+        if delay > 0:
+            logger.info("out of API requests until the rate limit resets, waiting `%.1f` seconds", delay)
+            time.sleep(delay)
+
+    def _get_retry_delay(self, response, attempt:int) -> float:
+
+        delay = None
+
+        if response is not None:
+
+            retry_after = response.headers.get("retry-after")
+            reset = response.headers.get("ratelimit-reset")
+
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+            elif response.status_code == 429 and reset is not None:
+                delay = float(reset) - time.time()
+
+        if delay is None:
+            # with jitter, so the threads that failed together don't all retry together
+            delay = constants.DIGITALOCEAN_API_BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+        return max(0.0, min(delay, constants.DIGITALOCEAN_API_BACKOFF_MAX_SECONDS))
+
+    @staticmethod
+    def _get_error_message(response) -> str:
+
+        try:
+            return response.json().get("message", response.text)
+        except ValueError:
+            return response.text
+
+    def request(self, method:str, path:str, json_body:typing.Optional[dict]=None, params:typing.Optional[dict]=None, idempotent:bool=True) -> dict:
+        '''
+        make an API request, retrying it if it was rate limited (or, if it is idempotent,
+        if it failed with a server or connection error)
+
+        @param method - the HTTP method
+        @param path - the path under the API URL, or a full URL like the `links` in a response
+        @param json_body - the request body
+        @param params - the query string parameters
+        @param idempotent - whether the request can be sent again when we don't know if it
+        went through, creating droplets isn't, since that could create them twice
+        @return the JSON response
+        '''
+
+        import requests
+
+        url = path if path.startswith(("http://", "https://")) else f"{self.api_url}{path}"
+        last_error = None
+
+        for iter_attempt in range(self.max_attempts):
+
+            self._wait_for_rate_limit()
+
+            response = None
+
+            try:
+                response = self._session.request(method, url, json=json_body, params=params,
+                    timeout=constants.DIGITALOCEAN_API_REQUEST_TIMEOUT_SECONDS)
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+
+                if not idempotent:
+                    raise Exception(f"`{method} {url}` failed, and it might have gone through, so it wasn't retried: `{e}`") from e
+
+                last_error = f"`{e}`"
+
+            else:
+                self._update_rate_limit(response)
+
+                if response.status_code < 400:
+                    return response.json() if response.content else dict()
+
+                last_error = f"`{response.status_code}`: `{self._get_error_message(response)}`"
+
+                # a 429 was never handled, so even a POST is safe to send again
+                retryable = response.status_code == 429 or (idempotent and response.status_code >= 500)
+
+                if not retryable:
+                    raise Exception(f"`{method} {url}` failed with {last_error}")
+
+            if iter_attempt + 1 < self.max_attempts:
+
+                delay = self._get_retry_delay(response, iter_attempt)
+                logger.warning("`%s %s` failed with %s, retrying in `%.1f` seconds", method, url, last_error, delay)
+                time.sleep(delay)
+
+        raise Exception(f"`{method} {url}` failed `{self.max_attempts}` times, the last error was {last_error}")
+
+    def create_droplets(self, names:typing.Sequence[str], region:str, size:str, image:typing.Union[str, int], user_data:str,
+        ssh_keys:typing.Sequence[typing.Union[str, int]]=(), tags:typing.Sequence[str]=()) -> typing.Sequence[dict]:
+        '''
+        create up to DIGITALOCEAN_MAX_DROPLETS_PER_CREATE_REQUEST droplets with one request
+
+        @return the droplet objects from the response
+        '''
+
+        request_body = {
+            "names": list(names),
+            "region": region,
+            "size": size,
+            "image": image,
+            "ssh_keys": list(ssh_keys),
+            "tags": list(tags),
+            "user_data": user_data,
+        }
+
+        return self.request("POST", "droplets", json_body=request_body, idempotent=False)["droplets"]
+
+    def iter_droplets(self, tag_name:typing.Optional[str]=None) -> typing.Iterator[dict]:
+        '''
+        list the droplets a page at a time
+
+        @param tag_name - only list the droplets with this tag
+        @return an iterator of droplet objects
+        '''
+
+        params = {"per_page": constants.DIGITALOCEAN_LIST_PAGE_SIZE}
+        if tag_name is not None:
+            params["tag_name"] = tag_name
+
+        next_url = "droplets"
+
+        while next_url:
+
+            page = self.request("GET", next_url, params=params)
+            yield from page.get("droplets", [])
+
+            # the next link already has the query string in it
+            next_url = page.get("links", dict()).get("pages", dict()).get("next")
+            params = None
+
+
+def get_droplet_public_ipv4(droplet:dict) -> typing.Optional[str]:
+    '''
+    @return the public IPv4 address of a droplet object, or None if it doesn't have one yet
+    '''
+
+    for iter_network in droplet.get("networks", dict()).get("v4", []):
+        if iter_network.get("type") == "public":
+            return iter_network.get("ip_address")
+
+    return None
@@ -0,0 +1,330 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import pathlib
+import logging
+import collections
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+# from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+
+# editors usually save by writing a temp file and renaming it over the old one, which
+# replaces the inode, so the folders are watched rather than the files themselves
+_INOTIFY_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+# wd, mask, cookie, len, followed by `len` bytes of the (nul padded) name
+_INOTIFY_EVENT_STRUCT = struct.Struct("iIII")
+_INOTIFY_READ_SIZE = 64 * 1024
+
+
+def get_path_signature(path:str) -> typing.Optional[typing.Tuple[int, int]]:
+    '''
+    @return the mtime and size of the file, or None if it doesn't exist
+    '''
+
+    try:
+        path_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return path_stat.st_mtime_ns, path_stat.st_size
+
+
+class _Inotify:
+    '''
+    the parts of inotify(7) we need, through ctypes since the standard library doesn't have it
+    '''
+
+    def __init__(self):
+
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only on linux")
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+
+    def add_watch(self, folder_path:str) -> int:
+
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder_path), _INOTIFY_WATCH_MASK)
+        if wd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number), folder_path)
+
+        return wd
+
+    def remove_watch(self, wd:int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> typing.Iterator[typing.Tuple[int, int, str]]:
+        '''
+        @return an iterator of (wd, mask, name) for the events that are waiting, without blocking
+        '''
+
+        while True:
+
+            try:
+                buffer = os.read(self.fd, _INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                return
+
+            offset = 0
+            while offset < len(buffer):
+
+                wd, mask, _, name_length = _INOTIFY_EVENT_STRUCT.unpack_from(buffer, offset)
+                offset += _INOTIFY_EVENT_STRUCT.size
+
+                name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b"\0"))
+                offset += name_length
+
+                yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    '''
+    waits for any of a set of files to change, with inotify where it is available and by
+    checking the mtime and size of every file every so often where it isn't
+
+    either way a file only counts as changed if its mtime or size is different from the last
+    time it was looked at, and a burst of changes (like an editor saving several files, or a
+    `git checkout`) is only reported once it has been quiet for the debounce time
+    '''
+
+    def __init__(self, debounce_seconds:float, poll_interval_seconds:float, use_inotify:bool=True):
+        '''
+        @param debounce_seconds - how long there has to be no changes before they are reported
+        @param poll_interval_seconds - how often the files are checked when inotify isn't used
+        @param use_inotify - false to always poll
+        '''
+
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self._signatures = dict()
+
+        # folder -> the names in it we care about, and inotify's wd <-> folder
+        self._names_by_folder = collections.defaultdict(set)
+        self._wd_by_folder = dict()
+        self._folder_by_wd = dict()
+
+        self._inotify = None
+
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                # AttributeError is a libc without the inotify functions
+                logger.info("can't use inotify, checking the files every `%s` seconds instead: `%s`", poll_interval_seconds, e)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(mode={self.mode!r}, paths={len(self._signatures)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    def set_paths(self, paths:typing.Iterable[str]):
+        '''
+        replace the set of files that are watched, a file that was already watched keeps the
+        signature it had so a change that happened in between isn't lost
+
+        @param paths - the (resolved) paths of the files, they don't have to exist yet
+        '''
+
+        paths = set(str(iter_path) for iter_path in paths)
+
+        self._signatures = {iter_path: self._signatures[iter_path] if iter_path in self._signatures else get_path_signature(iter_path)
+            for iter_path in paths}
+
+        self._names_by_folder.clear()
+        for iter_path in paths:
+            self._names_by_folder[os.path.dirname(iter_path)].add(os.path.basename(iter_path))
+
+        if self._inotify is None:
+            return
+
+        for iter_folder in list(self._wd_by_folder):
+            if iter_folder not in self._names_by_folder:
+                wd = self._wd_by_folder.pop(iter_folder)
+                self._folder_by_wd.pop(wd, None)
+                self._inotify.remove_watch(wd)
+
+        for iter_folder in self._names_by_folder:
+            if iter_folder in self._wd_by_folder:
+                continue
+
+            try:
+                wd = self._inotify.add_watch(iter_folder)
+            except OSError as e:
+                # a folder that doesn't exist yet, its files are still checked whenever anything else changes
+                logger.warning("can't watch the folder `%s`: `%s`", iter_folder, e)
+                continue
+
+            self._wd_by_folder[iter_folder] = wd
+            self._folder_by_wd[wd] = iter_folder
+
+    def _get_changed_paths(self) -> typing.Set[str]:
+
+        return set(iter_path for iter_path, iter_signature in self._signatures.items() if get_path_signature(iter_path) != iter_signature)
+
+    def _has_inotify_activity(self, timeout:typing.Optional[float]) -> bool:
+        '''
+        @return true if an event for a watched file came in within `timeout` seconds
+        '''
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+
+            readable, _, _ = select.select([self._inotify.fd], [], [], remaining)
+            if not readable:
+                return False
+
+            has_activity = False
+
+            for iter_wd, iter_mask, iter_name in self._inotify.read_events():
+
+                if iter_mask & _IN_Q_OVERFLOW:
+                    has_activity = True
+
+                elif iter_mask & _IN_IGNORED:
+                    # the folder itself was deleted or moved
+                    folder = self._folder_by_wd.pop(iter_wd, None)
+                    self._wd_by_folder.pop(folder, None)
+                    has_activity = True
+
+                elif iter_name in self._names_by_folder.get(self._folder_by_wd.get(iter_wd), ()):
+                    has_activity = True
+
+            # the other files in the same folders are noise
+            if has_activity:
+                return True
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def wait_for_changes(self) -> typing.Set[str]:
+        '''
+        block until at least one of the files changes and it has been quiet for the debounce time
+
+        @return the paths of the files that changed, their new signatures become the ones
+        the next call compares against
+        '''
+
+        while True:
+
+            if self._inotify is not None:
+                self._has_inotify_activity(None)
+
+                while self._has_inotify_activity(self.debounce_seconds):
+                    pass
+
+            else:
+                time.sleep(self.poll_interval_seconds)
+
+                if not self._get_changed_paths():
+                    continue
+
+                # keep looking until nothing has changed for the debounce time
+                current_signatures = {iter_path: get_path_signature(iter_path) for iter_path in self._signatures}
+
+                while True:
+                    time.sleep(self.debounce_seconds)
+
+                    new_signatures = {iter_path: get_path_signature(iter_path) for iter_path in self._signatures}
+                    if new_signatures == current_signatures:
+                        break
+
+                    current_signatures = new_signatures
+
+            changed_paths = self._get_changed_paths()
+
+            for iter_path in changed_paths:
+                self._signatures[iter_path] = get_path_signature(iter_path)
+
+            if changed_paths:
+                return changed_paths
+
+    def close(self):
+
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+class DependencyGraph:
+    '''
+    which outputs each input file goes into, so that when some files change only the
+    outputs that used them have to be rendered again
+    '''
+
+    def __init__(self):
+
+        self._outputs_by_input_path = collections.defaultdict(set)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(input_paths={len(self._outputs_by_input_path)})"
+
+    @staticmethod
+    def normalize_path(path) -> str:
+        '''
+        @return the path as an absolute string, relative paths are relative to the current
+        directory like payload_source_path is
+        '''
+
+        return str(pathlib.Path(path).expanduser().resolve())
+
+    def add(self, input_path, output_key:typing.Hashable):
+        '''
+        @param input_path - a file that goes into the output
+        @param output_key - what the output is to the caller, like a hostname
+        '''
+
+        self._outputs_by_input_path[self.normalize_path(input_path)].add(output_key)
+
+    def get_input_paths(self) -> typing.Set[str]:
+        return set(self._outputs_by_input_path)
+
+    def get_affected_outputs(self, changed_paths:typing.Iterable[str]) -> set:
+        '''
+        @param changed_paths - the normalized paths of the files that changed
+        @return the set of the output keys that used any of them
+        '''
+
+        affected_outputs = set()
+
+        for iter_path in changed_paths:
+            affected_outputs.update(self._outputs_by_input_path.get(iter_path, ()))
+
+        return affected_outputs
@@ -1,14 +1,77 @@
 import argparse
+import importlib
 import sys
 import logging
 
 
-from cloud_init_utils.modules import create_yaml
 from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import metrics
+from cloud_init_utils.model import LogFormatEnum
 
-import logging_tree
 
-def main():
+logger = logging.getLogger(__name__)
+
+# the subcommands, as the name -> the module and the class in it with create_subparser_command()
+_SUBCOMMANDS = {
+    "create_yaml": ("cloud_init_utils.modules.create_yaml", "CreateYaml"),
+    "create_yaml_fleet": ("cloud_init_utils.modules.create_yaml_fleet", "CreateYamlFleet"),
+    "validate_configs": ("cloud_init_utils.modules.validate_configs", "ValidateConfigs"),
+    "config_cache": ("cloud_init_utils.modules.config_cache", "ConfigCache"),
+    "create_bootstrap": ("cloud_init_utils.modules.create_bootstrap", "CreateBootstrap"),
+    "provision": ("cloud_init_utils.modules.provision", "Provision"),
+    "analyze_boot": ("cloud_init_utils.modules.analyze_boot", "AnalyzeBoot"),
+    "serve": ("cloud_init_utils.modules.serve", "Serve"),
+    "verify": ("cloud_init_utils.modules.verify", "Verify"),
+}
+
+
+class _LazySubParsersAction(argparse._SubParsersAction):
+    '''
+    a subparsers action that only imports a subcommand's module (and adds its arguments)
+    when that subcommand is the one on the command line, so `--help` and every other
+    subcommand don't pay for whatever it imports
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._pending_subcommands = dict()
+
+    def add_lazy_parser(self, name:str, module_name:str, class_name:str):
+        '''
+        @param name - the subcommand
+        @param module_name - the module to import when it is used
+        @param class_name - the class in the module with the create_subparser_command() staticmethod
+        '''
+
+        self._pending_subcommands[name] = (module_name, class_name)
+
+        # a placeholder so the subcommand is one of the choices in the meantime
+        self.add_parser(name)
+
+    def load_subcommand(self, name:str):
+
+        if name not in self._pending_subcommands:
+            return
+
+        module_name, class_name = self._pending_subcommands.pop(name)
+        subcommand_class = getattr(importlib.import_module(module_name), class_name)
+
+        # create_subparser_command() calls add_parser() itself, which won't replace the placeholder
+        del self._name_parser_map[name]
+        subcommand_class.create_subparser_command(self)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+
+        self.load_subcommand(values[0])
+
+        super().__call__(parser, namespace, values, option_string)
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    '''
+    @return the ArgumentParser for cli.py, with every subcommand added to it
+    '''
 
     parser = argparse.ArgumentParser(
         description="utils for cloud init files",
@@ -18,33 +81,111 @@ def main():
     parser.add_argument("--log-to-file-path", dest="log_to_file_path", type=utils.isFileType(False), help="log to the specified file")
     parser.add_argument("--verbose", action="store_true", help="Increase logging verbosity")
     parser.add_argument("--no-stdout", dest="no_stdout", action="store_true", help="if true, will not log to stdout" )
+    parser.add_argument("--log-format", dest="log_format", default=LogFormatEnum.TEXT.value, choices=[iter_format.value for iter_format in LogFormatEnum],
+        help="log lines of text, or a JSON object per line (with the timestamp, level, logger, thread, process, message and any traceback) "
+        "for feeding into something else, this applies to stdout and --log-to-file-path")
+
+    parser.add_argument("--config", dest="config", action="append", type=utils.isFileType(strict=True),
+        help="the HOCON config file, required by every subcommand except validate_configs, config_cache, analyze_boot and serve (with --config-dir). "
+        "Can be given more than once (like a base, a role and a host config), each one is merged on top of the ones before it")
+    parser.add_argument("--list-merge", dest="list_merge_strategies", action="append", type=utils.list_merge_strategy_type,
+        metavar="KEY=STRATEGY",
+        help="how a list in a later --config is combined with the same list in the earlier ones, where KEY is the dotted key under "
+        f"`{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}` and STRATEGY is `replace`, `append` or `merge_by_file_path`. Can be given "
+        "more than once, the defaults are `{}` and every other list is replaced".format(
+            ", ".join(f"{iter_key}={iter_strategy}" for iter_key, iter_strategy in constants.CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES.items())))
+
+    parser.add_argument("--cache-dir", dest="cache_dir", type=utils.isFileType(False),
+        help="the folder to keep the compressed payload and parsed config caches in, defaults to a folder under $XDG_CACHE_HOME or ~/.cache")
+    parser.add_argument("--cache-max-size", dest="cache_max_size_mb", type=int, default=constants.COMPRESSION_CACHE_DEFAULT_MAX_SIZE_MB,
+        help="the maximum size of the compressed payload cache in MB, least recently used entries are evicted past this")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="if true, will not use the compressed payload or parsed config caches")
+
+    parser.add_argument("--profile", dest="profile", action="store_true",
+        help="log a table of how long each phase of the run took, how many bytes went in and out and the peak RSS")
+    parser.add_argument("--metrics-file", dest="metrics_file", type=utils.isFileType(False),
+        help="write the timing of each phase of the run to this file as JSON lines")
+    parser.add_argument("--cprofile-output", dest="cprofile_output", type=utils.isFileType(False),
+        help="run the subcommand under cProfile and save the stats to this file, view them with `python -m pstats`")
+
+
+    subparsers = parser.add_subparsers(help="sub-command help", action=_LazySubParsersAction)
+
+    for iter_name, (iter_module_name, iter_class_name) in _SUBCOMMANDS.items():
+        subparsers.add_lazy_parser(iter_name, iter_module_name, iter_class_name)
+
+    return parser
 
-    parser.add_argument("--config", dest="config", required=True, type=utils.hocon_config_file_type, help="the HOCON config file")
 
+def _run_subcommand(parser, parsed_args):
 
-    subparsers = parser.add_subparsers(help="sub-command help")
+    # subcommands that work without a config set `requires_config` to False, and the ones that parse
+    # the `--config` layers themselves (so the layers don't have to be a whole config on their own)
+    # set `parses_config` to True
+    config = None
+    if parsed_args.config is not None and not getattr(parsed_args, "parses_config", False):
 
-    create_yaml.CreateYaml.create_subparser_command(subparsers)
+        parsed_config_cache = utils.get_config_cache_from_args(parsed_args)
+
+        with metrics.span("load_config"):
+            config = utils.load_config_settings(parsed_args.config, parsed_config_cache, utils.get_list_merge_strategies_from_args(parsed_args))
+
+        if parsed_config_cache is not None:
+            logger.debug("parsed config cache stats: `%s`", parsed_config_cache.get_stats())
+
+    elif parsed_args.config is None and getattr(parsed_args, "requires_config", True):
+        parser.error("the `--config` argument is required for this subcommand")
+
+    with metrics.span("run_subcommand"):
+        parsed_args.func_to_run(config, parsed_args)
+
+
+def _write_metrics(metrics_recorder, parsed_args):
+
+    if parsed_args.profile:
+        logger.info("profile:\n%s", metrics_recorder.format_summary_table())
+
+    if parsed_args.metrics_file:
+        with open(parsed_args.metrics_file, "w", encoding="utf-8") as f:
+            metrics_recorder.write_json_lines(f)
+
+        logger.info("wrote the metrics for `%s` spans to `%s`", len(metrics_recorder.records), parsed_args.metrics_file)
+
+
+def main():
+
+    parser = get_argument_parser()
+    queue_listener = None
 
     try:
 
         # set up logging stuff
         logging.captureWarnings(True) # capture warnings with the logging infrastructure
         root_logger = logging.getLogger()
-        logging_formatter = utils.ArrowLoggingFormatter("%(asctime)s %(threadName)-10s %(name)-20s %(levelname)-8s: %(message)s")
 
         parsed_args = parser.parse_args()
 
+        if LogFormatEnum(parsed_args.log_format) == LogFormatEnum.JSON:
+            logging_formatter = utils.JsonLinesLoggingFormatter()
+        else:
+            logging_formatter = utils.LocalTimeLoggingFormatter("%(asctime)s %(threadName)-10s %(name)-20s %(levelname)-8s: %(message)s")
+
+        logging_handlers = []
+
         if parsed_args.log_to_file_path:
 
             file_handler = logging.FileHandler(parsed_args.log_to_file_path, encoding="utf-8")
             file_handler.setFormatter(logging_formatter)
-            root_logger.addHandler(file_handler)
+            logging_handlers.append(file_handler)
 
         if not parsed_args.no_stdout:
             logging_handler = logging.StreamHandler(sys.stdout)
             logging_handler.setFormatter(logging_formatter)
-            root_logger.addHandler(logging_handler)
+            logging_handlers.append(logging_handler)
+
+        # the handlers are run on the listener's thread, so logging doesn't hold up the rendering
+        if logging_handlers:
+            queue_listener = utils.start_logging_listener(root_logger, logging_handlers)
 
 
         # set logging level based on arguments
@@ -56,14 +197,40 @@ def main():
         root_logger.info("########### STARTING ###########")
 
         root_logger.debug("Parsed arguments: %s", parsed_args)
-        root_logger.debug("Logger hierarchy:\n%s", logging_tree.format.build_description(node=None))
 
-        config = utils.parse_config(parsed_args.config)
+        # building the logger tree description isn't free, so only do it when it will be logged
+        if root_logger.isEnabledFor(logging.DEBUG):
+            import logging_tree
+
+            root_logger.debug("Logger hierarchy:\n%s", logging_tree.format.build_description(node=None))
 
         # run the function associated with each sub command
         if "func_to_run" in parsed_args:
 
-            parsed_args.func_to_run(config, parsed_args)
+            metrics_recorder = None
+            if parsed_args.profile or parsed_args.metrics_file:
+                metrics_recorder = metrics.MetricsRecorder()
+                metrics.set_recorder(metrics_recorder)
+
+            profiler = None
+            if parsed_args.cprofile_output:
+                import cProfile
+
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+            try:
+                _run_subcommand(parser, parsed_args)
+
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    profiler.dump_stats(parsed_args.cprofile_output)
+                    root_logger.info("wrote the cProfile stats to `%s`", parsed_args.cprofile_output)
+
+                if metrics_recorder is not None:
+                    metrics.set_recorder(None)
+                    _write_metrics(metrics_recorder, parsed_args)
 
         else:
             root_logger.info("no subcommand specified!")
@@ -73,4 +240,8 @@ def main():
         root_logger.info("Done!")
     except Exception as e:
         root_logger.exception("Something went wrong!")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+    finally:
+        if queue_listener is not None:
+            queue_listener.stop()
\ No newline at end of file
@@ -0,0 +1,203 @@
+import sys
+import json
+import time
+import logging
+import threading
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+# the recorder that span() records into, None unless `--profile` or `--metrics-file` is given
+_active_recorder = None
+
+
+def _get_peak_rss_bytes() -> typing.Optional[int]:
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports it in KB, macOS in bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class _DisabledSpan:
+    '''
+    what span() hands back when nothing is being recorded, one shared object that does nothing
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def set_bytes(self, bytes_in:typing.Optional[int]=None, bytes_out:typing.Optional[int]=None):
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+class MetricsSpan:
+    '''
+    one timed phase, see span()
+    '''
+
+    def __init__(self, recorder:"MetricsRecorder", name:str, attributes:dict):
+
+        self.recorder = recorder
+        self.name = name
+        self.attributes = attributes
+
+        self.bytes_in = None
+        self.bytes_out = None
+
+        self._start = None
+        self._depth = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(name={self.name!r}, attributes={self.attributes!r})"
+
+    def __enter__(self):
+
+        self._depth = self.recorder._push()
+        self._start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        wall_seconds = time.perf_counter() - self._start
+        self.recorder._pop()
+
+        self.recorder._add_record({
+            "span": self.name,
+            "thread": threading.current_thread().name,
+            "depth": self._depth,
+            "start_s": self._start - self.recorder.start_time,
+            "wall_s": wall_seconds,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "peak_rss_bytes": _get_peak_rss_bytes(),
+            "failed": exc_type is not None,
+            **self.attributes,
+        })
+
+    def set_bytes(self, bytes_in:typing.Optional[int]=None, bytes_out:typing.Optional[int]=None):
+        '''
+        record how many bytes went into and came out of this phase
+        '''
+
+        if bytes_in is not None:
+            self.bytes_in = bytes_in
+        if bytes_out is not None:
+            self.bytes_out = bytes_out
+
+
+class MetricsRecorder:
+    '''
+    collects the spans from every thread, in the order they finished
+    '''
+
+    def __init__(self):
+
+        self.start_time = time.perf_counter()
+        self.records = []
+
+        self._lock = threading.Lock()
+        self._thread_local = threading.local()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(records={len(self.records)!r})"
+
+    def _push(self) -> int:
+
+        depth = getattr(self._thread_local, "depth", 0)
+        self._thread_local.depth = depth + 1
+
+        return depth
+
+    def _pop(self):
+        self._thread_local.depth -= 1
+
+    def _add_record(self, record:dict):
+
+        with self._lock:
+            self.records.append(record)
+
+    def write_json_lines(self, file_handle):
+        '''
+        write one JSON object per span to the file handle
+        '''
+
+        for iter_record in self.records:
+            file_handle.write(json.dumps(iter_record))
+            file_handle.write("\n")
+
+    def format_summary_table(self) -> str:
+        '''
+        @return a table with a row per span name, in the order each first finished
+        '''
+
+        summaries = dict()
+
+        for iter_record in self.records:
+
+            summary = summaries.setdefault(iter_record["span"],
+                {"count": 0, "total_s": 0.0, "max_s": 0.0, "bytes_in": 0, "bytes_out": 0, "peak_rss_bytes": 0})
+
+            summary["count"] += 1
+            summary["total_s"] += iter_record["wall_s"]
+            summary["max_s"] = max(summary["max_s"], iter_record["wall_s"])
+            summary["bytes_in"] += iter_record["bytes_in"] or 0
+            summary["bytes_out"] += iter_record["bytes_out"] or 0
+            summary["peak_rss_bytes"] = max(summary["peak_rss_bytes"], iter_record["peak_rss_bytes"] or 0)
+
+        lines = [f"{'span':<20} {'count':>7} {'total ms':>11} {'max ms':>10} {'bytes in':>12} {'bytes out':>12} {'peak RSS MB':>12}"]
+
+        for iter_name, iter_summary in summaries.items():
+            lines.append(f"{iter_name:<20} {iter_summary['count']:>7} {iter_summary['total_s'] * 1000:>11.2f} "
+                f"{iter_summary['max_s'] * 1000:>10.2f} {iter_summary['bytes_in']:>12} {iter_summary['bytes_out']:>12} "
+                f"{iter_summary['peak_rss_bytes'] / (1024 * 1024):>12.1f}")
+
+        return "\n".join(lines)
+
+
+def set_recorder(recorder:typing.Optional[MetricsRecorder]):
+    '''
+    start recording spans into `recorder`, or stop recording if it is None
+    '''
+
+    global _active_recorder
+    _active_recorder = recorder
+
+
+def get_recorder() -> typing.Optional[MetricsRecorder]:
+    return _active_recorder
+
+
+def span(name:str, **attributes):
+    '''
+    time a phase of the render, for `--profile` and `--metrics-file`
+
+        with metrics.span("yaml_emit") as metrics_span:
+            ...
+            metrics_span.set_bytes(bytes_out=...)
+
+    when nothing is being recorded this just returns a shared object whose methods do
+    nothing, so leaving the spans in costs next to nothing
+
+    @param name - the name of the phase
+    @param attributes - anything else to put in the record, like the file path
+    @return a context manager
+    '''
+
+    if _active_recorder is None:
+        return _DISABLED_SPAN
+
+    return MetricsSpan(_active_recorder, name, attributes)
@@ -2,49 +2,225 @@ import pathlib
 import typing
 import enum
 import base64
-import gzip
+import zlib
+import logging
 
 import attr
-import chevron
 
+from cloud_init_utils import constants
+from cloud_init_utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class HoconTypesEnum(enum.Enum):
+    STRING = "string"
+    INT = "int"
+    FLOAT = "float"
+    LIST = "list"
+    BOOLEAN = "boolean"
+    CONFIG = "config"
+    ANY = "any"
+
+
+def hocon_field(hocon_key:str, hocon_type:HoconTypesEnum, hocon_model=None, **kwargs):
+    '''
+    an attr.ib() that also records where and how the field is read out of the HOCON
+    config, config_schema.py compiles these into the schema that parse_config() uses
+
+    @param hocon_key - the key of this field, relative to the object it is in
+    @param hocon_type - a member of HoconTypesEnum of what type the value is
+    @param hocon_model - if the value is a CONFIG (or a LIST of them) that should become
+    another attrs class, that class
+    @param kwargs - passed on to attr.ib()
+    '''
+
+    metadata = {
+        constants.ATTRS_METADATA_KEY_HOCON_KEY: hocon_key,
+        constants.ATTRS_METADATA_KEY_HOCON_TYPE: hocon_type,
+        constants.ATTRS_METADATA_KEY_HOCON_MODEL: hocon_model,
+    }
+
+    return attr.ib(metadata=metadata, **kwargs)
+
+
+def gzip_compress(raw_content_bytes:bytes, compression_level:int, compression_cache=None, parallel_gzip=None) -> bytes:
+    '''
+    gzip the bytes the same way every time, the header has an mtime of 0 (gzip.compress()
+    uses the current time by default) and it is made by zlib directly, like
+    StreamedGzipPayload does, so it doesn't depend on what the gzip module of this
+    version of python puts in the header either
+
+    @param raw_content_bytes - the bytes to compress
+    @param compression_level - the gzip compression level
+    @param compression_cache - an optional CompressionCache, if given the result is looked
+    up there first instead of compressing it again
+    @param parallel_gzip - an optional ParallelGzipCompressor, if given anything bigger
+    than its chunk size is compressed on its thread pool instead
+    @return the gzipped bytes
+    '''
+
+    if parallel_gzip is not None and len(raw_content_bytes) > parallel_gzip.chunk_size:
+
+        if compression_cache is None:
+            return parallel_gzip.compress(raw_content_bytes, compression_level)
+
+        return compression_cache.get_or_compress(raw_content_bytes, parallel_gzip.get_compression_settings(compression_level),
+            lambda x: parallel_gzip.compress(x, compression_level))
+
+    def _compress(data:bytes) -> bytes:
+
+        # wbits of 31 makes zlib write a gzip header (with an mtime of 0) and trailer
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    if compression_cache is None:
+        return _compress(raw_content_bytes)
+
+    return compression_cache.get_or_compress(raw_content_bytes, f"gzip:level={compression_level}:mtime=0", _compress)
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class StreamedGzipPayload:
+    '''
+    the gzipped content of a file on disk, that is compressed as it is read rather than
+    all at once, so that the memory used stays the same no matter how big the file is
+
+    this stands in for the gzipped bytes in the dict that FileToWrite.format_as_yaml_dict()
+    returns, utils.write_yaml_file_from_dict() knows how to write it out
+    '''
+
+    source_path:pathlib.Path = attr.ib()
+    compression_level:int = attr.ib()
+    read_chunk_size:int = attr.ib(default=constants.PAYLOAD_SOURCE_READ_CHUNK_SIZE)
+
+    # an optional ParallelGzipCompressor to compress the file with instead, it is
+    # read in chunks of its chunk size then
+    parallel_gzip:typing.Optional[typing.Any] = attr.ib(default=None, eq=False, repr=False)
+
+    # ((the source file's mtime_ns, its size), the size of the gzip stream) from the last time it was
+    # compressed all the way through, so measuring the rendered size doesn't compress it again
+    _compressed_size_record:list = attr.ib(factory=list, init=False, eq=False, repr=False)
+
+    def _get_source_stat_key(self) -> tuple:
+
+        source_stat = self.source_path.stat()
+        return (source_stat.st_mtime_ns, source_stat.st_size)
+
+    def _iter_file_chunks(self, read_chunk_size:int) -> typing.Iterator[bytes]:
+
+        with open(self.source_path, "rb") as f:
+
+            while True:
+                chunk = f.read(read_chunk_size)
+                if not chunk:
+                    break
+
+                yield chunk
+
+    def iter_compressed_chunks(self) -> typing.Iterator[bytes]:
+        '''
+        @return an iterator of chunks of the gzip stream for the file
+        '''
+
+        source_stat_key = self._get_source_stat_key()
+        compressed_size = 0
+
+        for iter_chunk in self._iter_compressed_chunks():
+            compressed_size += len(iter_chunk)
+            yield iter_chunk
+
+        self._compressed_size_record[:] = [(source_stat_key, compressed_size)]
+
+    def _iter_compressed_chunks(self) -> typing.Iterator[bytes]:
+
+        if self.parallel_gzip is not None:
+            yield from self.parallel_gzip.iter_compress(self._iter_file_chunks(self.parallel_gzip.chunk_size), self.compression_level)
+            return
+
+        # wbits of 31 makes zlib write a gzip header (with an mtime of 0) and trailer
+        compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, 31)
+
+        for iter_chunk in self._iter_file_chunks(self.read_chunk_size):
+
+            compressed_chunk = compressor.compress(iter_chunk)
+            if compressed_chunk:
+                yield compressed_chunk
+
+        yield compressor.flush()
+
+    def read_all(self) -> bytes:
+        '''
+        @return the whole gzip stream as bytes, for the code paths that can't stream it
+        '''
+
+        return b"".join(self.iter_compressed_chunks())
+
+    def get_compressed_size(self) -> int:
+        '''
+        @return the size of the gzip stream, the file is only compressed to find out if it
+        hasn't been already since it last changed
+        '''
+
+        if not self._compressed_size_record or self._compressed_size_record[0][0] != self._get_source_stat_key():
+            for _ in self.iter_compressed_chunks():
+                pass
+
+        return self._compressed_size_record[0][1]
 
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class FileToWrite:
 
 
-    file_path:pathlib.Path = attr.ib()
-    owner_username:str = attr.ib()
-    owner_group:str = attr.ib()
-    permission_octal:str = attr.ib()
+    file_path:pathlib.Path = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_FILE_PATH, HoconTypesEnum.STRING)
+    owner_username:str = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_OWNER_USERNAME, HoconTypesEnum.STRING)
+    owner_group:str = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_OWNER_GROUP, HoconTypesEnum.STRING)
+    permission_octal:str = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PERMISSION_OCTAL, HoconTypesEnum.STRING)
 
-    use_mustache_template:bool = attr.ib()
+    use_mustache_template:bool = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_USE_MUSTACHE_TEMPLATE, HoconTypesEnum.BOOLEAN)
 
     # if true, we won't base64 the payload
-    payload_is_base64:bool = attr.ib()
+    payload_is_base64:bool = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_IS_BASE64, HoconTypesEnum.BOOLEAN)
 
-    payload_content:bytes = attr.ib()
+    # exactly one of these has to be set, a payload_source_path is read from disk (relative to
+    # the current directory) when the YAML is written, rather than living in the config
+    payload_content:typing.Optional[str] = hocon_field(
+        constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_CONTENT, HoconTypesEnum.STRING, default=None)
+    payload_source_path:typing.Optional[str] = hocon_field(
+        constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_SOURCE_PATH, HoconTypesEnum.STRING, default=None)
 
-    def format_as_yaml_dict(self):
-        '''
-        formats this object in a suitable manner
-        to be serialized as part of a cloud-init YAML file
+    def __attrs_post_init__(self):
 
+        if (self.payload_content is None) == (self.payload_source_path is None):
+            raise ValueError(
+                f"`{self.file_path}` needs exactly one of `payload_content` or `payload_source_path`")
 
-        @return a dictioanry, suitable to be converted to yaml
+        if self.payload_source_path is not None and self.payload_is_base64:
+            raise ValueError(
+                f"`{self.file_path}` has a `payload_source_path`, which is always read as raw bytes, so `payload_is_base64` has to be false")
+
+    def get_raw_content_bytes(self, template_cache=None, template_variables=None) -> bytes:
         '''
-        final_dict = dict()
+        get the raw bytes that should end up on disk for this file, so the
+        payload with any base64 undone and any mustache template rendered
 
-        final_dict["path"] = self.file_path
-        final_dict["owner"] = f"{self.owner_username}:{self.owner_group}"
-        final_dict["permissions"] = self.permission_octal
+        @param template_cache - an optional MustacheTemplateCache so the template is only
+        tokenized once no matter how many times it is rendered
+        @param template_variables - the context to render the mustache template with
+        @return the raw bytes
+        '''
 
-        # we need to gzip the content, however the user might pass it in
-        # as a string or as a base64 string (in our HOCON config) so we need
-        # to get the raw bytes of it so we can gzip it
+        # the user might pass it in as a string or as a base64 string (in our HOCON config)
+        # so we need to get the raw bytes of it
 
         raw_content_bytes =  None
-        if self.payload_is_base64:
+        if self.payload_source_path is not None:
+
+            raw_content_bytes = pathlib.Path(self.payload_source_path).read_bytes()
+
+        elif self.payload_is_base64:
 
             # un-base64 the content
 
@@ -53,57 +229,154 @@ class FileToWrite:
                 raw_content_bytes = base64.b64decode(self.payload_content.encode("utf-8"))
 
             except Exception as e:
-                self.logger.exception("Caught exception when decoding the payload content as base64! Self: `%s`", self)
+                logger.exception("Caught exception when decoding the payload content as base64! Self: `%s`", self)
                 raise e
         else:
 
             # don't need to do anything since its just the raw content already
             raw_content_bytes = self.payload_content.encode("utf-8")
 
+        if self.use_mustache_template:
+
+            template_text = raw_content_bytes.decode("utf-8")
+            template_variables = template_variables if template_variables is not None else dict()
+
+            try:
+
+                if template_cache is not None:
+                    rendered_text = template_cache.render(template_text, template_variables)
+                else:
+                    import chevron
+
+                    rendered_text = chevron.render(template_text, template_variables)
+
+            except Exception as e:
+                raise Exception(f"Failed to render the mustache template for `{self.file_path}`: `{e}`") from e
+
+            raw_content_bytes = rendered_text.encode("utf-8")
+
+        return raw_content_bytes
+
+    def format_as_yaml_dict(self, compression_cache=None, template_cache=None, template_variables=None, size_optimizer=None, parallel_gzip=None):
+        '''
+        formats this object in a suitable manner
+        to be serialized as part of a cloud-init YAML file
+
+        @param compression_cache - an optional CompressionCache, if given the gzipped
+        content is looked up there first instead of compressing it again
+        @param template_cache - an optional MustacheTemplateCache, see get_raw_content_bytes()
+        @param template_variables - the context to render the mustache template with
+        @param size_optimizer - an optional UserDataSizeOptimizer, if given it picks the
+        encoding of the content rather than always using gzip
+        @param parallel_gzip - an optional ParallelGzipCompressor for the big payloads
+
+        @return a dictioanry, suitable to be converted to yaml
+        '''
+        final_dict = dict()
+
+        final_dict["path"] = self.file_path
+        final_dict["owner"] = f"{self.owner_username}:{self.owner_group}"
+        final_dict["permissions"] = self.permission_octal
+
+        compression_level = constants.GZIP_COMPRESSION_LEVEL
+
+        # files on disk that don't need to be templated are compressed while they are being
+        # written out (so their time shows up in the `yaml_emit` span rather than `encode_file`),
+        # these skip the compression cache since they are usually the huge ones
+        if self.payload_source_path is not None and not self.use_mustache_template:
+
+            final_dict["encoding"] = "gzip"
+            final_dict["content"] = StreamedGzipPayload(
+                source_path=pathlib.Path(self.payload_source_path), compression_level=compression_level, parallel_gzip=parallel_gzip)
+
+            return final_dict
 
-        # now gzip the content
-        compressed_content_bytes = gzip.compress(raw_content_bytes)
+        with metrics.span("encode_file", file_path=self.file_path) as metrics_span:
 
-        final_dict["encoding"] = "gzip"
-        final_dict["content"] = compressed_content_bytes
+            # we need to gzip the content, so get the raw bytes of it
+            raw_content_bytes = self.get_raw_content_bytes(template_cache, template_variables)
+
+            if size_optimizer is not None:
+                final_dict = size_optimizer.choose_encoding(self, final_dict, raw_content_bytes, compression_cache, parallel_gzip)
+
+            else:
+                # now gzip the content
+                final_dict["encoding"] = "gzip"
+                final_dict["content"] = gzip_compress(raw_content_bytes, compression_level, compression_cache, parallel_gzip)
+
+            metrics_span.set_bytes(bytes_in=len(raw_content_bytes), bytes_out=len(final_dict["content"]))
 
         return final_dict
 
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class CommandToRun:
-    command_line:typing.Sequence[str] = attr.ib()
-    acceptable_status_codes:typing.Sequence[int] = attr.ib()
+    command_line:typing.Sequence[str] = hocon_field(constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMAND_LINE, HoconTypesEnum.LIST)
+    acceptable_status_codes:typing.Sequence[int] = hocon_field(constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ACCEPTABLE_STATUS_CODES_LIST, HoconTypesEnum.LIST)
+
+    # what other commands refer to this one by in `depends_on`, defaults to `command_<index>`
+    name:typing.Optional[str] = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMAND_NAME, HoconTypesEnum.STRING, default=None)
+
+    # the names of the commands that have to finish before this one starts. If this is
+    # left out the command depends on the one before it, so configs that don't use it
+    # still run one command at a time, in order
+    depends_on:typing.Optional[typing.Sequence[str]] = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_DEPENDS_ON_LIST, HoconTypesEnum.LIST, default=None)
 
 
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class BootstrapScriptSettings:
 
-    root_folder:pathlib.Path = attr.ib()
-    zip_url:str = attr.ib()
-    zip_root_folder:str = attr.ib()
-    commands_to_run:typing.Sequence[CommandToRun] = attr.ib()
-    files_to_write:typing.Sequence[FileToWrite] = attr.ib()
+    root_folder:pathlib.Path = hocon_field(constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ROOT_FOLDER, HoconTypesEnum.STRING)
+    zip_url:str = hocon_field(constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ZIP_URL, HoconTypesEnum.STRING)
+    zip_root_folder:str = hocon_field(constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ZIP_ROOT_FOLDER, HoconTypesEnum.STRING)
+    commands_to_run:typing.Sequence[CommandToRun] = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMANDS_TO_RUN_LIST, HoconTypesEnum.LIST, CommandToRun)
+    files_to_write:typing.Sequence[FileToWrite] = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_FILES_TO_WRITE_LIST, HoconTypesEnum.LIST, FileToWrite)
+
+    # how many commands_to_run the bootstrap runner runs at once, when their depends_on allow it
+    max_parallel_commands:int = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_MAX_PARALLEL_COMMANDS, HoconTypesEnum.INT,
+        default=constants.BOOTSTRAP_RUNNER_DEFAULT_MAX_PARALLEL_COMMANDS)
+
+    def __attrs_post_init__(self):
+
+        # the runner hands this to a ThreadPoolExecutor, which doesn't take anything less than 1
+        if self.max_parallel_commands <= 0:
+            raise ValueError(
+                f"`{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_MAX_PARALLEL_COMMANDS}` has to be at least 1, got `{self.max_parallel_commands}`")
 
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class CloudInitSettings:
 
 
-    user_name:str = attr.ib()
-    ssh_authorized_keys:list = attr.ib()
-    password:str = attr.ib()
-    packages_to_install:list = attr.ib()
-    byobu_enable:bool = attr.ib()
-    files_to_write:typing.Sequence[FileToWrite] = attr.ib()
+    user_name:str = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_USER_NAME, HoconTypesEnum.STRING)
+    ssh_authorized_keys:list = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_SSH_AUTH_KEYS, HoconTypesEnum.LIST)
+    password:str = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_PASSWORD, HoconTypesEnum.STRING)
+    packages_to_install:list = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_PACKAGES_TO_INSTALL_LIST, HoconTypesEnum.LIST)
+    byobu_enable:bool = hocon_field(constants.HOCON_CONFIG_KEY_CLOUD_INIT_BYOBU_ENABLE, HoconTypesEnum.BOOLEAN)
+    files_to_write:typing.Sequence[FileToWrite] = hocon_field(
+        constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_LIST, HoconTypesEnum.LIST, FileToWrite)
 
 
-    def format_as_yaml_dict(self) -> dict:
+    def format_as_yaml_dict(self, compression_cache=None, template_cache=None, template_variables=None, size_optimizer=None, parallel_gzip=None) -> dict:
         '''
         formats this object in a suitable manner
         to be serialized as a cloud-init YAML file
 
+        @param compression_cache - an optional CompressionCache that is passed
+        on to each FileToWrite
+        @param template_cache - an optional MustacheTemplateCache that is passed
+        on to each FileToWrite
+        @param template_variables - the context to render any mustache templates with
+        @param size_optimizer - an optional UserDataSizeOptimizer that is passed
+        on to each FileToWrite
+        @param parallel_gzip - an optional ParallelGzipCompressor that is passed
+        on to each FileToWrite
 
         @return a dictioanry, suitable to be converted to yaml
         '''
@@ -136,7 +409,7 @@ class CloudInitSettings:
         final_dict["packages"] = self.packages_to_install
         final_dict["byobu_by_default"] = "enable" if self.byobu_enable else "disable"
 
-        write_files_list = [iter_file.format_as_yaml_dict() for iter_file in self.files_to_write]
+        write_files_list = [iter_file.format_as_yaml_dict(compression_cache, template_cache, template_variables, size_optimizer, parallel_gzip) for iter_file in self.files_to_write]
         final_dict["write_files"] = write_files_list
 
 
@@ -148,18 +421,105 @@ class CloudInitSettings:
 class ConfigFileSettings:
 
 
-    cloud_init_settings:CloudInitSettings = attr.ib()
-    bootstrap_script_settings:BootstrapScriptSettings = attr.ib()
+    cloud_init_settings:CloudInitSettings = hocon_field(
+        constants.HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP, HoconTypesEnum.CONFIG, CloudInitSettings)
+    bootstrap_script_settings:BootstrapScriptSettings = hocon_field(
+        constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_GROUP, HoconTypesEnum.CONFIG, BootstrapScriptSettings)
 
+    # the context for any files_to_write that have use_mustache_template set, this is
+    # optional since not every config uses templates
+    template_variables:typing.Mapping[str, typing.Any] = hocon_field(
+        constants.HOCON_CONFIG_KEY_TEMPLATE_VARIABLES_GROUP, HoconTypesEnum.CONFIG, factory=dict)
 
 
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class HostOverrides:
+    '''
+    a single row out of a hosts manifest file, the overrides are a mapping
+    of dotted HOCON keys (relative to the top level group) to the value that
+    should replace whatever the base config has for that host
+    '''
 
+    hostname:str = attr.ib()
+    overrides:typing.Mapping[str, typing.Any] = attr.ib()
 
-class HoconTypesEnum(enum.Enum):
-    STRING = "string"
-    INT = "int"
-    FLOAT = "float"
-    LIST = "list"
-    BOOLEAN = "boolean"
-    CONFIG = "config"
-    ANY = "any"
+
+
+
+
+class ListMergeStrategyEnum(enum.Enum):
+    '''
+    how a list in a later `--config` layer is combined with the same list in the layers before it
+    '''
+
+    REPLACE = "replace"
+    APPEND = "append"
+
+    # entries with the same `file_path` as an earlier one take its place, the rest are appended
+    MERGE_BY_FILE_PATH = "merge_by_file_path"
+
+
+class HostsManifestFormatEnum(enum.Enum):
+    CSV = "csv"
+    JSONL = "jsonl"
+    HOCON = "hocon"
+
+
+class WriteFilesEncodingEnum(enum.Enum):
+    '''
+    the `encoding` values for a write_files entry, text/plain is what cloud-init
+    assumes when there is no `encoding` key, so it is written without one
+    '''
+
+    TEXT_PLAIN = "text/plain"
+    B64 = "b64"
+    GZIP = "gzip"
+    GZIP_B64 = "gz+b64"
+
+
+class BootDurationCategoryEnum(enum.Enum):
+    '''
+    the kinds of durations that analyze_boot pulls out of the cloud-init logs
+    '''
+
+    # from boot until cloud-init finished, the `Up N seconds` of the `finished at` line
+    TIME_TO_READY = "time_to_ready"
+    STAGE = "stage"
+    MODULE = "module"
+
+    # the other cloud-init events, like searching for the datasource
+    EVENT = "event"
+    WRITE_FILE = "write_file"
+    BOOTSTRAP_COMMAND = "bootstrap_command"
+    BOOTSTRAP_TOTAL = "bootstrap_total"
+
+
+class LogFormatEnum(enum.Enum):
+    TEXT = "text"
+
+    # one JSON object per line, see utils.JsonLinesLoggingFormatter
+    JSON = "json"
+
+
+class UserDataOutputFormatEnum(enum.Enum):
+    CLOUD_CONFIG = "cloud-config"
+    MIME_MULTIPART = "mime-multipart"
+
+
+class MimePartTypeEnum(enum.Enum):
+    '''
+    the content types of the parts that cloud-init understands in a MIME multipart user-data
+    '''
+
+    CLOUD_CONFIG = "text/cloud-config"
+    SHELL_SCRIPT = "text/x-shellscript"
+    INCLUDE_URL = "text/x-include-url"
+    PART_HANDLER = "text/part-handler"
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class MimePart:
+
+    part_type:MimePartTypeEnum = attr.ib()
+    filename:str = attr.ib()
+    content:str = attr.ib()
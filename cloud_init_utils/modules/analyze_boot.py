@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+import concurrent.futures
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils.model import BootDurationCategoryEnum
+from cloud_init_utils.output_file import OutputFileWriter
+
+
+logger = logging.getLogger(__name__)
+
+class AnalyzeBoot:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("analyze_boot")
+
+        parser.add_argument("--bundles-dir", dest="bundles_dir", required=True, type=utils.isDirectoryType,
+            help=f"the folder of log bundles, one folder or tar file per host with `{constants.ANALYZE_BOOT_CLOUD_INIT_LOG_FILE_NAME}`, "
+            f"`{constants.ANALYZE_BOOT_CLOUD_INIT_OUTPUT_LOG_FILE_NAME}` and `{constants.ANALYZE_BOOT_RESULT_JSON_FILE_NAME}` in it "
+            "(any of which can be gzipped). If --config is given, the durations are tied back to the entries in it")
+        parser.add_argument("--workers", dest="workers", type=int, default=os.cpu_count(),
+            help="how many processes to read the bundles with, defaults to the number of CPUs")
+        parser.add_argument("--category", dest="categories", action="append",
+            choices=[iter_category.value for iter_category in BootDurationCategoryEnum],
+            help="only show this kind of duration, can be given more than once")
+        parser.add_argument("--top", dest="top", type=int, default=constants.ANALYZE_BOOT_DEFAULT_TOP_ROWS,
+            help=f"only show the slowest this many rows (by p{constants.ANALYZE_BOOT_PERCENTILES[1]}), 0 shows them all")
+        parser.add_argument("--report-file", dest="report_file", type=utils.isFileType(strict=False),
+            help="save every row, and the hosts with errors, to this file as JSON")
+
+        analyze_boot_obj = AnalyzeBoot()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=analyze_boot_obj.run, requires_config=False)
+
+
+    def run(self, config, parsed_args):
+
+        # imported here since only this subcommand needs it
+        from cloud_init_utils import boot_analyzer
+
+        bundle_paths = boot_analyzer.get_bundle_paths(parsed_args.bundles_dir)
+
+        if not bundle_paths:
+            raise Exception(f"there are no log bundles in `{parsed_args.bundles_dir}`")
+
+        logger.info("analyzing `%s` log bundles with `%s` workers", len(bundle_paths), parsed_args.workers)
+
+        boot_duration_stats = boot_analyzer.BootDurationStats()
+
+        # only the durations are sent back, and they are added up as they come in, so this
+        # doesn't need to hold every host's logs in memory at once
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.workers) as executor:
+
+            chunk_size = max(1, len(bundle_paths) // (parsed_args.workers * 8))
+
+            for iter_boot_report in executor.map(boot_analyzer.analyze_bundle, bundle_paths, chunksize=chunk_size):
+                boot_duration_stats.add(iter_boot_report)
+
+        config_labels = boot_analyzer.get_config_labels(config) if config is not None else None
+        rows = boot_duration_stats.build_rows(config_labels)
+
+        if parsed_args.categories:
+            rows = [iter_row for iter_row in rows if iter_row["category"] in parsed_args.categories]
+
+        shown_rows = rows[:parsed_args.top] if parsed_args.top else rows
+
+        logger.info("boot durations in seconds across `%s` hosts, slowest first:\n%s",
+            boot_duration_stats.host_count, boot_analyzer.format_rows_table(shown_rows))
+
+        # with thousands of hosts these could drown out everything else, --report-file has all of them
+        max_logged_hosts = constants.ANALYZE_BOOT_MAX_LOGGED_HOSTS
+
+        for iter_hostname, iter_problems in sorted(boot_duration_stats.hosts_with_problems.items())[:max_logged_hosts]:
+            logger.warning("problems reading the logs of `%s`: `%s`", iter_hostname, iter_problems)
+
+        for iter_hostname, iter_errors in sorted(boot_duration_stats.hosts_with_errors.items())[:max_logged_hosts]:
+            logger.warning("cloud-init reported errors on `%s`: `%s`", iter_hostname, iter_errors)
+
+        logger.info("`%s` hosts, `%s` with cloud-init errors, `%s` with logs that couldn't be fully read",
+            boot_duration_stats.host_count, len(boot_duration_stats.hosts_with_errors), len(boot_duration_stats.hosts_with_problems))
+
+        if parsed_args.report_file:
+
+            report = {
+                "host_count": boot_duration_stats.host_count,
+                "rows": rows,
+                "hosts_with_errors": boot_duration_stats.hosts_with_errors,
+                "hosts_with_problems": boot_duration_stats.hosts_with_problems,
+            }
+
+            with OutputFileWriter(parsed_args.report_file) as f:
+                f.write(json.dumps(report, indent=4, sort_keys=True))
+                f.write("\n")
+
+            logger.info("wrote the report to `%s`", parsed_args.report_file)
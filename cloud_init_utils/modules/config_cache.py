@@ -0,0 +1,64 @@
+import logging
+import datetime
+
+from cloud_init_utils import utils
+
+
+logger = logging.getLogger(__name__)
+
+class ConfigCache:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("config_cache")
+
+        parser.add_argument("--purge", dest="purge", action="store_true",
+            help="remove every entry from the parsed config cache, rather than listing them")
+
+        config_cache_obj = ConfigCache()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=config_cache_obj.run, requires_config=False)
+
+
+    def run(self, config, parsed_args):
+
+        if parsed_args.no_cache:
+            raise Exception("`--no-cache` was given, so there is no parsed config cache to look at")
+
+        parsed_config_cache = utils.get_config_cache_from_args(parsed_args)
+
+        if parsed_args.purge:
+
+            removed_count = parsed_config_cache.purge()
+            logger.info("removed `%s` entries from the parsed config cache at `%s`", removed_count, parsed_config_cache.cache_dir)
+            return
+
+        entry_count = 0
+
+        for iter_entry_path, iter_metadata in parsed_config_cache.iter_entries():
+
+            entry_count += 1
+
+            if iter_metadata is None:
+                logger.info("`%s`: unreadable", iter_entry_path.name)
+                continue
+
+            created = datetime.datetime.fromtimestamp(iter_metadata["created"]).isoformat()
+
+            # older entries only recorded the last layer
+            config_paths = iter_metadata.get("config_paths", [iter_metadata.get("root_config_path")])
+
+            logger.info("`%s`: `%s` (`%s` bytes, created `%s`), from `%s` input files:\n%s",
+                iter_entry_path.name, ", ".join(config_paths), iter_entry_path.stat().st_size, created,
+                len(iter_metadata["input_paths"]), "\n".join(f"  * {iter_path}" for iter_path in iter_metadata["input_paths"]))
+
+        logger.info("`%s` entries in the parsed config cache at `%s`", entry_count, parsed_config_cache.cache_dir)
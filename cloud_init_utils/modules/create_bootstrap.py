@@ -0,0 +1,52 @@
+import logging
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils.output_file import OutputFileWriter
+from cloud_init_utils.template_cache import MustacheTemplateCache
+
+
+logger = logging.getLogger(__name__)
+
+class CreateBootstrap:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("create_bootstrap")
+
+        parser.add_argument("--output-file", dest="output_file", required=True, type=utils.isFileType(strict=False),
+            help="Where to save the bootstrap runner script")
+
+        create_bootstrap_obj = CreateBootstrap()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=create_bootstrap_obj.run)
+
+
+    def run(self, config, parsed_args):
+
+        # imported here since it pulls in the runner module (and everything it imports)
+        from cloud_init_utils.bootstrap_script import render_bootstrap_runner
+
+        bootstrap_script_settings = config.bootstrap_script_settings
+
+        runner_text = render_bootstrap_runner(bootstrap_script_settings, MustacheTemplateCache(), config.template_variables)
+
+        logger.info("writing the bootstrap runner (`%s` files to write, `%s` commands to run, up to `%s` at once) to `%s`",
+            len(bootstrap_script_settings.files_to_write), len(bootstrap_script_settings.commands_to_run),
+            bootstrap_script_settings.max_parallel_commands, parsed_args.output_file)
+
+        # make it executable, like any other script
+        with OutputFileWriter(parsed_args.output_file, file_mode=constants.BOOTSTRAP_RUNNER_FILE_MODE) as f:
+            f.write(runner_text)
+
+        if not f.changed:
+            logger.info("`%s` is unchanged, left it alone", parsed_args.output_file)
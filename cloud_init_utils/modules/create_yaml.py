@@ -1,10 +1,23 @@
+import io
+import json
 import logging
 
+import attr
+
 from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import metrics
+from cloud_init_utils.model import UserDataOutputFormatEnum, MimePartTypeEnum, MimePart
+from cloud_init_utils.output_file import OutputFileWriter
+from cloud_init_utils.template_cache import MustacheTemplateCache
 
 
 logger = logging.getLogger(__name__)
 
+# the outputs in the --watch dependency graph that aren't a write_files entry
+_CONFIG_OUTPUT_KEY = "config"
+_MIME_PARTS_OUTPUT_KEY = "mime_parts"
+
 class CreateYaml:
 
     @staticmethod
@@ -20,6 +33,26 @@ class CreateYaml:
         parser = argparse_subparser.add_parser("create_yaml")
 
         parser.add_argument("--output-file", dest="output_file", type=utils.isFileType(strict=False), help="Where to save the YAML file")
+        utils.add_size_optimizer_arguments(parser)
+
+        parser.add_argument("--output-format", dest="output_format", default=UserDataOutputFormatEnum.CLOUD_CONFIG.value,
+            choices=[iter_format.value for iter_format in UserDataOutputFormatEnum],
+            help="write just the `#cloud-config` YAML, or a MIME multipart archive of the YAML and the bootstrap script")
+        parser.add_argument("--gzip-output", dest="gzip_output", action="store_true",
+            help="gzip the whole output as one stream, rather than gzipping each file in write_files on its own")
+        parser.add_argument("--no-bootstrap-script", dest="no_bootstrap_script", action="store_true",
+            help="leave the bootstrap script part out of the MIME multipart archive")
+        parser.add_argument("--include-url", dest="include_urls", action="append", default=[],
+            help="a URL for cloud-init to fetch more user-data from, added to the MIME multipart archive as an "
+            "include part, can be given more than once")
+        parser.add_argument("--gzip-threads", dest="gzip_threads", type=int, default=1,
+            help="compress payloads bigger than --gzip-chunk-size on this many threads (like pigz), "
+            "the output doesn't depend on the number of threads as long as it is more than 1")
+        parser.add_argument("--gzip-chunk-size", dest="gzip_chunk_size", type=int, default=constants.PARALLEL_GZIP_DEFAULT_CHUNK_SIZE,
+            help=f"how many bytes each thread compresses at a time with --gzip-threads, defaults to `{constants.PARALLEL_GZIP_DEFAULT_CHUNK_SIZE}`")
+        parser.add_argument("--part-handler", dest="part_handler_paths", action="append", default=[], type=utils.isFileType(strict=True),
+            help="a python part handler to add to the MIME multipart archive, can be given more than once")
+        utils.add_watch_arguments(parser)
 
         create_yaml_obj = CreateYaml()
 
@@ -27,15 +60,275 @@ class CreateYaml:
         parser.set_defaults(func_to_run=create_yaml_obj.run)
 
 
+    def _build_mime_parts(self, config, cloud_config_text:str, parsed_args, template_cache) -> list:
+
+        # imported here since only the MIME output needs it
+        from cloud_init_utils.bootstrap_script import render_bootstrap_runner
+
+        mime_parts = [MimePart(
+            part_type=MimePartTypeEnum.CLOUD_CONFIG,
+            filename=constants.MIME_MULTIPART_CLOUD_CONFIG_FILENAME,
+            content=cloud_config_text)]
+
+        if not parsed_args.no_bootstrap_script:
+            mime_parts.append(MimePart(
+                part_type=MimePartTypeEnum.SHELL_SCRIPT,
+                filename=constants.MIME_MULTIPART_BOOTSTRAP_SCRIPT_FILENAME,
+                content=render_bootstrap_runner(config.bootstrap_script_settings, template_cache, config.template_variables)))
+
+        if parsed_args.include_urls:
+            mime_parts.append(MimePart(
+                part_type=MimePartTypeEnum.INCLUDE_URL,
+                filename=constants.MIME_MULTIPART_INCLUDE_URL_FILENAME,
+                content="".join(f"{iter_url}\n" for iter_url in parsed_args.include_urls)))
+
+        for iter_part_handler_path in parsed_args.part_handler_paths:
+            mime_parts.append(MimePart(
+                part_type=MimePartTypeEnum.PART_HANDLER,
+                filename=iter_part_handler_path.name,
+                content=iter_part_handler_path.read_text(encoding="utf-8")))
+
+        return mime_parts
+
+
+    def _log_output_file_result(self, output_file_writer):
+
+        if output_file_writer.changed:
+            logger.info("wrote `%s`", output_file_writer.output_path)
+        else:
+            logger.info("`%s` is unchanged, left it alone", output_file_writer.output_path)
+
+
     def run(self, config, parsed_args):
 
-        logger.info("config: `%s`", config)
+        # the repr includes every payload, so only log it with --verbose
+        logger.debug("config: `%s`", config)
+
+        is_mime_multipart = UserDataOutputFormatEnum(parsed_args.output_format) == UserDataOutputFormatEnum.MIME_MULTIPART
+
+        if not is_mime_multipart and (parsed_args.no_bootstrap_script or parsed_args.include_urls or parsed_args.part_handler_paths):
+            raise Exception(f"`--no-bootstrap-script`, `--include-url` and `--part-handler` only work with "
+                f"`--output-format {UserDataOutputFormatEnum.MIME_MULTIPART.value}`")
+
+        compression_cache = utils.get_compression_cache_from_args(parsed_args)
+        template_cache = MustacheTemplateCache()
+        size_optimizer, size_limit = utils.get_size_optimizer_from_args(parsed_args)
+
+        if parsed_args.gzip_output:
+
+            # imported here so the optimizer is only loaded when it is needed
+            from cloud_init_utils.size_optimizer import UserDataSizeOptimizer
+
+            # gzipping the files that are already gzipped doesn't do anything, and small
+            # files compress much better as part of the whole document than on their own
+            size_optimizer = UserDataSizeOptimizer(allow_gzip=False)
+
+        parallel_gzip = None
+
+        if parsed_args.gzip_threads > 1:
+
+            # imported here since it is only needed with --gzip-threads
+            from cloud_init_utils.parallel_gzip import ParallelGzipCompressor
+
+            parallel_gzip = ParallelGzipCompressor(parsed_args.gzip_threads, parsed_args.gzip_chunk_size)
+
+        try:
+            if parsed_args.watch:
+                self._watch(config, parsed_args, compression_cache, template_cache, size_optimizer, size_limit, parallel_gzip)
+            else:
+                self._render(config, parsed_args, compression_cache, template_cache, size_optimizer, size_limit, parallel_gzip)
+
+        finally:
+            if parallel_gzip is not None:
+                parallel_gzip.close()
+
+
+    def _get_dependency_graph(self, config, parsed_args, list_merge_strategies):
+
+        # imported here since only --watch needs it
+        from cloud_init_utils.file_watcher import DependencyGraph
+
+        dependency_graph = DependencyGraph()
+
+        for iter_path in utils.get_config_input_paths(parsed_args.config, list_merge_strategies):
+            dependency_graph.add(iter_path, _CONFIG_OUTPUT_KEY)
+
+        # a payload file only affects the write_files entries that use it
+        for iter_file in config.cloud_init_settings.files_to_write:
+            if iter_file.payload_source_path is not None:
+                dependency_graph.add(iter_file.payload_source_path, iter_file)
+
+        # the other MIME parts are cheap, so they are always built again
+        if UserDataOutputFormatEnum(parsed_args.output_format) == UserDataOutputFormatEnum.MIME_MULTIPART:
+
+            for iter_part_handler_path in parsed_args.part_handler_paths:
+                dependency_graph.add(iter_part_handler_path, _MIME_PARTS_OUTPUT_KEY)
+
+            if not parsed_args.no_bootstrap_script:
+                for iter_file in config.bootstrap_script_settings.files_to_write:
+                    if iter_file.payload_source_path is not None:
+                        dependency_graph.add(iter_file.payload_source_path, _MIME_PARTS_OUTPUT_KEY)
+
+        return dependency_graph
+
+
+    def _watch(self, config, parsed_args, compression_cache, template_cache, size_optimizer, size_limit, parallel_gzip):
+
+        list_merge_strategies = utils.get_list_merge_strategies_from_args(parsed_args)
+        parsed_config_cache = utils.get_config_cache_from_args(parsed_args)
+
+        # the write_files entries that were already encoded, see _get_yaml_dict_reusing_encoded_files()
+        encoded_files = dict()
+
+        with utils.get_file_watcher_from_args(parsed_args) as file_watcher:
+
+            try:
+                while True:
+
+                    # watch before rendering, so a file that changes while it is being read isn't missed
+                    dependency_graph = self._get_dependency_graph(config, parsed_args, list_merge_strategies)
+                    file_watcher.set_paths(dependency_graph.get_input_paths())
+
+                    try:
+                        self._render(config, parsed_args, compression_cache, template_cache, size_optimizer, size_limit, parallel_gzip, encoded_files)
+                    except Exception as e:
+                        logger.error("failed to render `%s`: `%s`", parsed_args.output_file, e)
+
+                    logger.info("watching `%s` files for changes with `%s`, press ctrl-c to stop",
+                        len(dependency_graph.get_input_paths()), file_watcher.mode)
+
+                    while True:
+
+                        changed_paths = file_watcher.wait_for_changes()
+                        affected_outputs = dependency_graph.get_affected_outputs(changed_paths)
+
+                        logger.info("changed: `%s`", ", ".join(sorted(changed_paths)))
+
+                        if _CONFIG_OUTPUT_KEY not in affected_outputs:
+                            break
+
+                        # the memos only notice when a layer itself changes, not one of its includes
+                        utils.clear_parsed_config_memos()
+
+                        try:
+                            config = utils.load_config_settings(parsed_args.config, parsed_config_cache, list_merge_strategies)
+                            break
+                        except Exception as e:
+                            logger.error("failed to load the config, waiting for it to be fixed: `%s`", e)
+
+                    # the entries that are still in the new config are reused unless their payload changed
+                    for iter_key in list(encoded_files):
+                        if iter_key[0] in affected_outputs:
+                            del encoded_files[iter_key]
+
+            except KeyboardInterrupt:
+                logger.info("stopped watching")
+
+
+    def _get_yaml_dict_reusing_encoded_files(self, config, encoded_files:dict, compression_cache, template_cache, size_optimizer, parallel_gzip) -> dict:
+        '''
+        like CloudInitSettings.format_as_yaml_dict(), but the write_files entries already in
+        `encoded_files` aren't encoded again
+
+        @param encoded_files - a dict of (FileToWrite, template variables) -> its write_files entry, the
+        new entries are added to it and the ones that aren't in the config anymore are removed
+        @return the YAML dict
+        '''
+
+        yaml_dict = attr.evolve(config.cloud_init_settings, files_to_write=[]).format_as_yaml_dict()
+
+        # a template has to be rendered again if the variables change, anything else doesn't care about them
+        template_variables_key = json.dumps(config.template_variables, sort_keys=True, default=str)
+
+        write_files_list = []
+        used_keys = set()
+        reused_count = 0
+
+        for iter_file in config.cloud_init_settings.files_to_write:
+
+            key = (iter_file, template_variables_key if iter_file.use_mustache_template else None)
+            entry = encoded_files.get(key)
+
+            if entry is None:
+                entry = iter_file.format_as_yaml_dict(compression_cache, template_cache, config.template_variables, size_optimizer, parallel_gzip)
+                encoded_files[key] = entry
+            else:
+                reused_count += 1
+
+            write_files_list.append(entry)
+            used_keys.add(key)
+
+        for iter_key in set(encoded_files) - used_keys:
+            del encoded_files[iter_key]
+
+        yaml_dict["write_files"] = write_files_list
+
+        logger.info("encoded `%s` write_files entries, reused `%s`", len(write_files_list) - reused_count, reused_count)
+
+        return yaml_dict
+
+
+    def _render(self, config, parsed_args, compression_cache, template_cache, size_optimizer, size_limit, parallel_gzip, encoded_files=None):
+
+        is_mime_multipart = UserDataOutputFormatEnum(parsed_args.output_format) == UserDataOutputFormatEnum.MIME_MULTIPART
+
+        if encoded_files is not None:
+            yaml_dict = self._get_yaml_dict_reusing_encoded_files(config, encoded_files, compression_cache, template_cache, size_optimizer, parallel_gzip)
+        else:
+            yaml_dict = config.cloud_init_settings.format_as_yaml_dict(
+                compression_cache, template_cache, config.template_variables, size_optimizer, parallel_gzip)
+
+        if compression_cache is not None:
+            logger.info("compression cache stats: `%s`", compression_cache.get_stats())
+
+        if not is_mime_multipart and not parsed_args.gzip_output:
+
+            # check before opening the output file so an oversized YAML never gets written
+            if size_limit is not None:
+                utils.check_user_data_size(size_optimizer, yaml_dict, size_limit, str(parsed_args.output_file))
+
+            with OutputFileWriter(parsed_args.output_file) as f:
+
+                with metrics.span("yaml_emit") as metrics_span:
+                    utils.write_yaml_file_from_dict(yaml_dict, f)
+                    metrics_span.set_bytes(bytes_out=f.bytes_written)
+
+            self._log_output_file_result(f)
+            return
+
+        # the other formats need the whole YAML in memory to wrap it up
+        cloud_config_buffer = io.StringIO()
+
+        with metrics.span("yaml_emit") as metrics_span:
+            utils.write_yaml_file_from_dict(yaml_dict, cloud_config_buffer)
+            metrics_span.set_bytes(bytes_out=cloud_config_buffer.tell())
+
+        if is_mime_multipart:
+
+            # imported here since only the MIME output needs it
+            from cloud_init_utils.user_data import build_mime_multipart
+
+            mime_parts = self._build_mime_parts(config, cloud_config_buffer.getvalue(), parsed_args, template_cache)
+            user_data_bytes = build_mime_multipart(mime_parts)
+
+            logger.info("built a MIME multipart archive of `%s` bytes with the parts: `%s`",
+                len(user_data_bytes), [iter_part.part_type.value for iter_part in mime_parts])
+
+        else:
+            user_data_bytes = cloud_config_buffer.getvalue().encode("utf-8")
+
+        if parsed_args.gzip_output:
+
+            from cloud_init_utils.user_data import gzip_user_data
 
+            uncompressed_size = len(user_data_bytes)
+            user_data_bytes = gzip_user_data(user_data_bytes, parallel_gzip=parallel_gzip)
+            logger.info("gzipped the user-data from `%s` to `%s` bytes", uncompressed_size, len(user_data_bytes))
 
-        yaml_string = utils.get_yaml_file_string_from_dict(
-            config.cloud_init_settings.format_as_yaml_dict())
+        if size_limit is not None:
+            utils.check_user_data_size(size_optimizer, yaml_dict, size_limit, str(parsed_args.output_file), len(user_data_bytes))
 
-        logger.info("writing yaml file to `%s`", parsed_args.output_file)
-        with open(parsed_args.output_file, "w", encoding="utf-8") as f:
+        with OutputFileWriter(parsed_args.output_file) as f:
+            f.write(user_data_bytes)
 
-            f.write(yaml_string)
+        self._log_output_file_result(f)
@@ -0,0 +1,324 @@
+import logging
+import os
+import sys
+import signal
+import pathlib
+import collections
+import concurrent.futures
+import typing
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import metrics
+from cloud_init_utils.template_cache import MustacheTemplateCache
+from cloud_init_utils.output_file import OutputFileWriter
+
+
+logger = logging.getLogger(__name__)
+
+# the outputs in the --watch dependency graph, the config (and the hosts manifest) goes into
+# every host, a payload file only into the `(_HOST_OUTPUT_KEY, hostname)` of the hosts that use it
+_CONFIG_OUTPUT_KEY = "config"
+_HOST_OUTPUT_KEY = "host"
+
+# each worker process keeps its own compiled templates around for every host it renders,
+# so a template is tokenized at most once per worker rather than once per host
+_worker_template_cache = None
+
+
+def _init_worker(ignore_interrupts:bool):
+    global _worker_template_cache
+    _worker_template_cache = MustacheTemplateCache()
+
+    # with --watch, ctrl-c is how the parent is stopped, the workers are shut down by it
+    if ignore_interrupts:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # a forked worker would record spans into its copy of the parent's recorder, which
+    # nothing ever reads, so `--profile` and `--metrics-file` only cover the parent
+    metrics.set_recorder(None)
+
+
+def _render_host_yaml(hostname, config_settings, output_path, compression_cache, size_optimizer, size_limit):
+    '''
+    renders the cloud-init YAML for a single host and writes it out
+
+    this runs in a worker process, so it is a module level function so it can
+    be pickled
+
+    @param hostname - the hostname we are rendering for
+    @param config_settings - the ConfigFileSettings for this host (with overrides applied)
+    @param output_path - where to write the YAML file
+    @param compression_cache - the CompressionCache to use, or None. Since this is
+    a copy of the parent's object, the counters are returned rather than updated
+    @param size_optimizer - the UserDataSizeOptimizer to use, or None. This is also
+    a fresh copy of the parent's object for every host
+    @param size_limit - the user-data size limit in bytes, only used with `size_optimizer`
+    @return the hostname, the path that was written, whether it changed and the compression cache stats
+    '''
+
+    yaml_dict = config_settings.cloud_init_settings.format_as_yaml_dict(
+        compression_cache, _worker_template_cache, config_settings.template_variables, size_optimizer)
+
+    if size_optimizer is not None:
+        utils.check_user_data_size(size_optimizer, yaml_dict, size_limit, hostname)
+
+    with OutputFileWriter(output_path) as f:
+
+        utils.write_yaml_file_from_dict(yaml_dict, f)
+
+    cache_stats = compression_cache.get_stats() if compression_cache is not None else None
+
+    return hostname, output_path, f.changed, cache_stats
+
+
+class CreateYamlFleet:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("create_yaml_fleet")
+
+        parser.add_argument("--hosts", dest="hosts_manifest", required=True, type=utils.isFileType(strict=True),
+            help="the hosts manifest (.csv, .jsonl or .conf) with the per host overrides")
+        parser.add_argument("--output-dir", dest="output_dir", required=True, type=utils.isDirectoryType,
+            help="the folder to save the YAML files to, one per host")
+        parser.add_argument("--workers", dest="workers", type=int, default=os.cpu_count(),
+            help="how many worker processes to render with, defaults to the number of CPUs")
+        utils.add_size_optimizer_arguments(parser)
+        utils.add_watch_arguments(parser)
+
+        create_yaml_fleet_obj = CreateYamlFleet()
+
+        # set the function that is called when this command is used
+        # the layers are parsed by run(), only each host's merged config has to be complete
+        parser.set_defaults(func_to_run=create_yaml_fleet_obj.run, parses_config=True)
+
+
+    def _parse_hosts_manifest(self, manifest_path, failed_hosts:dict):
+        '''
+        @param failed_hosts - the rows that can't be parsed are added to this dict of hostname -> exception
+        @return the HostOverrides of the rest of the rows
+        '''
+
+        failed_rows = dict()
+        list_of_host_overrides = utils.parse_hosts_manifest(manifest_path, failed_rows)
+
+        for iter_hostname, iter_exception in failed_rows.items():
+            logger.error("host `%s`: failed to parse the hosts manifest row: `%s`", iter_hostname, iter_exception)
+
+        failed_hosts.update(failed_rows)
+
+        return list_of_host_overrides
+
+
+    def _iter_host_config_settings(self, base_config_obj, list_of_host_overrides, failed_hosts:dict) -> typing.Iterator[typing.Tuple[str, typing.Any]]:
+        '''
+        apply each host's overrides to the base config
+
+        @param base_config_obj - the ConfigTree of the `--config` layers
+        @param list_of_host_overrides - the HostOverrides from the hosts manifest
+        @param failed_hosts - the hosts that fail are added to this dict of hostname -> exception
+        @return an iterator of (hostname, ConfigFileSettings), in the order of the manifest
+        '''
+
+        for iter_host_overrides in list_of_host_overrides:
+
+            hostname = iter_host_overrides.hostname
+
+            # a bad override only fails that host, not the whole batch
+            try:
+
+                host_config_obj = utils.apply_host_overrides(base_config_obj, iter_host_overrides)
+                host_config_settings = utils.parse_config(host_config_obj)
+
+            except Exception as e:
+                logger.error("host `%s`: failed to apply the overrides: `%s`", hostname, e)
+                failed_hosts[hostname] = e
+                continue
+
+            yield hostname, host_config_settings
+
+
+    def _render_hosts(self, executor, host_config_settings:typing.Iterable[typing.Tuple[str, typing.Any]], parsed_args,
+        compression_cache, size_optimizer, size_limit, failed_hosts:dict) -> dict:
+        '''
+        render the hosts on the worker processes and log how it went
+
+        @param host_config_settings - an iterable of (hostname, ConfigFileSettings) of the hosts to render, each
+        one is handed to a worker as soon as it comes out, so the workers can start while the rest are still being parsed
+        @param failed_hosts - the hosts that fail are added to this dict of hostname -> exception
+        @return a dict of hostname -> ConfigFileSettings of the hosts that were rendered (or tried to be)
+        '''
+
+        submitted_host_config_settings = dict()
+
+        total_cache_stats = collections.Counter()
+        changed_count = 0
+        unchanged_count = 0
+
+        future_to_hostname = dict()
+
+        for iter_hostname, iter_config_settings in host_config_settings:
+
+            submitted_host_config_settings[iter_hostname] = iter_config_settings
+            output_path = pathlib.Path(parsed_args.output_dir) / f"{iter_hostname}{constants.FLEET_OUTPUT_FILE_EXTENSION}"
+
+            future = executor.submit(_render_host_yaml, iter_hostname, iter_config_settings, output_path, compression_cache, size_optimizer, size_limit)
+            future_to_hostname[future] = iter_hostname
+
+        for iter_future in concurrent.futures.as_completed(future_to_hostname):
+
+            hostname = future_to_hostname[iter_future]
+
+            try:
+                _, output_path, changed, cache_stats = iter_future.result()
+
+                if cache_stats is not None:
+                    total_cache_stats.update(cache_stats)
+
+                if changed:
+                    changed_count += 1
+                    logger.info("host `%s`: wrote yaml file to `%s`", hostname, output_path)
+                else:
+                    unchanged_count += 1
+                    logger.debug("host `%s`: `%s` is unchanged", hostname, output_path)
+
+            except Exception as e:
+                logger.error("host `%s`: failed to render: `%s`", hostname, e)
+                failed_hosts[hostname] = e
+
+        logger.info("rendered `%s` hosts, `%s` changed, `%s` unchanged, `%s` failed",
+            changed_count + unchanged_count, changed_count, unchanged_count, len(failed_hosts))
+
+        if compression_cache is not None:
+            logger.info("compression cache stats: `%s`", dict(total_cache_stats))
+
+            # each worker's copy only counts its own stores against the size the copy was sent
+            # with, so check the whole cache against the limit once they are all done
+            if total_cache_stats["misses"]:
+                compression_cache.evict()
+
+        return submitted_host_config_settings
+
+
+    def _get_dependency_graph(self, host_config_settings:dict, parsed_args, list_merge_strategies):
+
+        # imported here since only --watch needs it
+        from cloud_init_utils.file_watcher import DependencyGraph
+
+        dependency_graph = DependencyGraph()
+
+        for iter_path in utils.get_config_input_paths(parsed_args.config, list_merge_strategies):
+            dependency_graph.add(iter_path, _CONFIG_OUTPUT_KEY)
+
+        dependency_graph.add(parsed_args.hosts_manifest, _CONFIG_OUTPUT_KEY)
+
+        # a payload file only affects the hosts that use it
+        for iter_hostname, iter_config_settings in host_config_settings.items():
+            for iter_file in iter_config_settings.cloud_init_settings.files_to_write:
+                if iter_file.payload_source_path is not None:
+                    dependency_graph.add(iter_file.payload_source_path, (_HOST_OUTPUT_KEY, iter_hostname))
+
+        return dependency_graph
+
+
+    def _watch(self, executor, host_config_settings:dict, parsed_args, list_merge_strategies, compression_cache, size_optimizer, size_limit):
+
+        with utils.get_file_watcher_from_args(parsed_args) as file_watcher:
+
+            try:
+                while True:
+
+                    dependency_graph = self._get_dependency_graph(host_config_settings, parsed_args, list_merge_strategies)
+                    file_watcher.set_paths(dependency_graph.get_input_paths())
+
+                    logger.info("watching `%s` files for changes with `%s`, press ctrl-c to stop",
+                        len(dependency_graph.get_input_paths()), file_watcher.mode)
+
+                    changed_paths = file_watcher.wait_for_changes()
+                    affected_outputs = dependency_graph.get_affected_outputs(changed_paths)
+
+                    logger.info("changed: `%s`", ", ".join(sorted(changed_paths)))
+
+                    hostnames_to_render = set(iter_output[1] for iter_output in affected_outputs if iter_output != _CONFIG_OUTPUT_KEY)
+                    failed_hosts = dict()
+
+                    if _CONFIG_OUTPUT_KEY in affected_outputs:
+
+                        # the memos only notice when a layer itself changes, not one of its includes
+                        utils.clear_parsed_config_memos()
+
+                        try:
+                            base_config_obj = utils.parse_config_layers(parsed_args.config, list_merge_strategies)
+                            list_of_host_overrides = self._parse_hosts_manifest(parsed_args.hosts_manifest, failed_hosts)
+                        except Exception as e:
+                            logger.error("failed to load the config or the hosts manifest, waiting for them to be fixed: `%s`", e)
+                            continue
+
+                        new_host_config_settings = dict(self._iter_host_config_settings(base_config_obj, list_of_host_overrides, failed_hosts))
+
+                        # the hosts whose settings came out the same don't need to be rendered again
+                        hostnames_to_render.update(iter_hostname for iter_hostname, iter_config_settings in new_host_config_settings.items()
+                            if host_config_settings.get(iter_hostname) != iter_config_settings)
+
+                        removed_hostnames = sorted(set(host_config_settings) - set(new_host_config_settings))
+                        if removed_hostnames:
+                            logger.warning("`%s` hosts aren't in the hosts manifest anymore (or failed), their files were left alone: `%s`",
+                                len(removed_hostnames), ", ".join(removed_hostnames))
+
+                        host_config_settings = new_host_config_settings
+
+                    hosts_to_render = [(iter_hostname, iter_config_settings) for iter_hostname, iter_config_settings in host_config_settings.items()
+                        if iter_hostname in hostnames_to_render]
+
+                    logger.info("`%s` of `%s` hosts are affected", len(hosts_to_render), len(host_config_settings))
+
+                    self._render_hosts(executor, hosts_to_render, parsed_args, compression_cache, size_optimizer, size_limit, failed_hosts)
+
+            except KeyboardInterrupt:
+                logger.info("stopped watching")
+
+
+    def run(self, config, parsed_args):
+
+        list_merge_strategies = utils.get_list_merge_strategies_from_args(parsed_args)
+
+        # the base HOCON (all of its layers) is only parsed once, each host's overrides are applied to a copy of
+        # just the parts of it they change
+        base_config_obj = utils.parse_config_layers(parsed_args.config, list_merge_strategies)
+
+        failed_hosts = dict()
+
+        list_of_host_overrides = self._parse_hosts_manifest(parsed_args.hosts_manifest, failed_hosts)
+
+        logger.info("rendering `%s` hosts from `%s` to `%s` with `%s` workers",
+            len(list_of_host_overrides), parsed_args.hosts_manifest, parsed_args.output_dir, parsed_args.workers)
+
+        compression_cache = utils.get_compression_cache_from_args(parsed_args)
+        size_optimizer, size_limit = utils.get_size_optimizer_from_args(parsed_args)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.workers, initializer=_init_worker, initargs=(parsed_args.watch,)) as executor:
+
+            host_config_settings = self._render_hosts(executor, self._iter_host_config_settings(base_config_obj, list_of_host_overrides, failed_hosts),
+                parsed_args, compression_cache, size_optimizer, size_limit, failed_hosts)
+
+            if failed_hosts:
+                for iter_hostname, iter_exception in sorted(failed_hosts.items()):
+                    logger.error("failed host `%s`: `%s`", iter_hostname, iter_exception)
+
+            if parsed_args.watch:
+                self._watch(executor, host_config_settings, parsed_args, list_merge_strategies, compression_cache, size_optimizer, size_limit)
+                return
+
+        # every failure is already logged above, so just exit non-zero rather than having main log a traceback
+        if failed_hosts:
+            logger.error("`%s` hosts failed to render: `%s`", len(failed_hosts), ", ".join(sorted(failed_hosts)))
+            sys.exit(1)
@@ -0,0 +1,257 @@
+import io
+import os
+import json
+import time
+import uuid
+import logging
+import concurrent.futures
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils.output_file import OutputFileWriter
+from cloud_init_utils.template_cache import MustacheTemplateCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_id_or_slug(value:str):
+    ''' argparse type method for the API arguments that take either a numeric id or a slug / fingerprint '''
+
+    return int(value) if value.isdigit() else value
+
+
+class Provision:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("provision")
+
+        parser.add_argument("--name", dest="names", action="append", default=[],
+            help="the name of a droplet to create, can be given more than once")
+        parser.add_argument("--count", dest="count", type=int, default=0,
+            help="create this many droplets named `<--name-prefix>-1` and so on, as well as any given with --name")
+        parser.add_argument("--name-prefix", dest="name_prefix", help="the prefix of the droplet names for --count")
+
+        parser.add_argument("--region", dest="region", required=True, help="the region slug, like `nyc3`")
+        parser.add_argument("--size", dest="size", required=True, help="the size slug, like `s-1vcpu-1gb`")
+        parser.add_argument("--image", dest="image", required=True, type=_parse_id_or_slug, help="the image id or slug, like `ubuntu-22-04-x64`")
+        parser.add_argument("--ssh-key", dest="ssh_keys", action="append", default=[], type=_parse_id_or_slug,
+            help="the id or fingerprint of an SSH key to add to the droplets, can be given more than once")
+        parser.add_argument("--tag", dest="tags", action="append", default=[],
+            help="a tag to add to the droplets, can be given more than once. They always get a tag for this run as well, "
+            f"`{constants.PROVISION_RUN_TAG_PREFIX}<random>`, which is used to poll for just these droplets")
+        utils.add_size_optimizer_arguments(parser)
+
+        parser.add_argument("--token-env-var", dest="token_env_var", default=constants.DIGITALOCEAN_TOKEN_ENV_VAR,
+            help=f"the environment variable with the API token, defaults to `{constants.DIGITALOCEAN_TOKEN_ENV_VAR}`")
+        parser.add_argument("--api-url", dest="api_url", default=constants.DIGITALOCEAN_API_URL,
+            help="the base URL of the API, for pointing this at a stub server")
+        parser.add_argument("--threads", dest="threads", type=int, default=constants.PROVISION_DEFAULT_THREADS,
+            help=f"how many create requests (of up to `{constants.DIGITALOCEAN_MAX_DROPLETS_PER_CREATE_REQUEST}` droplets each) to have in flight at once")
+
+        parser.add_argument("--no-wait", dest="no_wait", action="store_true", help="don't wait for the droplets to become active")
+        parser.add_argument("--poll-interval", dest="poll_interval", type=float, default=constants.PROVISION_DEFAULT_POLL_INTERVAL_SECONDS,
+            help="how many seconds to wait between checking on the droplets")
+        parser.add_argument("--timeout", dest="timeout", type=float, default=constants.PROVISION_DEFAULT_TIMEOUT_SECONDS,
+            help="how many seconds to wait for the droplets to become active before giving up")
+        parser.add_argument("--droplets-output-file", dest="droplets_output_file", type=utils.isFileType(strict=False),
+            help="save the name, id, status and public IPv4 address of each droplet to this file as JSON")
+
+        provision_obj = Provision()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=provision_obj.run)
+
+
+    def _get_droplet_names(self, parsed_args) -> list:
+
+        if parsed_args.count and not parsed_args.name_prefix:
+            raise Exception("`--count` needs `--name-prefix`")
+
+        droplet_names = list(parsed_args.names)
+        droplet_names.extend(f"{parsed_args.name_prefix}-{iter_index}" for iter_index in range(1, parsed_args.count + 1))
+
+        if not droplet_names:
+            raise Exception("no droplets to create, give `--name` or `--count` and `--name-prefix`")
+
+        if len(set(droplet_names)) != len(droplet_names):
+            raise Exception(f"the droplet names aren't unique: `{droplet_names}`")
+
+        return droplet_names
+
+
+    def _render_user_data(self, config, parsed_args) -> str:
+
+        compression_cache = utils.get_compression_cache_from_args(parsed_args)
+        size_optimizer, size_limit = utils.get_size_optimizer_from_args(parsed_args)
+
+        # the API rejects anything over the limit, so always check it before creating anything
+        if size_optimizer is None:
+
+            from cloud_init_utils.size_optimizer import UserDataSizeOptimizer
+
+            size_optimizer = UserDataSizeOptimizer(try_all_encodings=False)
+            size_limit = constants.USER_DATA_DEFAULT_SIZE_LIMIT_BYTES
+
+        yaml_dict = config.cloud_init_settings.format_as_yaml_dict(
+            compression_cache, MustacheTemplateCache(), config.template_variables, size_optimizer)
+
+        utils.check_user_data_size(size_optimizer, yaml_dict, size_limit, "the droplets")
+
+        user_data_buffer = io.StringIO()
+        utils.write_yaml_file_from_dict(yaml_dict, user_data_buffer)
+
+        return user_data_buffer.getvalue()
+
+
+    def _create_droplets(self, client, droplet_names:list, user_data:str, tags:list, droplets_by_id:dict, parsed_args) -> list:
+        '''
+        create the droplets, a batch of names per request with `--threads` requests at once
+
+        @param tags - the tags to give the droplets
+        @param droplets_by_id - the droplets are added to this dict of droplet id -> droplet object
+        as they are created, so the caller still has the ones that were if this raises
+        @return a list of the names that failed
+        '''
+
+        batch_size = constants.DIGITALOCEAN_MAX_DROPLETS_PER_CREATE_REQUEST
+        name_batches = [droplet_names[iter_index:iter_index + batch_size] for iter_index in range(0, len(droplet_names), batch_size)]
+
+        failed_names = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parsed_args.threads, thread_name_prefix="provision") as executor:
+
+            future_to_names = dict()
+
+            for iter_names in name_batches:
+                future = executor.submit(client.create_droplets, iter_names, parsed_args.region, parsed_args.size,
+                    parsed_args.image, user_data, parsed_args.ssh_keys, tags)
+                future_to_names[future] = iter_names
+
+            for iter_future in concurrent.futures.as_completed(future_to_names):
+
+                names = future_to_names[iter_future]
+
+                try:
+                    created_droplets = iter_future.result()
+
+                except Exception as e:
+                    logger.error("failed to create the droplets `%s`: `%s`", names, e)
+                    failed_names.extend(names)
+                    continue
+
+                for iter_droplet in created_droplets:
+                    logger.info("created the droplet `%s` with the id `%s`", iter_droplet["name"], iter_droplet["id"])
+                    droplets_by_id[iter_droplet["id"]] = iter_droplet
+
+        return failed_names
+
+
+    def _wait_for_active(self, client, droplets_by_id:dict, run_tag:str, parsed_args) -> set:
+        '''
+        poll until every droplet is active, each poll lists the droplets a page at a time
+        rather than asking about each droplet on its own
+
+        @param droplets_by_id - the droplets, they are updated with what each poll returns
+        @param run_tag - the tag that only this run's droplets have
+        @return the ids of the droplets that didn't become active before the timeout
+        '''
+
+        from cloud_init_utils.digitalocean_api import get_droplet_public_ipv4
+
+        pending_ids = set(iter_id for iter_id, iter_droplet in droplets_by_id.items()
+            if iter_droplet.get("status") != constants.DIGITALOCEAN_DROPLET_ACTIVE_STATUS)
+
+        deadline = time.monotonic() + parsed_args.timeout
+
+        while pending_ids:
+
+            logger.info("waiting for `%s` droplets to become active", len(pending_ids))
+            time.sleep(parsed_args.poll_interval)
+
+            for iter_droplet in client.iter_droplets(run_tag):
+
+                if iter_droplet["id"] not in pending_ids:
+                    continue
+
+                droplets_by_id[iter_droplet["id"]] = iter_droplet
+
+                if iter_droplet.get("status") == constants.DIGITALOCEAN_DROPLET_ACTIVE_STATUS:
+                    logger.info("the droplet `%s` is active at `%s`", iter_droplet["name"], get_droplet_public_ipv4(iter_droplet))
+                    pending_ids.remove(iter_droplet["id"])
+
+            if pending_ids and time.monotonic() >= deadline:
+                logger.error("gave up waiting on the droplets `%s` after `%s` seconds",
+                    sorted(droplets_by_id[iter_id]["name"] for iter_id in pending_ids), parsed_args.timeout)
+                break
+
+        return pending_ids
+
+
+    def _write_droplets_output_file(self, droplets_by_id:dict, output_path):
+
+        from cloud_init_utils.digitalocean_api import get_droplet_public_ipv4
+
+        droplet_list = [{
+            "name": iter_droplet["name"],
+            "id": iter_droplet["id"],
+            "status": iter_droplet.get("status"),
+            "public_ipv4": get_droplet_public_ipv4(iter_droplet),
+        } for iter_droplet in sorted(droplets_by_id.values(), key=lambda x: x["name"])]
+
+        with OutputFileWriter(output_path) as f:
+            f.write(json.dumps(droplet_list, indent=4))
+            f.write("\n")
+
+        logger.info("wrote the droplets to `%s`", output_path)
+
+
+    def run(self, config, parsed_args):
+
+        # imported here since it pulls in requests
+        from cloud_init_utils.digitalocean_api import DigitalOceanClient
+
+        token = os.environ.get(parsed_args.token_env_var)
+        if not token:
+            raise Exception(f"the API token has to be in the `{parsed_args.token_env_var}` environment variable")
+
+        droplet_names = self._get_droplet_names(parsed_args)
+
+        # every droplet gets the same user-data, so it is only rendered once
+        user_data = self._render_user_data(config, parsed_args)
+
+        run_tag = f"{constants.PROVISION_RUN_TAG_PREFIX}{uuid.uuid4().hex[:12]}"
+        tags = list(parsed_args.tags) + [run_tag]
+
+        logger.info("creating `%s` droplets tagged `%s` with `%s` bytes of user-data", len(droplet_names), run_tag, len(user_data))
+
+        droplets_by_id = dict()
+
+        try:
+            with DigitalOceanClient(token, parsed_args.api_url, pool_size=parsed_args.threads) as client:
+
+                failed_names = self._create_droplets(client, droplet_names, user_data, tags, droplets_by_id, parsed_args)
+
+                timed_out_ids = set()
+                if not parsed_args.no_wait:
+                    timed_out_ids = self._wait_for_active(client, droplets_by_id, run_tag, parsed_args)
+
+        finally:
+            # the droplets that were created cost money whatever happened after, so always keep a record of them
+            if parsed_args.droplets_output_file and droplets_by_id:
+                self._write_droplets_output_file(droplets_by_id, parsed_args.droplets_output_file)
+
+        logger.info("created `%s` of `%s` droplets, `%s` failed, `%s` didn't become active in time",
+            len(droplets_by_id), len(droplet_names), len(failed_names), len(timed_out_ids))
+
+        if failed_names or timed_out_ids:
+            raise Exception(f"`{len(failed_names)}` droplets failed to be created and `{len(timed_out_ids)}` didn't become active in time")
@@ -0,0 +1,77 @@
+import os
+import logging
+import concurrent.futures
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+
+
+logger = logging.getLogger(__name__)
+
+class Serve:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("serve")
+
+        parser.add_argument("--bind", dest="bind_address", default=constants.SERVE_DEFAULT_BIND_ADDRESS,
+            help=f"the address to listen on, defaults to `{constants.SERVE_DEFAULT_BIND_ADDRESS}`")
+        parser.add_argument("--port", dest="port", type=int, default=constants.SERVE_DEFAULT_PORT,
+            help=f"the port to listen on, defaults to `{constants.SERVE_DEFAULT_PORT}`")
+        parser.add_argument("--config-dir", dest="config_dir", type=utils.isDirectoryType,
+            help="a folder with a `<instance id>.conf` config per instance, merged on top of the --config layers like another "
+            "--config would be, instances without one just get the --config layers")
+        parser.add_argument("--vendor-data", dest="vendor_data_path", type=utils.isFileType(strict=True),
+            help="a file to serve as the vendor-data of every instance, by default it is empty")
+        parser.add_argument("--workers", dest="workers", type=int, default=os.cpu_count(),
+            help="how many processes to render configs with, defaults to the number of CPUs")
+        parser.add_argument("--check-interval", dest="check_interval", type=float, default=constants.SERVE_DEFAULT_CHECK_INTERVAL_SECONDS,
+            help="how often (at most) to check whether an instance's config changed, in seconds, "
+            f"defaults to `{constants.SERVE_DEFAULT_CHECK_INTERVAL_SECONDS}`")
+
+        serve_obj = Serve()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=serve_obj.run, requires_config=False)
+
+
+    def run(self, config, parsed_args):
+
+        # imported here since only this subcommand needs them, and asyncio is slow to import
+        import asyncio
+        from cloud_init_utils.nocloud_server import NoCloudServer, init_worker
+
+        if parsed_args.config is None and parsed_args.config_dir is None:
+            raise Exception("`serve` needs `--config`, `--config-dir` or both")
+
+        # `config` was already loaded by main, but each instance is rendered from its file
+        # (with its own instance id) by the workers, so only the path is used here
+        vendor_data = parsed_args.vendor_data_path.read_bytes() if parsed_args.vendor_data_path is not None else b""
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.workers, initializer=init_worker) as executor:
+
+            nocloud_server = NoCloudServer(
+                config_dir=parsed_args.config_dir,
+                base_config_paths=parsed_args.config or [],
+                vendor_data=vendor_data,
+                executor=executor,
+                list_merge_strategies=utils.get_list_merge_strategies_from_args(parsed_args),
+                compression_cache=utils.get_compression_cache_from_args(parsed_args),
+                check_interval=parsed_args.check_interval)
+
+            try:
+                asyncio.run(nocloud_server.serve_forever(parsed_args.bind_address, parsed_args.port))
+
+            except KeyboardInterrupt:
+                logger.info("stopping")
+
+            finally:
+                logger.info("server stats: `%s`", dict(nocloud_server.stats))
@@ -0,0 +1,99 @@
+import sys
+import logging
+import pathlib
+import tempfile
+import contextlib
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import package_index
+from cloud_init_utils.config_schema import ConfigValidationException
+
+
+logger = logging.getLogger(__name__)
+
+class ValidateConfigs:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("validate_configs")
+
+        parser.add_argument("--config-dir", dest="config_dir", required=True, type=utils.isDirectoryType,
+            help="the folder of HOCON config files to validate")
+        parser.add_argument("--glob", dest="glob", default="**/*.conf",
+            help="the glob (relative to --config-dir) of the files to validate, defaults to `**/*.conf`")
+        parser.add_argument("--apt-packages-file", dest="apt_packages_paths", action="append", default=[], type=utils.isFileType(strict=True),
+            help="an apt `Packages` (or `Packages.gz` / `Packages.xz`) file of the target release, if given the packages_to_install "
+            "of every config have to be in one of them. Can be given more than once (like for main and universe), an index of each "
+            "one is built the first time it is used and kept in --cache-dir")
+
+        validate_configs_obj = ValidateConfigs()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=validate_configs_obj.run, requires_config=False)
+
+
+    def _open_package_indexes(self, parsed_args, exit_stack) -> list:
+
+        if parsed_args.no_cache:
+            # the index still has to live somewhere, it just doesn't outlive this run
+            cache_dir = pathlib.Path(exit_stack.enter_context(tempfile.TemporaryDirectory()))
+        else:
+            cache_root_dir = parsed_args.cache_dir if parsed_args.cache_dir is not None else utils.get_default_cache_root_dir()
+            cache_dir = cache_root_dir / constants.PACKAGE_INDEX_CACHE_FOLDER_NAME
+
+        return [exit_stack.enter_context(package_index.AptPackageIndex(iter_path, cache_dir)) for iter_path in parsed_args.apt_packages_paths]
+
+
+    def run(self, config, parsed_args):
+
+        with contextlib.ExitStack() as exit_stack:
+
+            package_indexes = self._open_package_indexes(parsed_args, exit_stack) if parsed_args.apt_packages_paths else []
+
+            self._validate(parsed_args, package_indexes)
+
+
+    def _validate(self, parsed_args, package_indexes):
+
+        config_paths = sorted(parsed_args.config_dir.glob(parsed_args.glob))
+
+        logger.info("validating `%s` config files in `%s`", len(config_paths), parsed_args.config_dir)
+
+        invalid_count = 0
+
+        for iter_config_path in config_paths:
+
+            try:
+                config_obj = utils.hocon_config_file_type(str(iter_config_path))
+                config_settings = utils.parse_config(config_obj)
+
+                if package_indexes:
+                    package_problems = package_index.get_package_problems(config_settings.cloud_init_settings.packages_to_install, package_indexes)
+
+                    if package_problems:
+                        raise ConfigValidationException(package_problems)
+
+            except ConfigValidationException as e:
+                invalid_count += 1
+                logger.error("`%s` has `%s` problem(s):\n%s", iter_config_path, len(e.errors),
+                    "\n".join(f"  * {iter_error}" for iter_error in e.errors))
+
+            except Exception as e:
+                invalid_count += 1
+                logger.error("`%s` failed to parse: `%s`", iter_config_path, e)
+
+        logger.info("validated `%s` config files, `%s` were invalid", len(config_paths), invalid_count)
+
+        # every problem is already logged above, so just exit non-zero rather than having main log a traceback
+        if invalid_count:
+            logger.error("`%s` of `%s` config files were invalid", invalid_count, len(config_paths))
+            sys.exit(1)
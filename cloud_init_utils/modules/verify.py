@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import logging
+import concurrent.futures
+
+import attr
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils.output_file import OutputFileWriter
+
+
+logger = logging.getLogger(__name__)
+
+class Verify:
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("verify")
+
+        parser.add_argument("--user-data", dest="user_data_paths", action="append", default=[], type=utils.isFileType(strict=True),
+            help="a user-data file to check against --config, can be given more than once")
+        parser.add_argument("--user-data-dir", dest="user_data_dir", type=utils.isDirectoryType,
+            help=f"check every `*{constants.FLEET_OUTPUT_FILE_EXTENSION}` file in this folder, like the output of create_yaml_fleet")
+        parser.add_argument("--hosts", dest="hosts_manifest", type=utils.isFileType(strict=True),
+            help="the hosts manifest the files were rendered with, each `<hostname>.yaml` is checked against --config with "
+            "that host's overrides, and hosts without a file are reported as missing")
+        parser.add_argument("--workers", dest="workers", type=int, default=os.cpu_count(),
+            help="how many processes to check the files with, defaults to the number of CPUs")
+        parser.add_argument("--report-file", dest="report_file", type=utils.isFileType(strict=False),
+            help="save the result of every file as JSON")
+
+        verify_obj = Verify()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=verify_obj.run)
+
+
+    def run(self, config, parsed_args):
+
+        # imported here since only this subcommand needs it
+        from cloud_init_utils import user_data_verifier
+
+        user_data_paths = list(parsed_args.user_data_paths)
+
+        if parsed_args.user_data_dir is not None:
+            user_data_paths.extend(sorted(parsed_args.user_data_dir.glob(f"*{constants.FLEET_OUTPUT_FILE_EXTENSION}")))
+
+        if not user_data_paths:
+            raise Exception("there are no user-data files to check, give `--user-data` or `--user-data-dir`")
+
+        # `config` is the merged layers already turned into settings, the workers need the
+        # ConfigTree so they can apply the host overrides to it like create_yaml_fleet does
+        base_config_obj = utils.parse_config_layers(parsed_args.config, utils.get_list_merge_strategies_from_args(parsed_args))
+
+        host_overrides_by_hostname = dict()
+        if parsed_args.hosts_manifest is not None:
+            for iter_host_overrides in utils.parse_hosts_manifest(parsed_args.hosts_manifest):
+                host_overrides_by_hostname[iter_host_overrides.hostname] = iter_host_overrides
+
+        logger.info("checking `%s` user-data files with `%s` workers", len(user_data_paths), parsed_args.workers)
+
+        reports = []
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.workers, initializer=user_data_verifier.init_worker,
+                initargs=(base_config_obj, host_overrides_by_hostname)) as executor:
+
+            chunk_size = max(1, len(user_data_paths) // (parsed_args.workers * 8))
+
+            reports.extend(executor.map(user_data_verifier.verify_user_data, user_data_paths, chunksize=chunk_size))
+
+        drifted_reports = [iter_report for iter_report in reports if iter_report.drift]
+        error_reports = [iter_report for iter_report in reports if iter_report.error is not None]
+        missing_hostnames = sorted(set(host_overrides_by_hostname) - set(iter_report.hostname for iter_report in reports))
+
+        # with thousands of files these could drown out everything else, --report-file has all of them
+        max_logged_files = constants.VERIFY_MAX_LOGGED_FILES
+
+        for iter_report in drifted_reports[:max_logged_files]:
+            logger.warning("`%s` has drifted: %s", iter_report.user_data_path, "; ".join(iter_report.drift))
+
+        for iter_report in error_reports[:max_logged_files]:
+            logger.error("failed to check `%s`: `%s`", iter_report.user_data_path, iter_report.error)
+
+        if missing_hostnames:
+            logger.warning("`%s` hosts in the manifest have no user-data file: `%s`",
+                len(missing_hostnames), ", ".join(missing_hostnames[:max_logged_files]))
+
+        logger.info("`%s` files checked, `%s` match, `%s` drifted, `%s` couldn't be read, `%s` hosts are missing",
+            len(reports), len(reports) - len(drifted_reports) - len(error_reports), len(drifted_reports), len(error_reports), len(missing_hostnames))
+
+        if parsed_args.report_file:
+
+            report = {
+                "files": [attr.asdict(iter_report) for iter_report in reports],
+                "missing_hostnames": missing_hostnames,
+            }
+
+            with OutputFileWriter(parsed_args.report_file) as f:
+                f.write(json.dumps(report, indent=4, sort_keys=True))
+                f.write("\n")
+
+            logger.info("wrote the report to `%s`", parsed_args.report_file)
+
+        # drift is the answer to the question rather than something going wrong, so it is already
+        # reported above, just exit non-zero rather than having main log a traceback
+        if drifted_reports or error_reports or missing_hostnames:
+            logger.error("`%s` user-data files don't match the config", len(drifted_reports) + len(error_reports) + len(missing_hostnames))
+            sys.exit(1)
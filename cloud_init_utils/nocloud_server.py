@@ -0,0 +1,491 @@
+import io
+import os
+import re
+import time
+import signal
+import asyncio
+import hashlib
+import logging
+import pathlib
+import collections
+import urllib.parse
+import typing
+
+import attr
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import gzip_compress
+
+
+logger = logging.getLogger(__name__)
+
+# instance ids end up in a file path, so nothing that could walk out of --config-dir
+_INSTANCE_ID_REGEX = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+_SEED_FILE_NAMES = (
+    constants.NOCLOUD_USER_DATA_FILE_NAME,
+    constants.NOCLOUD_META_DATA_FILE_NAME,
+    constants.NOCLOUD_VENDOR_DATA_FILE_NAME,
+)
+
+_STATUS_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class ServedFile:
+    '''
+    one response body, ready to be sent, along with its gzipped version
+    '''
+
+    content:bytes = attr.ib(repr=False)
+    etag:str = attr.ib()
+
+    # only set if gzipping it actually made it smaller
+    gzip_content:typing.Optional[bytes] = attr.ib(repr=False)
+    gzip_etag:typing.Optional[str] = attr.ib()
+
+
+def _make_served_file(content:bytes) -> ServedFile:
+
+    etag_hash = hashlib.sha256(content).hexdigest()[:32]
+
+    # zero mtime, so the same content always gets the same bytes (and a restart doesn't change the ETag)
+    gzip_content = gzip_compress(content, constants.GZIP_COMPRESSION_LEVEL)
+
+    if len(gzip_content) >= len(content):
+        return ServedFile(content=content, etag=f'"{etag_hash}"', gzip_content=None, gzip_etag=None)
+
+    # a different representation needs a different ETag
+    return ServedFile(content=content, etag=f'"{etag_hash}"', gzip_content=gzip_content, gzip_etag=f'"{etag_hash}-gzip"')
+
+
+def _get_source_signature(input_paths:typing.Sequence[str]) -> tuple:
+
+    signature = []
+
+    for iter_path in input_paths:
+        try:
+            path_stat = os.stat(iter_path)
+            signature.append((iter_path, path_stat.st_mtime_ns, path_stat.st_size))
+        except FileNotFoundError:
+            signature.append((iter_path, None, None))
+
+    return tuple(signature)
+
+
+def init_worker():
+    '''
+    the initializer for the worker processes that render the configs
+    '''
+
+    from cloud_init_utils import metrics
+
+    # Ctrl-C goes to the whole process group, the server shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # spans recorded in a worker would never be read, like with create_yaml_fleet
+    metrics.set_recorder(None)
+
+
+def _get_resolved_paths(config_paths:typing.Sequence[pathlib.Path]) -> typing.List[str]:
+    return [str(pathlib.Path(iter_path).resolve()) for iter_path in config_paths]
+
+
+def build_instance_files(config_paths:typing.Sequence[pathlib.Path], instance_id:str, vendor_data:bytes,
+    list_merge_strategies:typing.Mapping[str, typing.Any], compression_cache=None) -> tuple:
+    '''
+    render everything an instance is served, this runs in a worker process, so it is a
+    module level function so it can be pickled
+
+    @param config_paths - the config layers for the instance
+    @param instance_id - the instance id, it goes in the meta-data and is the
+    `instance_id` template variable (unless the config sets that itself)
+    @param vendor_data - the vendor-data for every instance
+    @param list_merge_strategies - how the lists of the layers are merged, see utils.merge_config_layers()
+    @param compression_cache - an optional CompressionCache
+    @return a tuple of a dict of file name -> ServedFile, the files that went into it and the signature of those files
+    '''
+
+    from cloud_init_utils import utils
+    from cloud_init_utils.config_cache import ParsedConfigCache
+    from cloud_init_utils.template_cache import MustacheTemplateCache
+
+    # the layers and everything they include, anything that can't be followed (like an
+    # include of a URL) means only the layers themselves are watched
+    cache_key_and_inputs = ParsedConfigCache.get_layered_cache_key(config_paths, list_merge_strategies)
+    input_paths = list(cache_key_and_inputs[1]) if cache_key_and_inputs is not None else _get_resolved_paths(config_paths)
+
+    # taken before reading the files, so a change while rendering still triggers a rebuild later
+    signature = _get_source_signature(input_paths)
+
+    # the layers every instance shares are only parsed once per worker
+    config = utils.parse_config(utils.parse_config_layers(config_paths, list_merge_strategies))
+
+    template_variables = {constants.SERVE_INSTANCE_ID_TEMPLATE_VARIABLE: instance_id, **config.template_variables}
+
+    yaml_dict = config.cloud_init_settings.format_as_yaml_dict(compression_cache, MustacheTemplateCache(), template_variables)
+
+    user_data_buffer = io.StringIO()
+    utils.write_yaml_file_from_dict(yaml_dict, user_data_buffer)
+
+    served_files = {
+        constants.NOCLOUD_USER_DATA_FILE_NAME: _make_served_file(user_data_buffer.getvalue().encode("utf-8")),
+        constants.NOCLOUD_META_DATA_FILE_NAME: _make_served_file(f"instance-id: {instance_id}\nlocal-hostname: {instance_id}\n".encode("utf-8")),
+        constants.NOCLOUD_VENDOR_DATA_FILE_NAME: _make_served_file(vendor_data),
+    }
+
+    return served_files, input_paths, signature
+
+
+class _InstanceEntry:
+
+    def __init__(self, config_paths:typing.Sequence[pathlib.Path], input_paths:typing.Sequence[str], signature:tuple,
+        served_files:typing.Optional[typing.Mapping[str, ServedFile]], error:typing.Optional[str]):
+
+        self.config_paths = config_paths
+        self.input_paths = input_paths
+        self.signature = signature
+
+        # a config that fails to render is remembered too, so it isn't rendered again for
+        # every request until it changes
+        self.served_files = served_files
+        self.error = error
+
+        self.checked_at = time.monotonic()
+
+
+def _etag_matches(if_none_match:typing.Optional[str], etag:str) -> bool:
+
+    if if_none_match is None:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison, so `W/` doesn't matter
+    return any(iter_tag.strip().removeprefix("W/") == etag for iter_tag in if_none_match.split(","))
+
+
+def _accepts_gzip(accept_encoding:typing.Optional[str]) -> bool:
+
+    if accept_encoding is None:
+        return False
+
+    for iter_coding in accept_encoding.split(","):
+
+        coding, _, parameters = iter_coding.partition(";")
+
+        if coding.strip().lower() == "gzip":
+            return parameters.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+
+    return False
+
+
+class NoCloudServer:
+    '''
+    serves the NoCloud seed files (user-data, meta-data and vendor-data) for each
+    instance id out of memory, at `/<instance id>/user-data` and so on
+
+    an instance is rendered from the `--config` layers with its `<instance id>.conf` (if
+    there is one) as the last layer
+
+    each instance is rendered once, on a worker pool so the event loop keeps answering
+    everyone else, and is only rendered again when one of the files that went into it
+    changes. Requests for an instance that is being rendered all wait on the same render
+
+    an instance id without its own config still gets rendered, since the instance id can be
+    used in the templates, but only the most recently used `max_base_only_entries` of those
+    are kept, so asking for made up instance ids can't grow the server forever
+    '''
+
+    def __init__(self, config_dir:typing.Optional[pathlib.Path], base_config_paths:typing.Sequence[pathlib.Path], vendor_data:bytes,
+        executor, list_merge_strategies:typing.Mapping[str, typing.Any], compression_cache=None,
+        check_interval:float=constants.SERVE_DEFAULT_CHECK_INTERVAL_SECONDS, max_base_only_entries:int=constants.SERVE_MAX_BASE_ONLY_ENTRIES):
+        '''
+        @param config_dir - a folder with a `<instance id>.conf` config layer per instance
+        @param base_config_paths - the config layers every instance starts from, these are all
+        an instance id that isn't in `config_dir` gets
+        @param vendor_data - the vendor-data for every instance
+        @param list_merge_strategies - how the lists of the layers are merged, see utils.merge_config_layers()
+        @param executor - the concurrent.futures executor to render on
+        @param compression_cache - an optional CompressionCache
+        @param check_interval - how often (at most) to check if an instance's files changed
+        @param max_base_only_entries - how many instances without their own config to keep rendered
+        '''
+
+        self.config_dir = config_dir
+        self.base_config_paths = list(base_config_paths)
+        self.vendor_data = vendor_data
+        self.executor = executor
+        self.list_merge_strategies = list_merge_strategies
+        self.compression_cache = compression_cache
+        self.check_interval = check_interval
+        self.max_base_only_entries = max_base_only_entries
+
+        self.stats = collections.Counter()
+
+        # the instances with their own config, there are only as many of these as files in `config_dir`
+        self._entries = dict()
+
+        # the ones with just the base layers, least recently used first
+        self._base_only_entries = collections.OrderedDict()
+        self._pending_builds = dict()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(config_dir={self.config_dir!r}, base_config_paths={self.base_config_paths!r})"
+
+    def get_config_paths(self, instance_id:str) -> typing.Optional[typing.Sequence[pathlib.Path]]:
+        '''
+        @return the config layers for an instance, or None if there aren't any
+        '''
+
+        if self.config_dir is not None:
+            config_path = self.config_dir / f"{instance_id}.conf"
+            if config_path.is_file():
+                return self.base_config_paths + [config_path]
+
+        return self.base_config_paths or None
+
+    def _is_stale(self, entry:_InstanceEntry) -> bool:
+
+        now = time.monotonic()
+        if now - entry.checked_at < self.check_interval:
+            return False
+
+        entry.checked_at = now
+
+        return _get_source_signature(entry.input_paths) != entry.signature
+
+    async def _build_entry(self, instance_id:str, config_paths:typing.Sequence[pathlib.Path]) -> _InstanceEntry:
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        try:
+            served_files, input_paths, signature = await loop.run_in_executor(
+                self.executor, build_instance_files, config_paths, instance_id, self.vendor_data, self.list_merge_strategies, self.compression_cache)
+
+            entry = _InstanceEntry(config_paths, input_paths, signature, served_files, None)
+
+            logger.info("rendered `%s` from `%s` in `%.3f` seconds", instance_id, config_paths[-1], time.perf_counter() - started)
+
+        except Exception as e:
+
+            input_paths = _get_resolved_paths(config_paths)
+            entry = _InstanceEntry(config_paths, input_paths, _get_source_signature(input_paths), None, str(e))
+
+            logger.error("failed to render `%s` from `%s`: `%s`", instance_id, config_paths[-1], e)
+
+        self.stats["renders"] += 1
+        self._store_entry(instance_id, entry)
+
+        return entry
+
+    def _store_entry(self, instance_id:str, entry:_InstanceEntry):
+
+        # the instance's `.conf` can show up (or go away) after it was first rendered
+        self._entries.pop(instance_id, None)
+        self._base_only_entries.pop(instance_id, None)
+
+        if entry.config_paths != self.base_config_paths:
+            self._entries[instance_id] = entry
+            return
+
+        self._base_only_entries[instance_id] = entry
+
+        while len(self._base_only_entries) > self.max_base_only_entries:
+            self._base_only_entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _get_stored_entry(self, instance_id:str) -> typing.Optional[_InstanceEntry]:
+
+        entry = self._entries.get(instance_id)
+        if entry is not None:
+            return entry
+
+        entry = self._base_only_entries.get(instance_id)
+        if entry is not None:
+            self._base_only_entries.move_to_end(instance_id)
+
+        return entry
+
+    async def get_entry(self, instance_id:str) -> typing.Optional[_InstanceEntry]:
+        '''
+        @return the up to date entry for an instance, rendering it if needed, or None if
+        there is no config for it
+        '''
+
+        config_paths = self.get_config_paths(instance_id)
+        if config_paths is None:
+            return None
+
+        entry = self._get_stored_entry(instance_id)
+
+        if entry is not None and entry.config_paths == config_paths and not self._is_stale(entry):
+            return entry
+
+        pending_build = self._pending_builds.get(instance_id)
+
+        if pending_build is None:
+
+            pending_build = asyncio.ensure_future(self._build_entry(instance_id, config_paths))
+            self._pending_builds[instance_id] = pending_build
+            pending_build.add_done_callback(lambda _: self._pending_builds.pop(instance_id, None))
+
+        return await pending_build
+
+    async def prerender(self):
+        '''
+        render every instance in `config_dir` up front, so the first boot of each doesn't wait on it
+        '''
+
+        if self.config_dir is None:
+            return
+
+        instance_ids = sorted(iter_path.stem for iter_path in self.config_dir.glob("*.conf") if _INSTANCE_ID_REGEX.match(iter_path.stem))
+
+        logger.info("rendering `%s` instances from `%s`", len(instance_ids), self.config_dir)
+
+        await asyncio.gather(*(self.get_entry(iter_instance_id) for iter_instance_id in instance_ids))
+
+    async def _get_response(self, method:str, target:str, headers:typing.Mapping[str, str]) -> tuple:
+        '''
+        @return a tuple of the status code, a dict of extra headers and the body
+        '''
+
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+
+        path_parts = urllib.parse.urlsplit(target).path.strip("/").split("/")
+
+        if len(path_parts) != 2 or not _INSTANCE_ID_REGEX.match(path_parts[0]) or path_parts[1] not in _SEED_FILE_NAMES:
+            return 404, dict(), b""
+
+        instance_id, file_name = path_parts
+
+        entry = await self.get_entry(instance_id)
+
+        if entry is None:
+            return 404, dict(), b""
+
+        if entry.error is not None:
+            return 500, dict(), b""
+
+        served_file = entry.served_files[file_name]
+
+        response_headers = {"Content-Type": "text/plain; charset=utf-8", "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+        if served_file.gzip_content is not None and _accepts_gzip(headers.get("accept-encoding")):
+            body, etag = served_file.gzip_content, served_file.gzip_etag
+            response_headers["Content-Encoding"] = "gzip"
+        else:
+            body, etag = served_file.content, served_file.etag
+
+        response_headers["ETag"] = etag
+
+        if _etag_matches(headers.get("if-none-match"), etag):
+            self.stats["not_modified"] += 1
+            response_headers.pop("Content-Encoding", None)
+            return 304, response_headers, b""
+
+        return 200, response_headers, body
+
+    async def _read_request(self, reader:asyncio.StreamReader) -> typing.Optional[tuple]:
+        '''
+        @return a tuple of the method, target, HTTP version and a dict of the (lower case) headers,
+        or None if the connection was closed (or idle for too long)
+        '''
+
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), constants.SERVE_KEEP_ALIVE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+
+        if not request_line:
+            return None
+
+        request_parts = request_line.decode("latin-1").split()
+        if len(request_parts) != 3:
+            raise ValueError(f"bad request line `{request_line!r}`")
+
+        headers = dict()
+
+        while True:
+
+            header_line = await asyncio.wait_for(reader.readline(), constants.SERVE_KEEP_ALIVE_TIMEOUT_SECONDS)
+
+            if header_line in (b"\r\n", b"\n", b""):
+                break
+
+            name, _, value = header_line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        return request_parts[0], request_parts[1], request_parts[2], headers
+
+    async def handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+
+        peer = writer.get_extra_info("peername")
+
+        try:
+            while True:
+
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    logger.debug("bad request from `%s`: `%s`", peer, e)
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    break
+
+                if request is None:
+                    break
+
+                method, target, http_version, headers = request
+
+                # we never read request bodies, so a request with one can't be followed by another
+                has_body = "content-length" in headers or "transfer-encoding" in headers
+
+                connection_header = headers.get("connection", "").lower()
+                keep_alive = not has_body and (connection_header == "keep-alive" if http_version == "HTTP/1.0" else connection_header != "close")
+
+                try:
+                    status_code, response_headers, body = await self._get_response(method, target, headers)
+                except Exception:
+                    logger.exception("failed to answer `%s %s` from `%s`", method, target, peer)
+                    status_code, response_headers, body = 500, dict(), b""
+
+                self.stats["requests"] += 1
+                self.stats[f"status_{status_code}"] += 1
+
+                logger.debug("`%s` `%s %s`: `%s`, `%s` bytes", peer, method, target, status_code, len(body))
+
+                response_headers["Content-Length"] = str(len(body))
+                response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+                header_lines = "".join(f"{iter_name}: {iter_value}\r\n" for iter_name, iter_value in response_headers.items())
+                writer.write(f"HTTP/1.1 {status_code} {_STATUS_REASONS[status_code]}\r\n{header_lines}\r\n".encode("latin-1"))
+
+                if method != "HEAD":
+                    writer.write(body)
+
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve_forever(self, bind_address:str, port:int):
+
+        await self.prerender()
+
+        server = await asyncio.start_server(self.handle_connection, bind_address, port)
+
+        for iter_socket in server.sockets:
+            logger.info("serving NoCloud seed files at `http://%s:%s/<instance id>/`", *iter_socket.getsockname()[:2])
+
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,178 @@
+import os
+import pathlib
+import logging
+import tempfile
+import functools
+import typing
+
+from cloud_init_utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_default_file_mode() -> int:
+
+    # the only way to read the umask is to set it, so do that once and put it back
+    current_umask = os.umask(0)
+    os.umask(current_umask)
+
+    return 0o666 & ~current_umask
+
+
+class OutputFileWriter:
+    '''
+    a file like object for writing an output file that only touches the file when what
+    is written is different from what is already there
+
+    while the new content matches the existing file it is just compared against it, so an
+    unchanged file is only ever read. At the first difference the matching part is copied
+    to a temp file next to the output file and the rest is written there, and close()
+    renames it over the output file, so nothing ever sees a half written file
+
+    use it as a context manager, if the block raises the output file is left alone
+
+        with OutputFileWriter(path) as f:
+            f.write(...)
+
+        if f.changed: ...
+    '''
+
+    # ruamel writes str to streams that have an encoding, rather than encoding it itself
+    encoding = "utf-8"
+
+    def __init__(self, output_path:pathlib.Path, file_mode:typing.Optional[int]=None):
+        '''
+        @param output_path - the file to write
+        @param file_mode - the permissions for the file if it is changed, defaults to the
+        permissions of the existing file, or the same as open() would use for a new one
+        '''
+
+        self.output_path = pathlib.Path(output_path)
+        self.file_mode = file_mode
+
+        # None until close(), then whether the output file was replaced
+        self.changed = None
+
+        # everything passed to write(), whether or not it matched the existing file
+        self.bytes_written = 0
+
+        self._matched_size = 0
+        self._temp_file = None
+        self._temp_path = None
+
+        try:
+            self._existing_file = open(self.output_path, "rb")
+        except FileNotFoundError:
+            self._existing_file = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(output_path={self.output_path!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _start_writing(self):
+
+        fd, self._temp_path = tempfile.mkstemp(dir=self.output_path.parent, prefix=f".{self.output_path.name}.")
+        self._temp_file = os.fdopen(fd, "wb")
+
+        if self._existing_file is not None:
+
+            # the new content is the same as the existing file up to this point
+            self._existing_file.seek(0)
+
+            remaining_size = self._matched_size
+            while remaining_size:
+                chunk = self._existing_file.read(min(remaining_size, 1024 * 1024))
+                self._temp_file.write(chunk)
+                remaining_size -= len(chunk)
+
+    def write(self, data:typing.Union[str, bytes]):
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.bytes_written += len(data)
+
+        if self._temp_file is None:
+
+            if self._existing_file is not None:
+
+                existing_chunk = self._existing_file.read(len(data))
+
+                if existing_chunk == data:
+                    self._matched_size += len(data)
+                    return
+
+            self._start_writing()
+
+        self._temp_file.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        '''
+        finish writing, replacing the output file if the content changed
+        '''
+
+        if self.changed is not None:
+            return
+
+        with metrics.span("write_output", path=str(self.output_path)) as metrics_span:
+            metrics_span.set_bytes(bytes_out=self.bytes_written)
+            self._close()
+
+    def _close(self):
+
+        try:
+            if self._temp_file is None:
+
+                # everything matched so far, it is only unchanged if the existing file doesn't have more after it
+                if self._existing_file is not None and self._existing_file.read(1) == b"":
+
+                    if self.file_mode is not None and os.fstat(self._existing_file.fileno()).st_mode & 0o7777 != self.file_mode:
+                        os.chmod(self.output_path, self.file_mode)
+
+                    self.changed = False
+                    return
+
+                self._start_writing()
+
+            if self.file_mode is not None:
+                file_mode = self.file_mode
+            elif self._existing_file is not None:
+                file_mode = os.fstat(self._existing_file.fileno()).st_mode & 0o7777
+            else:
+                file_mode = _get_default_file_mode()
+
+            self._temp_file.close()
+            os.chmod(self._temp_path, file_mode)
+            os.replace(self._temp_path, self.output_path)
+            self._temp_path = None
+
+            self.changed = True
+
+        finally:
+            self._discard()
+
+    def _discard(self):
+
+        if self._existing_file is not None:
+            self._existing_file.close()
+
+        if self._temp_file is not None:
+            self._temp_file.close()
+
+        if self._temp_path is not None:
+            pathlib.Path(self._temp_path).unlink(missing_ok=True)
+            self._temp_path = None
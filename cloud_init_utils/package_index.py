@@ -0,0 +1,276 @@
+import os
+import gzip
+import lzma
+import mmap
+import bisect
+import struct
+import difflib
+import hashlib
+import pathlib
+import tempfile
+import logging
+import typing
+
+from cloud_init_utils import constants
+
+
+logger = logging.getLogger(__name__)
+
+# the magic, the format version and the number of entries, then an offset for each entry
+# (plus one for the end) into the newline separated, sorted entries that follow
+_HEADER_STRUCT = struct.Struct("<8sII")
+_OFFSET_STRUCT = struct.Struct("<I")
+
+# apt treats a package name or version with one of these in it (like `lib*-dev` or `foo=1.2*`) as a glob
+_APT_GLOB_CHARACTERS = ("*", "?", "[")
+
+
+def _open_packages_file(packages_path:pathlib.Path) -> typing.BinaryIO:
+
+    if packages_path.suffix == ".gz":
+        return gzip.open(packages_path, "rb")
+    elif packages_path.suffix == ".xz":
+        return lzma.open(packages_path, "rb")
+
+    return open(packages_path, "rb")
+
+
+def iter_packages_file_entries(packages_path:pathlib.Path) -> typing.Iterator[bytes]:
+    '''
+    get the index entries out of an apt `Packages` file (or `Packages.gz` / `Packages.xz`), that
+    is the name and `name=version` of every package, and the name of every virtual package
+    one of them provides
+
+    @param packages_path - the Packages file
+    @return an iterator of the entries as bytes, with duplicates
+    '''
+
+    package_name = None
+
+    with _open_packages_file(packages_path) as f:
+
+        # the fields we want are always one line, so there is no need to parse whole stanzas
+        for iter_line in f:
+
+            if iter_line.startswith(b"Package:"):
+                package_name = iter_line[8:].strip()
+                yield package_name
+
+            elif iter_line.startswith(b"Version:") and package_name is not None:
+                yield package_name + b"=" + iter_line[8:].strip()
+
+            elif iter_line.startswith(b"Provides:"):
+                for iter_provided in iter_line[9:].split(b","):
+
+                    # `foo (= 1.0)`
+                    provided_name = iter_provided.strip().split(b" ", 1)[0]
+                    if provided_name:
+                        yield provided_name
+
+            elif not iter_line.strip():
+                package_name = None
+
+
+def build_package_index(packages_path:pathlib.Path, index_path:pathlib.Path) -> int:
+    '''
+    build the index file for an apt Packages file, see AptPackageIndex
+
+    @param packages_path - the Packages file
+    @param index_path - where to write the index, it is written to a temp file and
+    renamed so other processes never see a partial index
+    @return the number of entries in the index
+    '''
+
+    entries = sorted(set(iter_packages_file_entries(packages_path)))
+    entries_blob = b"\n".join(entries)
+
+    offsets = []
+    current_offset = 0
+
+    for iter_entry in entries:
+        offsets.append(current_offset)
+        current_offset += len(iter_entry) + 1
+
+    offsets.append(current_offset)
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=index_path.parent, prefix=".")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER_STRUCT.pack(constants.PACKAGE_INDEX_MAGIC, constants.PACKAGE_INDEX_FORMAT_VERSION, len(entries)))
+            f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+            f.write(entries_blob)
+            f.write(b"\n")
+
+        os.replace(temp_path, index_path)
+
+    except BaseException:
+        pathlib.Path(temp_path).unlink(missing_ok=True)
+        raise
+
+    return len(entries)
+
+
+class _MappedEntries:
+    '''
+    a read only sequence of the entries in a mapped index file, so bisect can search it
+    without reading the entries into memory
+    '''
+
+    def __init__(self, mapped_file:mmap.mmap, entry_count:int):
+
+        self._mapped_file = mapped_file
+        self._entry_count = entry_count
+        self._offsets_start = _HEADER_STRUCT.size
+        self._entries_start = self._offsets_start + (entry_count + 1) * _OFFSET_STRUCT.size
+
+    def __len__(self):
+        return self._entry_count
+
+    def __getitem__(self, index:int) -> bytes:
+
+        start, end = struct.unpack_from("<II", self._mapped_file, self._offsets_start + index * _OFFSET_STRUCT.size)
+
+        # the end offset is the start of the next entry, which is one past the newline
+        return self._mapped_file[self._entries_start + start:self._entries_start + end - 1]
+
+    def iter_with_prefix(self, prefix:bytes) -> typing.Iterator[bytes]:
+
+        for iter_index in range(bisect.bisect_left(self, prefix), self._entry_count):
+
+            entry = self[iter_index]
+            if not entry.startswith(prefix):
+                return
+
+            yield entry
+
+
+class AptPackageIndex:
+    '''
+    the package names (and versions) in an apt Packages file, as a sorted on disk index
+    that is memory mapped and binary searched
+
+    the index is built the first time a Packages file is seen and kept in the cache
+    folder, keyed by the path, size and mtime of the Packages file, so checking the packages
+    of thousands of configs never parses the (big) Packages file again
+    '''
+
+    def __init__(self, packages_path:pathlib.Path, cache_dir:pathlib.Path):
+        '''
+        @param packages_path - the apt Packages (or Packages.gz / Packages.xz) file
+        @param cache_dir - the folder to keep the index in
+        '''
+
+        self.packages_path = pathlib.Path(packages_path).resolve()
+        self.index_path = pathlib.Path(cache_dir) / f"{self.get_cache_key(self.packages_path)}{constants.PACKAGE_INDEX_FILE_EXTENSION}"
+
+        if not self.index_path.is_file():
+            entry_count = build_package_index(self.packages_path, self.index_path)
+            logger.info("built the package index `%s` with `%s` entries for `%s`", self.index_path, entry_count, self.packages_path)
+
+        with open(self.index_path, "rb") as f:
+            self._mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, entry_count = _HEADER_STRUCT.unpack_from(self._mapped_file, 0)
+
+        if magic != constants.PACKAGE_INDEX_MAGIC or format_version != constants.PACKAGE_INDEX_FORMAT_VERSION:
+            self.close()
+            raise Exception(f"`{self.index_path}` isn't a package index this version can read, delete it so it is built again")
+
+        self._entries = _MappedEntries(self._mapped_file, entry_count)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(packages_path={self.packages_path!r}, index_path={self.index_path!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entry:str) -> bool:
+
+        entry_bytes = entry.encode("utf-8")
+        index = bisect.bisect_left(self._entries, entry_bytes)
+
+        return index < len(self._entries) and self._entries[index] == entry_bytes
+
+    def close(self):
+        self._mapped_file.close()
+
+    @staticmethod
+    def get_cache_key(packages_path:pathlib.Path) -> str:
+
+        path_stat = packages_path.stat()
+
+        hasher = hashlib.sha256()
+        hasher.update(f"{constants.PACKAGE_INDEX_FORMAT_VERSION}\0{packages_path}\0{path_stat.st_size}\0{path_stat.st_mtime_ns}".encode("utf-8"))
+
+        return hasher.hexdigest()
+
+    def get_close_matches(self, package_name:str) -> typing.List[str]:
+        '''
+        @return the package names that look the most like `package_name`, for when it isn't in the index
+        '''
+
+        if not package_name:
+            return []
+
+        # only the names starting with the same character, checking every name is too slow
+        candidates = [iter_entry.decode("utf-8") for iter_entry in self._entries.iter_with_prefix(package_name[0].encode("utf-8"))
+            if b"=" not in iter_entry]
+
+        return difflib.get_close_matches(package_name, candidates, n=constants.PACKAGE_INDEX_MAX_SUGGESTIONS)
+
+
+def get_package_problems(packages_to_install:typing.Sequence, package_indexes:typing.Sequence[AptPackageIndex]) -> typing.List[str]:
+    '''
+    check the `packages_to_install` of a config against the package indexes
+
+    @param packages_to_install - the list from the config, each one is a package name (which
+    can have an `=version`, `:arch` or `/release`) or a list of the name and the version
+    @param package_indexes - the AptPackageIndex objects for the target release, a package only
+    has to be in one of them
+    @return a list of the problems, empty if every package was found
+    '''
+
+    problems = []
+
+    for iter_package in packages_to_install:
+
+        if isinstance(iter_package, (list, tuple)):
+            if len(iter_package) != 2:
+                problems.append(f"`{iter_package}` should be a package name and a version")
+                continue
+
+            package_name, version = str(iter_package[0]), str(iter_package[1])
+
+        else:
+            package_name, _, version = str(iter_package).strip().partition("=")
+
+        # apt works these out itself, so a name with one can't be checked, and a version with one (like
+        # `foo=1.2*`) is left to apt too
+        if any(iter_character in package_name for iter_character in _APT_GLOB_CHARACTERS):
+            continue
+
+        if any(iter_character in version for iter_character in _APT_GLOB_CHARACTERS):
+            version = ""
+
+        package_name = package_name.split("/", 1)[0].split(":", 1)[0]
+
+        if not any(package_name in iter_index for iter_index in package_indexes):
+
+            close_matches = sorted(set(iter_match for iter_index in package_indexes for iter_match in iter_index.get_close_matches(package_name)))
+            suggestion = f", did you mean `{', '.join(close_matches)}`?" if close_matches else ""
+
+            problems.append(f"the package `{package_name}` isn't in the package indexes{suggestion}")
+
+        elif version and not any(f"{package_name}={version}" in iter_index for iter_index in package_indexes):
+            problems.append(f"the package `{package_name}` doesn't have the version `{version}` in the package indexes")
+
+    return problems
@@ -0,0 +1,159 @@
+import zlib
+import struct
+import logging
+import threading
+import collections
+import concurrent.futures
+import typing
+
+from cloud_init_utils import constants
+
+
+logger = logging.getLogger(__name__)
+
+# deflate can refer back at most this far, so this much of the previous chunk is
+# all the next one needs as its dictionary
+_DEFLATE_WINDOW_SIZE = 32 * 1024
+
+
+def _get_gzip_header(compression_level:int) -> bytes:
+
+    # the same header (mtime of 0, XFL for the level, OS of this platform) that
+    # zlib writes for a single stream, so the only difference is how the deflate data is split up
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 31)
+    return (compressor.compress(b"") + compressor.flush())[:10]
+
+
+def _compress_chunk(chunk:bytes, dictionary:typing.Optional[bytes], compression_level:int, is_last_chunk:bool) -> bytes:
+    '''
+    deflate one chunk on its own, zlib releases the GIL while it does this so chunks on
+    different threads really do get compressed at the same time
+
+    every chunk but the last ends with a sync flush, which ends on a byte boundary
+    without marking the block as the final one, so the chunks can just be concatenated
+    '''
+
+    if dictionary:
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if is_last_chunk else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipCompressor:
+    '''
+    gzip like pigz does, the input is split into fixed size chunks that are deflated on a
+    thread pool (primed with the end of the chunk before, so the ratio barely changes)
+    and stitched back together into a single gzip stream that anything can decompress
+
+    the output only depends on the compression level and the chunk size, not on how many
+    threads there are, so it is as reproducible as the single threaded output is
+    '''
+
+    def __init__(self, threads:int, chunk_size:int=constants.PARALLEL_GZIP_DEFAULT_CHUNK_SIZE):
+
+        if threads < 1:
+            raise ValueError(f"threads has to be at least 1, not `{threads}`")
+        if chunk_size < _DEFLATE_WINDOW_SIZE:
+            raise ValueError(f"chunk_size has to be at least `{_DEFLATE_WINDOW_SIZE}`, not `{chunk_size}`")
+
+        self.threads = threads
+        self.chunk_size = chunk_size
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(threads={self.threads!r}, chunk_size={self.chunk_size!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+
+        # the pool is shared by every payload, so it is only started once something is big enough to need it
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="gzip")
+            return self._executor
+
+    def close(self):
+
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def get_compression_settings(self, compression_level:int) -> str:
+        '''
+        @return the string that describes this output for CompressionCache, it differs from
+        the single threaded one since the deflate data is split up differently
+        '''
+
+        return f"gzip:level={compression_level}:mtime=0:chunk_size={self.chunk_size}"
+
+    def iter_compress(self, chunks:typing.Iterable[bytes], compression_level:int) -> typing.Iterator[bytes]:
+        '''
+        compress an iterable of chunks into a single gzip stream, up to twice as many chunks
+        as there are threads are read ahead, so memory use is bounded no matter how much is compressed
+
+        @param chunks - the input, every chunk but the last should be `chunk_size` long so
+        the output doesn't depend on how the input was read
+        @param compression_level - the gzip compression level
+        @return an iterator of pieces of the gzip stream
+        '''
+
+        executor = self._get_executor()
+
+        pending_futures = collections.deque()
+        max_pending_futures = self.threads * 2
+
+        crc = 0
+        total_size = 0
+        previous_chunk = None
+        dictionary = None
+
+        yield _get_gzip_header(compression_level)
+
+        # a chunk is only submitted once the next one has been read, since we need to
+        # know if it is the last one
+        for iter_chunk in chunks:
+
+            if not iter_chunk:
+                continue
+
+            if previous_chunk is not None:
+
+                pending_futures.append(executor.submit(_compress_chunk, previous_chunk, dictionary, compression_level, False))
+                dictionary = bytes(previous_chunk[-_DEFLATE_WINDOW_SIZE:])
+
+                while len(pending_futures) >= max_pending_futures:
+                    yield pending_futures.popleft().result()
+
+            crc = zlib.crc32(iter_chunk, crc)
+            total_size += len(iter_chunk)
+            previous_chunk = iter_chunk
+
+        # an empty input still needs a final block
+        pending_futures.append(executor.submit(_compress_chunk, previous_chunk or b"", dictionary, compression_level, True))
+
+        while pending_futures:
+            yield pending_futures.popleft().result()
+
+        yield struct.pack("<II", crc, total_size & 0xffffffff)
+
+    def compress(self, raw_content_bytes:bytes, compression_level:int) -> bytes:
+        '''
+        @param raw_content_bytes - the bytes to compress
+        @param compression_level - the gzip compression level
+        @return the gzipped bytes
+        '''
+
+        content_view = memoryview(raw_content_bytes)
+        chunks = (content_view[iter_offset:iter_offset + self.chunk_size] for iter_offset in range(0, len(content_view), self.chunk_size))
+
+        return b"".join(self.iter_compress(chunks, compression_level))
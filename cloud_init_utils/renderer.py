@@ -0,0 +1,211 @@
+import io
+import threading
+import logging
+import typing
+
+import attr
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import config_schema
+from cloud_init_utils.config_schema import ConfigValidationException
+from cloud_init_utils.model import ConfigFileSettings, HostOverrides, UserDataOutputFormatEnum, MimePartTypeEnum, MimePart
+from cloud_init_utils.template_cache import MustacheTemplateCache
+
+
+logger = logging.getLogger(__name__)
+
+# the renderer render_user_data() uses, created the first time it is called
+_default_renderer = None
+_default_renderer_lock = threading.Lock()
+
+
+def _apply_override(value, key_parts:typing.Sequence[str], override_value, key_path:str, errors:list):
+    '''
+    @return a copy of `value` (one of the attrs classes from model.py, or a plain dict like the
+    template variables) with the override applied
+    '''
+
+    if attr.has(type(value)):
+
+        schema = config_schema.get_schema(type(value))
+        field = schema.get_field(key_parts[0])
+
+        if field is None:
+            errors.append(f"`{key_path}` isn't a key in the config")
+            return value
+
+        if len(key_parts) == 1:
+
+            # imported here since pyhocon is slow to import
+            from pyhocon import ConfigFactory
+
+            # go through the schema like the value was in the HOCON file, so a dict becomes the
+            # model class it should be and `yes` is a boolean and such
+            hocon_value = dict.get(ConfigFactory.from_dict({"value": override_value}), "value")
+            new_field_value = schema.convert_field_value(field, hocon_value, key_path, errors)
+
+        else:
+            new_field_value = _apply_override(getattr(value, field.attribute_name), key_parts[1:], override_value, key_path, errors)
+
+        try:
+            return attr.evolve(value, **{field.attribute_name: new_field_value})
+        except ValueError as e:
+            errors.append(f"`{key_path}` is invalid: {e}")
+            return value
+
+    if value is None or isinstance(value, typing.Mapping):
+
+        new_value = dict(value) if value is not None else dict()
+
+        if len(key_parts) == 1:
+            new_value[key_parts[0]] = override_value
+        else:
+            new_value[key_parts[0]] = _apply_override(new_value.get(key_parts[0]), key_parts[1:], override_value, key_path, errors)
+
+        return new_value
+
+    errors.append(f"`{key_path}` can't be overridden, it is inside a `{type(value).__name__}`")
+    return value
+
+
+def apply_settings_overrides(config_settings:ConfigFileSettings,
+    overrides:typing.Union[typing.Mapping[str, typing.Any], HostOverrides]) -> ConfigFileSettings:
+    '''
+    the ConfigFileSettings version of utils.apply_host_overrides(), for when the config was
+    already parsed, each override replaces the whole value at its key
+
+    @param config_settings - the ConfigFileSettings, it is left untouched
+    @param overrides - a dict of dotted HOCON keys (relative to the top level group, like in a
+    hosts manifest) to the value they should have, or a HostOverrides
+    @return a new ConfigFileSettings, or raises ConfigValidationException with every override that
+    doesn't fit the config
+    '''
+
+    if isinstance(overrides, HostOverrides):
+        overrides = overrides.overrides
+
+    errors = []
+
+    for iter_key, iter_value in overrides.items():
+
+        key_path = f"{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}.{iter_key}"
+        config_settings = _apply_override(config_settings, iter_key.split("."), iter_value, key_path, errors)
+
+    if errors:
+        raise ConfigValidationException(errors)
+
+    return config_settings
+
+
+class UserDataRenderer:
+    '''
+    renders user-data in process, for programs that use this as a library rather than
+    running cli.py for every instance
+
+    a renderer keeps the things that are worth keeping between renders: the compiled
+    mustache templates and the compression cache, and the YAML dumper is kept per thread
+    by utils.write_yaml_file_from_dict(). So make one and reuse it, it is safe to call
+    render() from several threads at once
+    '''
+
+    def __init__(self, compression_cache=None, output_format:UserDataOutputFormatEnum=UserDataOutputFormatEnum.CLOUD_CONFIG,
+        gzip_output:bool=False, include_bootstrap_script:bool=True):
+        '''
+        @param compression_cache - an optional CompressionCache for the gzipped write_files
+        @param output_format - the `#cloud-config` YAML, or a MIME multipart archive of it and the bootstrap script
+        @param gzip_output - gzip the whole user-data as one stream
+        @param include_bootstrap_script - with the MIME multipart archive, whether the bootstrap script is in it
+        '''
+
+        self.compression_cache = compression_cache
+        self.output_format = UserDataOutputFormatEnum(output_format)
+        self.gzip_output = gzip_output
+        self.include_bootstrap_script = include_bootstrap_script
+
+        self.template_cache = MustacheTemplateCache()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(compression_cache={self.compression_cache!r}, output_format={self.output_format!r}, "
+            f"gzip_output={self.gzip_output!r}, include_bootstrap_script={self.include_bootstrap_script!r})")
+
+    def render(self, config_settings:ConfigFileSettings,
+        overrides:typing.Optional[typing.Union[typing.Mapping[str, typing.Any], HostOverrides]]=None) -> bytes:
+        '''
+        render the user-data, the same bytes as `cli.py create_yaml` writes with the same options
+
+        @param config_settings - the ConfigFileSettings, see utils.load_config_settings()
+        @param overrides - optional overrides for this render, see apply_settings_overrides()
+        @return the user-data
+        '''
+
+        if overrides:
+            config_settings = apply_settings_overrides(config_settings, overrides)
+
+        size_optimizer = None
+
+        if self.gzip_output:
+
+            # imported here so the optimizer is only loaded when it is needed
+            from cloud_init_utils.size_optimizer import UserDataSizeOptimizer
+
+            # like create_yaml, the files aren't gzipped on their own when the whole thing is, and
+            # this is made for every render since it keeps a report of each file it has seen
+            size_optimizer = UserDataSizeOptimizer(allow_gzip=False)
+
+        yaml_dict = config_settings.cloud_init_settings.format_as_yaml_dict(
+            self.compression_cache, self.template_cache, config_settings.template_variables, size_optimizer)
+
+        cloud_config_buffer = io.StringIO()
+        utils.write_yaml_file_from_dict(yaml_dict, cloud_config_buffer)
+
+        if self.output_format == UserDataOutputFormatEnum.MIME_MULTIPART:
+
+            # imported here since only the MIME output needs it
+            from cloud_init_utils.user_data import build_mime_multipart
+            from cloud_init_utils.bootstrap_script import render_bootstrap_runner
+
+            mime_parts = [MimePart(
+                part_type=MimePartTypeEnum.CLOUD_CONFIG,
+                filename=constants.MIME_MULTIPART_CLOUD_CONFIG_FILENAME,
+                content=cloud_config_buffer.getvalue())]
+
+            if self.include_bootstrap_script:
+                mime_parts.append(MimePart(
+                    part_type=MimePartTypeEnum.SHELL_SCRIPT,
+                    filename=constants.MIME_MULTIPART_BOOTSTRAP_SCRIPT_FILENAME,
+                    content=render_bootstrap_runner(config_settings.bootstrap_script_settings, self.template_cache, config_settings.template_variables)))
+
+            user_data_bytes = build_mime_multipart(mime_parts)
+
+        else:
+            user_data_bytes = cloud_config_buffer.getvalue().encode("utf-8")
+
+        if self.gzip_output:
+
+            from cloud_init_utils.user_data import gzip_user_data
+
+            user_data_bytes = gzip_user_data(user_data_bytes)
+
+        return user_data_bytes
+
+
+def render_user_data(config_settings:ConfigFileSettings,
+    overrides:typing.Optional[typing.Union[typing.Mapping[str, typing.Any], HostOverrides]]=None) -> bytes:
+    '''
+    render the `#cloud-config` user-data for a config, with a UserDataRenderer that is shared
+    by every call in this process (and every thread), so templates are only compiled once
+
+    @param config_settings - the ConfigFileSettings, see utils.load_config_settings()
+    @param overrides - optional overrides for this render, see apply_settings_overrides()
+    @return the user-data
+    '''
+
+    global _default_renderer
+
+    if _default_renderer is None:
+        with _default_renderer_lock:
+            if _default_renderer is None:
+                _default_renderer = UserDataRenderer()
+
+    return _default_renderer.render(config_settings, overrides)
@@ -0,0 +1,250 @@
+import base64
+import logging
+import typing
+
+import attr
+
+from cloud_init_utils import constants
+from cloud_init_utils import utils
+from cloud_init_utils.model import StreamedGzipPayload, WriteFilesEncodingEnum, gzip_compress
+
+
+logger = logging.getLogger(__name__)
+
+
+class _CountingWriter:
+    '''
+    a file like object that only counts how many (utf-8) bytes are written to it
+    '''
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data:typing.Union[str, bytes]):
+
+        # ruamel hands us already encoded bytes, since we don't have an `encoding` attribute
+        self.size += len(data) if isinstance(data, bytes) else len(data.encode("utf-8"))
+
+
+def get_rendered_size(yaml_dict:dict) -> int:
+    '''
+    @param yaml_dict - the dict from CloudInitSettings.format_as_yaml_dict()
+    @return how many bytes utils.write_yaml_file_from_dict() would write for it
+    '''
+
+    counting_writer = _CountingWriter()
+    utils.write_yaml_file_from_dict(yaml_dict, counting_writer)
+    return counting_writer.size
+
+
+def _get_rendered_entry_size(entry:dict) -> int:
+
+    counting_writer = _CountingWriter()
+
+    content_key = list(entry.keys())[-1]
+    content = entry[content_key]
+
+    # a streamed payload is only compressed to find its size if it hasn't been already, the
+    # `!!binary` block for it is worked out from that rather than written out
+    if len(entry) > 1 and isinstance(content, StreamedGzipPayload):
+        utils.write_yaml_write_files_entry({k: v for k, v in entry.items() if k != content_key}, counting_writer)
+        return counting_writer.size + utils.get_yaml_binary_block_size(content_key, content.get_compressed_size(), 2)
+
+    utils.write_yaml_write_files_entry(entry, counting_writer)
+    return counting_writer.size
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class PayloadSizeReport:
+
+    file_path:str = attr.ib()
+    raw_size:int = attr.ib()
+    chosen_encoding:str = attr.ib()
+
+    # the size of the whole write_files entry in the YAML, not just the content
+    rendered_size:int = attr.ib()
+
+    # the rendered size of every candidate that was tried, candidates that
+    # couldn't possibly win aren't rendered and so aren't in here
+    candidate_sizes:typing.Mapping[str, int] = attr.ib()
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class UserDataSizeReport:
+
+    total_size:int = attr.ib()
+    size_limit:int = attr.ib()
+    payload_reports:typing.Sequence[PayloadSizeReport] = attr.ib()
+
+    @property
+    def is_over_limit(self) -> bool:
+        return self.total_size > self.size_limit
+
+    def format_table(self) -> str:
+        '''
+        @return a table of the payloads (biggest first) and the total against the limit
+        '''
+
+        lines = [f"{'rendered':>10} {'raw':>10}  {'encoding':<12} file_path"]
+
+        for iter_report in sorted(self.payload_reports, key=lambda x: x.rendered_size, reverse=True):
+            lines.append(f"{iter_report.rendered_size:>10} {iter_report.raw_size:>10}  {iter_report.chosen_encoding:<12} {iter_report.file_path}")
+
+        percent_used = self.total_size * 100 / self.size_limit if self.size_limit else float("inf")
+        lines.append(f"total: `{self.total_size}` bytes of the `{self.size_limit}` byte limit ({percent_used:.1f}%)")
+
+        return "\n".join(lines)
+
+
+class UserDataSizeOptimizer:
+    '''
+    picks the `encoding` for each write_files entry that makes it the smallest in the
+    rendered YAML, and keeps track of the sizes so they can be reported against the
+    provider's user-data size limit
+
+    with `try_all_encodings` off it only tries what FileToWrite.format_as_yaml_dict() does
+    on its own (gzip at the default level) so it just reports on the sizes
+
+    with `allow_gzip` off only b64 and plain text are tried, for when the whole user-data
+    is gzipped afterwards and compressing each file on its own would just get in the way
+    '''
+
+    def __init__(self, try_all_encodings:bool=True, gzip_levels:typing.Sequence[int]=constants.SIZE_OPTIMIZER_GZIP_LEVELS, allow_gzip:bool=True):
+
+        self.try_all_encodings = try_all_encodings
+        self.gzip_levels = gzip_levels
+        self.allow_gzip = allow_gzip
+
+        self._payload_reports = dict()
+
+    def _iter_candidates(self, raw_content_bytes:bytes, compression_cache, parallel_gzip) -> typing.Iterator[typing.Tuple[str, typing.Optional[str], typing.Any, int]]:
+        '''
+        @return an iterator of (name, encoding key value, content, lower bound of the content size),
+        the default encoding comes first so it wins any ties
+        '''
+
+        def _gzip(level):
+            return gzip_compress(raw_content_bytes, level, compression_cache, parallel_gzip)
+
+        if self.allow_gzip:
+
+            default_level = constants.GZIP_COMPRESSION_LEVEL
+
+            # the content of a `!!binary` block is base64, so it is at least 4/3 the size
+            gzipped_bytes = _gzip(default_level)
+            yield f"gzip:{default_level}", WriteFilesEncodingEnum.GZIP.value, gzipped_bytes, len(gzipped_bytes) * 4 // 3
+
+            if not self.try_all_encodings:
+                return
+
+            gzip_b64_content = base64.b64encode(gzipped_bytes).decode("ascii")
+            yield f"gz+b64:{default_level}", WriteFilesEncodingEnum.GZIP_B64.value, gzip_b64_content, len(gzip_b64_content)
+
+            for iter_level in self.gzip_levels:
+
+                if iter_level == default_level:
+                    continue
+
+                iter_gzipped_bytes = _gzip(iter_level)
+                yield f"gzip:{iter_level}", WriteFilesEncodingEnum.GZIP.value, iter_gzipped_bytes, len(iter_gzipped_bytes) * 4 // 3
+
+                iter_gzip_b64_content = base64.b64encode(iter_gzipped_bytes).decode("ascii")
+                yield f"gz+b64:{iter_level}", WriteFilesEncodingEnum.GZIP_B64.value, iter_gzip_b64_content, len(iter_gzip_b64_content)
+
+        b64_content = base64.b64encode(raw_content_bytes).decode("ascii")
+        yield WriteFilesEncodingEnum.B64.value, WriteFilesEncodingEnum.B64.value, b64_content, len(b64_content)
+
+        # only text that is valid utf-8 can go in as is
+        try:
+            text_content = raw_content_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            return
+
+        yield WriteFilesEncodingEnum.TEXT_PLAIN.value, None, text_content, len(raw_content_bytes)
+
+    def choose_encoding(self, file_to_write, yaml_dict:dict, raw_content_bytes:bytes, compression_cache=None, parallel_gzip=None) -> dict:
+        '''
+        fill in the `encoding` and `content` of a write_files entry with whichever candidate
+        encoding renders the smallest
+
+        @param file_to_write - the FileToWrite the entry is for
+        @param yaml_dict - the entry so far, without `encoding` or `content`
+        @param raw_content_bytes - the raw bytes of the file
+        @param compression_cache - an optional CompressionCache for the gzip candidates
+        @param parallel_gzip - an optional ParallelGzipCompressor for the gzip candidates
+        @return the finished entry
+        '''
+
+        best_entry = None
+        best_name = None
+        best_size = None
+        candidate_sizes = dict()
+
+        for iter_name, iter_encoding, iter_content, iter_lower_bound in self._iter_candidates(raw_content_bytes, compression_cache, parallel_gzip):
+
+            # the content alone is already bigger than the best entry, so don't bother rendering it
+            if best_size is not None and iter_lower_bound >= best_size:
+                continue
+
+            candidate_entry = dict(yaml_dict)
+            if iter_encoding is not None:
+                candidate_entry["encoding"] = iter_encoding
+            candidate_entry["content"] = iter_content
+
+            candidate_size = _get_rendered_entry_size(candidate_entry)
+            candidate_sizes[iter_name] = candidate_size
+
+            if best_size is None or candidate_size < best_size:
+                best_entry, best_name, best_size = candidate_entry, iter_name, candidate_size
+
+        logger.debug("`%s`: chose `%s` out of `%s`", file_to_write.file_path, best_name, candidate_sizes)
+
+        self._payload_reports[str(file_to_write.file_path)] = PayloadSizeReport(
+            file_path=str(file_to_write.file_path),
+            raw_size=len(raw_content_bytes),
+            chosen_encoding=best_name,
+            rendered_size=best_size,
+            candidate_sizes=candidate_sizes)
+
+        return best_entry
+
+    def build_report(self, yaml_dict:dict, size_limit:int, total_size:typing.Optional[int]=None) -> UserDataSizeReport:
+        '''
+        @param yaml_dict - the finished dict from CloudInitSettings.format_as_yaml_dict()
+        @param size_limit - the provider's user-data size limit in bytes
+        @param total_size - the size of the user-data that is actually sent, if it isn't
+        just the YAML (it is a MIME archive or gzipped), otherwise the YAML is measured
+        @return a UserDataSizeReport, entries that didn't go through choose_encoding() (the
+        streamed ones) are measured here
+        '''
+
+        payload_reports = []
+        write_files = yaml_dict.get("write_files", [])
+
+        for iter_entry in write_files:
+
+            payload_report = self._payload_reports.get(str(iter_entry["path"]))
+
+            if payload_report is None:
+                rendered_size = _get_rendered_entry_size(iter_entry)
+                payload_report = PayloadSizeReport(
+                    file_path=str(iter_entry["path"]),
+                    raw_size=-1,
+                    chosen_encoding=iter_entry.get("encoding", WriteFilesEncodingEnum.TEXT_PLAIN.value),
+                    rendered_size=rendered_size,
+                    candidate_sizes={})
+
+            payload_reports.append(payload_report)
+
+        # the write_files entries were just measured, so only the rest of the YAML is rendered for the total
+        if total_size is None and write_files:
+            total_size = (get_rendered_size({k: v for k, v in yaml_dict.items() if k != "write_files"})
+                + len("write_files:\n") + sum(iter_report.rendered_size for iter_report in payload_reports))
+
+        elif total_size is None:
+            total_size = get_rendered_size(yaml_dict)
+
+        return UserDataSizeReport(
+            total_size=total_size,
+            size_limit=size_limit,
+            payload_reports=payload_reports)
@@ -0,0 +1,72 @@
+import logging
+import threading
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+class MustacheTemplateCache:
+    '''
+    an in memory cache of compiled (tokenized) mustache templates
+
+    chevron re-tokenizes the template text every time `chevron.render` is given a
+    string, but it will happily take a list of already parsed tokens instead. So
+    we tokenize each distinct template once and then render that against as many
+    contexts (hosts) as we want
+    '''
+
+    def __init__(self):
+
+        self._compiled_templates = dict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_compiled_template(self, template_text:str) -> typing.Sequence[tuple]:
+        '''
+        get the tokens for the template, tokenizing it if we haven't seen it before
+
+        @param template_text - the mustache template
+        @return the list of chevron tokens
+        '''
+
+        compiled_template = self._compiled_templates.get(template_text)
+
+        if compiled_template is not None:
+            with self._lock:
+                self.hits += 1
+            return compiled_template
+
+        # tokenize outside of the lock, worst case two threads both compile the
+        # same template and one of them wins
+        import chevron
+
+        compiled_template = list(chevron.tokenizer.tokenize(template_text))
+
+        with self._lock:
+            self.misses += 1
+            return self._compiled_templates.setdefault(template_text, compiled_template)
+
+    def render(self, template_text:str, template_variables:typing.Mapping[str, typing.Any]) -> str:
+        '''
+        render the template against the given variables
+
+        @param template_text - the mustache template
+        @param template_variables - the context to render the template with
+        @return the rendered string
+        '''
+
+        import chevron
+
+        compiled_template = self.get_compiled_template(template_text)
+
+        return chevron.render(compiled_template, template_variables)
+
+    def get_stats(self) -> typing.Mapping[str, int]:
+        '''
+        @return a dict of the hit/miss counters
+        '''
+
+        return {"hits": self.hits, "misses": self.misses, "templates": len(self._compiled_templates)}
@@ -0,0 +1,62 @@
+import hashlib
+import typing
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import MimePart, gzip_compress
+
+
+def build_mime_multipart(parts:typing.Sequence[MimePart]) -> bytes:
+    '''
+    build a cloud-init MIME multipart archive out of the given parts, the same kind
+    of archive that `cloud-init devel make-mime` creates
+
+    the boundary comes from a hash of the parts rather than being random, so the same
+    parts always give the same bytes
+
+    @param parts - the MimePart objects, in the order cloud-init should handle them
+    @return the archive
+    '''
+
+    # imported here since this is only needed for the MIME output
+    import email.charset
+    import email.policy
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    # the default for utf-8 is to base64 each part, which is a third bigger and
+    # compresses worse, cloud-init is fine with 8bit parts
+    body_charset = email.charset.Charset("utf-8")
+    body_charset.body_encoding = None
+
+    hasher = hashlib.sha256()
+    for iter_part in parts:
+        for iter_value in (iter_part.part_type.value, iter_part.filename, iter_part.content):
+            hasher.update(iter_value.encode("utf-8"))
+            hasher.update(b"\0")
+
+    multipart_message = MIMEMultipart("mixed", boundary=f"==============={hasher.hexdigest()[:32]}==")
+
+    for iter_part in parts:
+
+        _, subtype = iter_part.part_type.value.split("/")
+
+        part_message = MIMEText(iter_part.content, subtype, body_charset)
+        part_message.add_header("Content-Disposition", "attachment", filename=iter_part.filename)
+        multipart_message.attach(part_message)
+
+    # the default policy turns lines starting with `From ` into `>From `, which would change the content
+    return multipart_message.as_bytes(policy=email.policy.compat32.clone(mangle_from_=False))
+
+
+def gzip_user_data(user_data_bytes:bytes, compression_level:int=constants.GZIP_COMPRESSION_LEVEL, parallel_gzip=None) -> bytes:
+    '''
+    gzip the whole user-data as a single stream, cloud-init notices the gzip header and
+    decompresses it before doing anything else
+
+    @param user_data_bytes - the cloud-config or MIME archive
+    @param compression_level - the gzip compression level
+    @param parallel_gzip - an optional ParallelGzipCompressor, see model.gzip_compress()
+    @return the gzipped bytes, with a zero mtime in the header so they are the same every time
+    '''
+
+    return gzip_compress(user_data_bytes, compression_level, parallel_gzip=parallel_gzip)
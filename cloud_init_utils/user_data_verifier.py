@@ -0,0 +1,359 @@
+import gzip
+import zlib
+import email
+import hashlib
+import pathlib
+import binascii
+import logging
+import typing
+
+import attr
+
+from cloud_init_utils import constants
+from cloud_init_utils.model import MimePartTypeEnum
+
+
+logger = logging.getLogger(__name__)
+
+# every spelling of the write_files encodings that cloud-init accepts
+_GZIP_BASE64_ENCODINGS = ("gz", "gzip", "gz+b64", "gzip+b64", "gz+base64", "gzip+base64")
+_BASE64_ENCODINGS = ("b64", "base64")
+_TEXT_ENCODINGS = (None, "text/plain")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# each worker process keeps the base config, the host overrides and what it already worked
+# out about them, so a payload shared by thousands of hosts is only hashed once per worker
+_worker_state = None
+
+# workers are single threaded, so one YAML handle per process is enough
+_yaml_loader = None
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class VerifyReport:
+
+    user_data_path:str = attr.ib()
+    hostname:str = attr.ib()
+
+    # how the file differs from the config, empty if it matches
+    drift:typing.Sequence[str] = attr.ib()
+
+    # set if the file couldn't be read at all
+    error:typing.Optional[str] = attr.ib()
+
+
+def _iter_base64_decoded_chunks(base64_text:str) -> typing.Iterator[bytes]:
+    '''
+    decode a (possibly multi line) base64 string a chunk at a time, so a big payload
+    never has to be in memory decoded all at once
+    '''
+
+    chunk_size = constants.VERIFY_BASE64_DECODE_CHUNK_SIZE
+    pending = ""
+
+    for iter_offset in range(0, len(base64_text), chunk_size):
+
+        pending += "".join(base64_text[iter_offset:iter_offset + chunk_size].split())
+        whole_length = len(pending) - (len(pending) % 4)
+
+        if whole_length:
+            yield binascii.a2b_base64(pending[:whole_length])
+            pending = pending[whole_length:]
+
+    if pending:
+        raise ValueError(f"the base64 content has `{len(pending)}` characters left over at the end")
+
+
+def _iter_gunzipped_chunks(compressed_chunks:typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    for iter_chunk in compressed_chunks:
+
+        while iter_chunk:
+
+            yield decompressor.decompress(iter_chunk)
+
+            # gzip allows more than one member one after the other
+            iter_chunk = decompressor.unused_data
+            if iter_chunk:
+                yield decompressor.flush()
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    yield decompressor.flush()
+
+    if not decompressor.eof:
+        raise ValueError("the gzip content is truncated")
+
+
+def _hash_chunks(chunks:typing.Iterable[bytes]) -> typing.Tuple[str, int]:
+
+    hasher = hashlib.sha256()
+    size = 0
+
+    for iter_chunk in chunks:
+        hasher.update(iter_chunk)
+        size += len(iter_chunk)
+
+    return hasher.hexdigest(), size
+
+
+def hash_write_files_content(write_files_entry:dict) -> typing.Tuple[str, int]:
+    '''
+    get the sha256 and size of the bytes a write_files entry ends up writing, decoding (and
+    decompressing) its content as a stream
+
+    @param write_files_entry - the entry as load_user_data() returns it, so with `!!binary`
+    content still as the base64 text
+    @return a tuple of the hex digest and the size in bytes
+    '''
+
+    encoding = write_files_entry.get("encoding")
+    content = write_files_entry.get("content", "")
+    encoding = encoding.lower() if isinstance(encoding, str) else encoding
+
+    if encoding in _TEXT_ENCODINGS:
+        return _hash_chunks([str(content).encode("utf-8")])
+
+    elif encoding in _BASE64_ENCODINGS:
+        return _hash_chunks(_iter_base64_decoded_chunks(content))
+
+    elif encoding in _GZIP_BASE64_ENCODINGS:
+        return _hash_chunks(_iter_gunzipped_chunks(_iter_base64_decoded_chunks(content)))
+
+    raise ValueError(f"unknown write_files encoding `{encoding}`")
+
+
+def _iter_file_chunks(file_path:pathlib.Path) -> typing.Iterator[bytes]:
+
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(constants.PAYLOAD_SOURCE_READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def hash_file_to_write(file_to_write, template_cache=None, template_variables=None) -> typing.Tuple[str, int]:
+    '''
+    @return the sha256 and size of the bytes the FileToWrite should end up writing, a
+    payload_source_path that isn't a template is read a chunk at a time
+    '''
+
+    if file_to_write.payload_source_path is not None and not file_to_write.use_mustache_template:
+        return _hash_chunks(_iter_file_chunks(pathlib.Path(file_to_write.payload_source_path)))
+
+    return _hash_chunks([file_to_write.get_raw_content_bytes(template_cache, template_variables)])
+
+
+def _get_yaml_loader():
+    '''
+    @return this process's `safe` ruamel YAML handle that leaves `!!binary` values as their
+    base64 text, it uses the C parser when ruamel.yaml.clib is installed
+    '''
+
+    global _yaml_loader
+
+    if _yaml_loader is None:
+
+        # imported here since ruamel is slow to import
+        import ruamel.yaml
+        import ruamel.yaml.constructor
+
+        class _RawBinaryConstructor(ruamel.yaml.constructor.SafeConstructor):
+            pass
+
+        _RawBinaryConstructor.add_constructor("tag:yaml.org,2002:binary", _RawBinaryConstructor.construct_yaml_str)
+
+        _yaml_loader = ruamel.yaml.YAML(typ="safe")
+        _yaml_loader.Constructor = _RawBinaryConstructor
+
+    return _yaml_loader
+
+
+def load_user_data(user_data_path:pathlib.Path) -> dict:
+    '''
+    load a cloud-config file the way cloud-init would, undoing a gzip of the whole file
+    and taking the cloud-config part out of a MIME multipart archive
+
+    `!!binary` values are left as their base64 text so hash_write_files_content() can
+    decode them a chunk at a time
+
+    @param user_data_path - the user-data file
+    @return the cloud-config as a dict
+    '''
+
+    user_data_bytes = user_data_path.read_bytes()
+
+    if user_data_bytes.startswith(_GZIP_MAGIC):
+        user_data_bytes = gzip.decompress(user_data_bytes)
+
+    if user_data_bytes.startswith((b"Content-Type: multipart/", b"MIME-Version:")):
+
+        mime_message = email.message_from_bytes(user_data_bytes)
+        cloud_config_parts = [iter_part for iter_part in mime_message.walk() if iter_part.get_content_type() == MimePartTypeEnum.CLOUD_CONFIG.value]
+
+        if len(cloud_config_parts) != 1:
+            raise Exception(f"expected one `{MimePartTypeEnum.CLOUD_CONFIG.value}` part in the MIME multipart archive, found `{len(cloud_config_parts)}`")
+
+        user_data_bytes = cloud_config_parts[0].get_payload(decode=True)
+
+    user_data_dict = _get_yaml_loader().load(user_data_bytes)
+
+    if not isinstance(user_data_dict, dict):
+        raise Exception(f"expected a cloud-config mapping, got `{type(user_data_dict).__name__}`")
+
+    return user_data_dict
+
+
+def get_hostname_for_user_data_path(user_data_path:pathlib.Path) -> str:
+    '''
+    @return the hostname a create_yaml_fleet output file is for, so its name without the extension
+    '''
+
+    file_name = user_data_path.name
+
+    if file_name.endswith(constants.FLEET_OUTPUT_FILE_EXTENSION):
+        return file_name[:-len(constants.FLEET_OUTPUT_FILE_EXTENSION)]
+
+    return user_data_path.stem
+
+
+class _WorkerState:
+
+    def __init__(self, base_config_obj, host_overrides_by_hostname):
+
+        from cloud_init_utils.template_cache import MustacheTemplateCache
+
+        self.base_config_obj = base_config_obj
+        self.host_overrides_by_hostname = host_overrides_by_hostname
+        self.template_cache = MustacheTemplateCache()
+
+        self.base_config_settings = None
+
+        # FileToWrite -> (digest, size), only for the ones that aren't templates, since
+        # those come out the same for every host
+        self.file_hashes = dict()
+
+    def get_config_settings(self, hostname:str):
+
+        from cloud_init_utils import utils
+
+        host_overrides = self.host_overrides_by_hostname.get(hostname)
+
+        if host_overrides is not None:
+            return utils.parse_config(utils.apply_host_overrides(self.base_config_obj, host_overrides))
+
+        if self.base_config_settings is None:
+            self.base_config_settings = utils.parse_config(self.base_config_obj)
+
+        return self.base_config_settings
+
+    def get_expected_file_hash(self, file_to_write, template_variables) -> typing.Tuple[str, int]:
+
+        if file_to_write.use_mustache_template:
+            return hash_file_to_write(file_to_write, self.template_cache, template_variables)
+
+        file_hash = self.file_hashes.get(file_to_write)
+
+        if file_hash is None:
+            file_hash = hash_file_to_write(file_to_write)
+            self.file_hashes[file_to_write] = file_hash
+
+        return file_hash
+
+def init_worker(base_config_obj, host_overrides_by_hostname):
+    '''
+    the initializer for the verify worker processes
+
+    @param base_config_obj - the ConfigTree of the `--config` layers
+    @param host_overrides_by_hostname - a dict of hostname -> HostOverrides from the hosts manifest
+    '''
+
+    from cloud_init_utils import metrics
+
+    global _worker_state
+    _worker_state = _WorkerState(base_config_obj, host_overrides_by_hostname)
+
+    # spans recorded in a worker would never be read, like with create_yaml_fleet
+    metrics.set_recorder(None)
+
+
+def _get_drift(user_data_dict:dict, config_settings, worker_state:_WorkerState) -> typing.List[str]:
+
+    drift = []
+
+    # everything but write_files is cheap to build, and small enough to compare as is
+    expected_settings = attr.evolve(config_settings.cloud_init_settings, files_to_write=[]).format_as_yaml_dict()
+    del expected_settings["write_files"]
+
+    # the values aren't in the report since chpasswd has the password in it
+    for iter_key, iter_expected_value in expected_settings.items():
+        if user_data_dict.get(iter_key) != iter_expected_value:
+            drift.append(f"`{iter_key}` is different")
+
+    for iter_key in sorted(set(user_data_dict) - set(expected_settings) - {"write_files"}):
+        drift.append(f"`{iter_key}` isn't in the config")
+
+    actual_entries = dict()
+
+    for iter_entry in user_data_dict.get("write_files") or []:
+        actual_entries[str(iter_entry.get("path"))] = iter_entry
+
+    for iter_file_to_write in config_settings.cloud_init_settings.files_to_write:
+
+        file_path = str(iter_file_to_write.file_path)
+        actual_entry = actual_entries.pop(file_path, None)
+
+        if actual_entry is None:
+            drift.append(f"`{file_path}` is missing")
+            continue
+
+        expected_owner = f"{iter_file_to_write.owner_username}:{iter_file_to_write.owner_group}"
+
+        if actual_entry.get("owner") != expected_owner:
+            drift.append(f"`{file_path}` is owned by `{actual_entry.get('owner')}`, expected `{expected_owner}`")
+
+        if str(actual_entry.get("permissions")) != iter_file_to_write.permission_octal:
+            drift.append(f"`{file_path}` has the permissions `{actual_entry.get('permissions')}`, expected `{iter_file_to_write.permission_octal}`")
+
+        expected_digest, expected_size = worker_state.get_expected_file_hash(iter_file_to_write, config_settings.template_variables)
+
+        try:
+            actual_digest, actual_size = hash_write_files_content(actual_entry)
+        except (ValueError, binascii.Error, zlib.error) as e:
+            drift.append(f"`{file_path}` can't be decoded: `{e}`")
+            continue
+
+        if actual_digest != expected_digest:
+            drift.append(f"`{file_path}` has different content, `{actual_size}` bytes with the sha256 `{actual_digest[:16]}`, "
+                f"expected `{expected_size}` bytes with the sha256 `{expected_digest[:16]}`")
+
+    for iter_file_path in actual_entries:
+        drift.append(f"`{iter_file_path}` isn't in the config")
+
+    return drift
+
+
+def verify_user_data(user_data_path:pathlib.Path) -> VerifyReport:
+    '''
+    compare a user-data file to what the config (with the overrides of the host the file is
+    for, if there are any) says it should be, this runs in a worker process set up by
+    init_worker(), so it is a module level function so it can be pickled
+
+    @param user_data_path - the user-data file
+    @return a VerifyReport
+    '''
+
+    hostname = get_hostname_for_user_data_path(user_data_path)
+
+    try:
+        user_data_dict = load_user_data(user_data_path)
+        config_settings = _worker_state.get_config_settings(hostname)
+        drift = _get_drift(user_data_dict, config_settings, _worker_state)
+
+    except Exception as e:
+        return VerifyReport(user_data_path=str(user_data_path), hostname=hostname, drift=[], error=f"{type(e).__name__}: {e}")
+
+    return VerifyReport(user_data_path=str(user_data_path), hostname=hostname, drift=drift, error=None)
@@ -1,29 +1,355 @@
 import pathlib
 import argparse
 import logging
+import logging.handlers
 import typing
 import io
-
-import arrow
-import pyhocon
-import ruamel.yaml
+import csv
+import json
+import copy
+import collections
+import os
+import base64
+import threading
+import datetime
+import math
+import queue
+
+# pyhocon and ruamel.yaml are slow to import, so they are imported in the
+# functions that use them, that way `--help` and such don't pay for them
 
 from cloud_init_utils import constants
-from cloud_init_utils.model import HoconTypesEnum, ConfigFileSettings
-from cloud_init_utils.model import FileToWrite, CloudInitSettings, ConfigFileSettings, BootstrapScriptSettings, CommandToRun
+from cloud_init_utils import config_schema
+from cloud_init_utils import metrics
+from cloud_init_utils.model import HoconTypesEnum, ConfigFileSettings, ListMergeStrategyEnum
+from cloud_init_utils.model import HostOverrides, HostsManifestFormatEnum, StreamedGzipPayload, WriteFilesEncodingEnum
+
+
+logger = logging.getLogger(__name__)
 
-class ArrowLoggingFormatter(logging.Formatter):
-    ''' logging.Formatter subclass that uses arrow, that formats the timestamp
-    to the local timezone (but its in ISO format)
+class LocalTimeLoggingFormatter(logging.Formatter):
+    ''' logging.Formatter subclass that formats the timestamp in the local
+    timezone (but its in ISO format), the same as arrow's isoformat() does
+
+    everything but the microseconds only changes once a second, so that part (along with
+    the utc offset, which is looked up for that second so DST is still right) is cached
+    rather than being worked out again for every record
     '''
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # (the second, the ISO date and time up to the second, the utc offset)
+        self._cached_second = (None, None, None)
+
     def formatTime(self, record, datefmt=None):
-        return arrow.get("{}".format(record.created), "X").to("local").isoformat()
 
+        if datefmt is not None:
+            return super().formatTime(record, datefmt)
+
+        # rounded the same way datetime.fromtimestamp() does it
+        fraction, created_second = math.modf(record.created)
+        created_second, microseconds = int(created_second), round(fraction * 1_000_000)
+
+        if microseconds >= 1_000_000:
+            created_second, microseconds = created_second + 1, microseconds - 1_000_000
+
+        cached_second, date_time_text, utc_offset_text = self._cached_second
+
+        if created_second != cached_second:
+
+            iso_text = datetime.datetime.fromtimestamp(created_second).astimezone().isoformat()
+
+            # `YYYY-MM-DDTHH:MM:SS` and then the offset
+            date_time_text, utc_offset_text = iso_text[:19], iso_text[19:]
+            self._cached_second = (created_second, date_time_text, utc_offset_text)
+
+        # like isoformat(), the microseconds are left out when there aren't any
+        if not microseconds:
+            return f"{date_time_text}{utc_offset_text}"
+
+        return f"{date_time_text}.{microseconds:06d}{utc_offset_text}"
+
+
+class JsonLinesLoggingFormatter(LocalTimeLoggingFormatter):
+    ''' logging.Formatter subclass that formats each record as a line of JSON, for
+    feeding the logs into something else
+    '''
+
+    def format(self, record):
+
+        record_dict = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            record_dict["exception"] = record.exc_text
+
+        if record.stack_info:
+            record_dict["stack"] = self.formatStack(record.stack_info)
+
+        return json.dumps(record_dict, default=str)
+
+
+class _ProcessLocalQueueHandler(logging.handlers.QueueHandler):
+    ''' logging.handlers.QueueHandler subclass for a QueueListener in the same process
+
+    a worker process that is forked from this one inherits this handler but not the
+    listener's thread, so in there the records are handed to the listener's handlers
+    directly instead, like they were before there was a queue
+    '''
+
+    def __init__(self, queue, handlers:typing.Sequence[logging.Handler]):
+        super().__init__(queue)
+
+        self._pid = os.getpid()
+        self._handlers = handlers
+
+    def prepare(self, record):
+
+        # the message has to be formatted here since the args could change once we return, but
+        # unlike the default this keeps the traceback out of the message, so each formatter
+        # can lay it out how it wants. It is the only handler, so the record isn't copied first
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def emit(self, record):
+
+        if os.getpid() == self._pid:
+            super().emit(record)
+            return
+
+        for iter_handler in self._handlers:
+            if record.levelno >= iter_handler.level:
+                iter_handler.handle(record)
+
+
+def start_logging_listener(root_logger:logging.Logger, handlers:typing.Sequence[logging.Handler]) -> logging.handlers.QueueListener:
+    '''
+    log through a queue, so the formatting of the timestamps and the writes to stdout and
+    the log file happen on the listener's thread rather than on whatever thread logged them
+
+    @param root_logger - the logger to add the queue handler to
+    @param handlers - the handlers that actually write the records out
+    @return the QueueListener, already started, stop() it (which writes out whatever is
+    still in the queue) before exiting
+    '''
+
+    log_queue = queue.SimpleQueue()
+
+    queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_listener.start()
+
+    root_logger.addHandler(_ProcessLocalQueueHandler(log_queue, handlers))
+
+    return queue_listener
+
+
+
+def get_default_cache_root_dir() -> pathlib.Path:
+    '''
+    @return the folder that our caches live under by default, this respects
+    `XDG_CACHE_HOME` and falls back to `~/.cache`
+    '''
+
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+    cache_home = pathlib.Path(xdg_cache_home) if xdg_cache_home else pathlib.Path("~/.cache").expanduser()
+
+    return cache_home / constants.CACHE_ROOT_FOLDER_NAME
+
+
+def get_compression_cache_from_args(parsed_args) -> typing.Optional["CompressionCache"]:
+    '''
+    create the CompressionCache based on the `--cache-dir`, `--cache-max-size` and
+    `--no-cache` arguments
+
+    @param parsed_args - the argparse namespace
+    @return a CompressionCache, or None if caching is disabled
+    '''
+
+    if parsed_args.no_cache:
+        return None
+
+    from cloud_init_utils.compression_cache import CompressionCache
+
+    cache_root_dir = parsed_args.cache_dir if parsed_args.cache_dir is not None else get_default_cache_root_dir()
+
+    return CompressionCache(cache_root_dir / constants.COMPRESSION_CACHE_FOLDER_NAME, parsed_args.cache_max_size_mb * 1024 * 1024)
+
+
+def get_config_cache_from_args(parsed_args) -> typing.Optional["ParsedConfigCache"]:
+    '''
+    create the ParsedConfigCache based on the `--cache-dir` and `--no-cache` arguments
+
+    @param parsed_args - the argparse namespace
+    @return a ParsedConfigCache, or None if caching is disabled
+    '''
+
+    if parsed_args.no_cache:
+        return None
+
+    from cloud_init_utils.config_cache import ParsedConfigCache
+
+    cache_root_dir = parsed_args.cache_dir if parsed_args.cache_dir is not None else get_default_cache_root_dir()
+
+    return ParsedConfigCache(cache_root_dir / constants.PARSED_CONFIG_CACHE_FOLDER_NAME)
+
+
+def add_size_optimizer_arguments(parser:argparse.ArgumentParser):
+    '''
+    add the `--optimize-size` and `--size-limit` arguments to a subcommand's parser
+
+    @param parser - the subcommand's ArgumentParser
+    '''
+
+    parser.add_argument("--optimize-size", dest="optimize_size", action="store_true",
+        help="pick the smallest encoding (gzip at several levels, gz+b64, b64 or plain text) for each file in write_files, "
+        f"and fail if the result is over --size-limit (which then defaults to `{constants.USER_DATA_DEFAULT_SIZE_LIMIT_BYTES}`)")
+    parser.add_argument("--size-limit", dest="size_limit", type=int, default=None,
+        help="the user-data size limit of the provider in bytes, a report of the payload sizes is logged and "
+        "nothing is written if the YAML would be bigger than this")
+
+
+def add_watch_arguments(parser:argparse.ArgumentParser):
+    '''
+    add the `--watch` arguments to a subcommand's parser
+
+    @param parser - the subcommand's ArgumentParser
+    '''
+
+    parser.add_argument("--watch", dest="watch", action="store_true",
+        help="after rendering, keep watching the config files, the files they include and every payload_source_path, "
+        "and render again whatever used the files that changed, until ctrl-c")
+    parser.add_argument("--watch-debounce", dest="watch_debounce_seconds", type=float, default=constants.WATCH_DEFAULT_DEBOUNCE_SECONDS,
+        help=f"with --watch, how many seconds nothing has to change for before rendering again, defaults to `{constants.WATCH_DEFAULT_DEBOUNCE_SECONDS}`")
+    parser.add_argument("--watch-poll-interval", dest="watch_poll_interval_seconds", type=float, default=constants.WATCH_DEFAULT_POLL_INTERVAL_SECONDS,
+        help="with --watch, how often to check the files for changes where inotify isn't available, "
+        f"defaults to `{constants.WATCH_DEFAULT_POLL_INTERVAL_SECONDS}`")
+
+
+def get_file_watcher_from_args(parsed_args) -> "FileWatcher":
+    '''
+    create the FileWatcher based on the `--watch-*` arguments
+
+    @param parsed_args - the argparse namespace
+    @return a FileWatcher
+    '''
+
+    from cloud_init_utils.file_watcher import FileWatcher
+
+    return FileWatcher(parsed_args.watch_debounce_seconds, parsed_args.watch_poll_interval_seconds)
+
+
+def list_merge_strategy_type(string_arg) -> typing.Tuple[str, ListMergeStrategyEnum]:
+    '''
+    argparse type method for `--list-merge KEY=STRATEGY`
+
+    @param string_arg - the argument given to us by argparse
+    @return a tuple of the dotted key and the ListMergeStrategyEnum
+    '''
+
+    key, separator, strategy = string_arg.partition("=")
+
+    choices = [iter_strategy.value for iter_strategy in ListMergeStrategyEnum]
+
+    if not separator or not key or strategy not in choices:
+        raise argparse.ArgumentTypeError(f"expected `KEY=STRATEGY` where STRATEGY is one of `{', '.join(choices)}`, got `{string_arg}`")
+
+    return key, ListMergeStrategyEnum(strategy)
+
+
+def get_default_list_merge_strategies() -> typing.Dict[str, ListMergeStrategyEnum]:
+    '''
+    @return CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES as a dict of dotted key -> ListMergeStrategyEnum
+    '''
+
+    return {iter_key: ListMergeStrategyEnum(iter_strategy) for iter_key, iter_strategy in constants.CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES.items()}
+
+
+def get_list_merge_strategies_from_args(parsed_args) -> typing.Mapping[str, ListMergeStrategyEnum]:
+    '''
+    get how the lists of the `--config` layers are merged, the defaults from
+    CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES with any `--list-merge` arguments on top
+
+    @param parsed_args - the argparse namespace
+    @return a dict of dotted key (relative to the top level group) -> ListMergeStrategyEnum
+    '''
+
+    list_merge_strategies = get_default_list_merge_strategies()
+    list_merge_strategies.update(parsed_args.list_merge_strategies or [])
+
+    return list_merge_strategies
+
+
+def get_size_optimizer_from_args(parsed_args) -> typing.Tuple[typing.Optional["UserDataSizeOptimizer"], typing.Optional[int]]:
+    '''
+    create the UserDataSizeOptimizer based on the `--optimize-size` and `--size-limit` arguments
+
+    with just `--size-limit` the optimizer only measures the default encoding, so the
+    output doesn't change
+
+    @param parsed_args - the argparse namespace
+    @return a tuple of the UserDataSizeOptimizer (or None if neither argument was given) and the size limit
+    '''
+
+    if not parsed_args.optimize_size and parsed_args.size_limit is None:
+        return None, None
+
+    from cloud_init_utils.size_optimizer import UserDataSizeOptimizer
+
+    size_limit = parsed_args.size_limit if parsed_args.size_limit is not None else constants.USER_DATA_DEFAULT_SIZE_LIMIT_BYTES
+
+    return UserDataSizeOptimizer(try_all_encodings=parsed_args.optimize_size), size_limit
+
+
+def check_user_data_size(size_optimizer, yaml_dict:dict, size_limit:int, description:str, total_size:typing.Optional[int]=None):
+    '''
+    log the size report for a rendered YAML dict and raise if it is over the limit
+
+    @param size_optimizer - the UserDataSizeOptimizer the dict was rendered with
+    @param yaml_dict - the dict from CloudInitSettings.format_as_yaml_dict()
+    @param size_limit - the size limit in bytes
+    @param description - what the YAML is for, for the log and error messages
+    @param total_size - the size of the user-data, if it is more than just the YAML
+    '''
+
+    size_report = size_optimizer.build_report(yaml_dict, size_limit, total_size)
+
+    logger.info("user-data size report for `%s`:\n%s", description, size_report.format_table())
+
+    if size_report.is_over_limit:
+        raise Exception(f"The user-data for `{description}` is `{size_report.total_size}` bytes, "
+            f"which is over the limit of `{size_limit}` bytes by `{size_report.total_size - size_limit}` bytes")
 
 
 def get_yaml_file_string_from_dict(input_dict:dict) -> str:
 
+    import ruamel.yaml
+
+    # ruamel doesn't know how to stream the content of a StreamedGzipPayload, so read those in full
+    if any(isinstance(iter_value, StreamedGzipPayload)
+            for iter_entry in input_dict.get("write_files", []) for iter_value in iter_entry.values()):
+
+        input_dict = dict(input_dict)
+        input_dict["write_files"] = [
+            {k: v.read_all() if isinstance(v, StreamedGzipPayload) else v for k, v in iter_entry.items()}
+            for iter_entry in input_dict["write_files"]]
+
     yaml_string_io = io.StringIO()
 
     # get the 'handle' to the YAML parser/dumper, it seems like this
@@ -49,6 +375,191 @@ def get_yaml_file_string_from_dict(input_dict:dict) -> str:
     return yaml_string_io.getvalue()
 
 
+# ruamel YAML handles hold the emitter state while dumping, so they can't be shared
+# between threads, but we can reuse one per thread rather than building one per call
+_yaml_handle_thread_local = threading.local()
+
+# base64.encodebytes() puts 57 bytes on each 76 character line, so encoding in multiples of
+# 57 bytes gives the same lines as encoding the whole thing at once
+_YAML_BASE64_LINE_BYTES = 57
+_YAML_BINARY_CHUNK_SIZE = _YAML_BASE64_LINE_BYTES * 1024
+
+
+# the write_files encodings where the content is a base64 string
+_BASE64_STRING_ENCODINGS = (WriteFilesEncodingEnum.B64.value, WriteFilesEncodingEnum.GZIP_B64.value)
+_BASE64_CHARACTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+
+# ruamel's default line width, and the tag a scalar it writes without quotes has to resolve to
+_YAML_LINE_WIDTH = 80
+_YAML_STR_TAG = "tag:yaml.org,2002:str"
+
+
+def _get_yaml_handle():
+    '''
+    @return this thread's `rt` ruamel YAML handle, creating it if needed
+    '''
+
+    yaml_handle = getattr(_yaml_handle_thread_local, "yaml_handle", None)
+
+    if yaml_handle is None:
+        import ruamel.yaml
+
+        yaml_handle = ruamel.yaml.YAML(typ="rt")
+        _yaml_handle_thread_local.yaml_handle = yaml_handle
+
+    return yaml_handle
+
+
+def _write_yaml_binary_block(key:str, value_chunks:typing.Iterable[bytes], indent:int, file_handle):
+    '''
+    writes a `key: !!binary |` block scalar the same way ruamel does, but without
+    having ruamel's emitter walk every character of the base64 text
+
+    @param key - the mapping key
+    @param value_chunks - the bytes to write, as an iterable of chunks so the value never
+    has to be in memory all at once
+    @param indent - how many spaces the key is indented by
+    @param file_handle - the text file handle to write to
+    '''
+
+    key_indent = " " * indent
+    value_indent = " " * (indent + 2)
+
+    def _write_encoded(data):
+        encoded_chunk = base64.encodebytes(data).decode("ascii")
+
+        for iter_line in encoded_chunk.splitlines():
+            file_handle.write(f"{value_indent}{iter_line}\n")
+
+    file_handle.write(f"{key_indent}{key}: !!binary |\n")
+
+    # only encode whole multiples of the chunk size until the end, so the lines come out
+    # the same as encoding everything at once
+    pending = bytearray()
+
+    for iter_chunk in value_chunks:
+
+        pending += iter_chunk
+
+        if len(pending) >= _YAML_BINARY_CHUNK_SIZE:
+            whole_length = len(pending) - (len(pending) % _YAML_BINARY_CHUNK_SIZE)
+            pending_view = memoryview(pending)
+
+            for iter_offset in range(0, whole_length, _YAML_BINARY_CHUNK_SIZE):
+                _write_encoded(pending_view[iter_offset:iter_offset + _YAML_BINARY_CHUNK_SIZE])
+
+            pending_view.release()
+            del pending[:whole_length]
+
+    if pending:
+        _write_encoded(pending)
+
+
+def get_yaml_binary_block_size(key:str, value_size:int, indent:int) -> int:
+    '''
+    @param key - the mapping key
+    @param value_size - how many bytes the value is
+    @param indent - how many spaces the key is indented by
+    @return how many bytes _write_yaml_binary_block() writes for a value of that size
+    '''
+
+    whole_lines, remainder = divmod(value_size, _YAML_BASE64_LINE_BYTES)
+
+    # every line is the indent, 4 characters for each (started) 3 bytes, and a newline
+    block_size = len(f"{' ' * indent}{key}: !!binary |\n".encode("utf-8"))
+    block_size += whole_lines * (indent + 2 + _YAML_BASE64_LINE_BYTES * 4 // 3 + 1)
+
+    if remainder:
+        block_size += indent + 2 + -(-remainder // 3) * 4 + 1
+
+    return block_size
+
+
+def _is_long_plain_base64_string(yaml_handle, value) -> bool:
+    '''
+    @return true if ruamel would write the string as a plain scalar on the line after its key,
+    that is it is longer than a line, only has base64 characters and isn't read back
+    as something other than a string (like a very long number)
+    '''
+
+    if not isinstance(value, str) or len(value) <= _YAML_LINE_WIDTH or value.strip(_BASE64_CHARACTERS):
+        return False
+
+    import ruamel.yaml
+
+    return yaml_handle.resolver.resolve(ruamel.yaml.nodes.ScalarNode, value, (True, False)) == _YAML_STR_TAG
+
+
+def write_yaml_write_files_entry(entry:dict, file_handle):
+    '''
+    writes a single `write_files` list item, the result of FileToWrite.format_as_yaml_dict()
+
+    @param entry - the dict for the entry
+    @param file_handle - the text file handle to write to
+    '''
+
+    yaml_handle = _get_yaml_handle()
+
+    entry_keys = list(entry.keys())
+
+    # the content always comes last and is the big part, so let ruamel do the
+    # rest of the keys and write the content ourselves
+    if len(entry_keys) > 1 and isinstance(entry[entry_keys[-1]], (bytes, StreamedGzipPayload)):
+
+        content_key = entry_keys[-1]
+        content = entry[content_key]
+        content_chunks = content.iter_compressed_chunks() if isinstance(content, StreamedGzipPayload) else (content,)
+
+        yaml_handle.dump([{k: v for k, v in entry.items() if k != content_key}], file_handle)
+        _write_yaml_binary_block(content_key, content_chunks, 2, file_handle)
+
+    elif (len(entry_keys) > 1 and entry.get("encoding") in _BASE64_STRING_ENCODINGS
+            and _is_long_plain_base64_string(yaml_handle, entry[entry_keys[-1]])):
+
+        # base64 text never needs escaping, but ruamel is very slow at figuring that out
+        # for a long string. A plain scalar that doesn't fit on the key's line is put on
+        # the next one, which is what ruamel does too
+        content_key = entry_keys[-1]
+
+        yaml_handle.dump([{k: v for k, v in entry.items() if k != content_key}], file_handle)
+        file_handle.write(f"  {content_key}: \n    {entry[content_key]}\n")
+
+    else:
+        yaml_handle.dump([entry], file_handle)
+
+
+def write_yaml_file_from_dict(input_dict:dict, file_handle):
+    '''
+    streams the cloud-config YAML for the dict straight to the file handle
+
+    this is specialized for the shape that CloudInitSettings.format_as_yaml_dict() returns,
+    and produces exactly the same output as get_yaml_file_string_from_dict(), but it
+    reuses the YAML handle, doesn't build up the whole document as a string first, and
+    writes the `write_files` content without going through ruamel's emitter
+
+    @param input_dict - the dict to write out
+    @param file_handle - the text file handle to write to
+    '''
+
+    yaml_handle = _get_yaml_handle()
+
+    # cloud-init needs needs the comment to not have a space after the `#`
+    file_handle.write("#cloud-config\n")
+
+    # top level block mappings are just each key one after another, so dump them one at a time
+    for iter_key, iter_value in input_dict.items():
+
+        if iter_key == "write_files" and iter_value:
+
+            file_handle.write(f"{iter_key}:\n")
+
+            for iter_entry in iter_value:
+                write_yaml_write_files_entry(iter_entry, file_handle)
+
+        else:
+            yaml_handle.dump({iter_key: iter_value}, file_handle)
+
+
 def _get_key_or_throw(conf_obj, key, type_:HoconTypesEnum):
     '''
     returns the value at the hocon config for the given key, or throws
@@ -127,6 +638,220 @@ def isDirectoryType(filePath):
     return path_resolved
 
 
+# resolved path -> ((mtime_ns, size), ConfigTree), keyed on just the path so that when a file changes
+# its entry is replaced rather than added to, and a long running process (serve, --watch) only ever
+# holds on to the latest parse of each file
+_parsed_hocon_files = dict()
+
+# (the resolved layer paths, the list merge strategies) -> (the stat keys of the layers, merged ConfigTree)
+_parsed_config_layers = dict()
+
+
+def _parse_hocon_file_memoized(resolved_path:str, mtime_ns:int, size:int):
+
+    memo_entry = _parsed_hocon_files.get(resolved_path)
+
+    if memo_entry is not None and memo_entry[0] == (mtime_ns, size):
+        return memo_entry[1]
+
+    import pyhocon
+
+    with metrics.span("hocon_parse", path=resolved_path) as metrics_span:
+        metrics_span.set_bytes(bytes_in=size)
+        config_obj = pyhocon.ConfigFactory.parse_file(resolved_path)
+
+    _parsed_hocon_files[resolved_path] = ((mtime_ns, size), config_obj)
+
+    return config_obj
+
+
+def clear_parsed_config_memos():
+    '''
+    forget every ConfigTree that parse_hocon_file() and parse_config_layers() have handed
+    out, those are only parsed again when the file itself changes, not when a file it
+    includes does, so a long running process that knows an include changed calls this
+    '''
+
+    _parsed_hocon_files.clear()
+    _parsed_config_layers.clear()
+
+
+def get_config_input_paths(config_paths:typing.Sequence[pathlib.Path],
+    list_merge_strategies:typing.Mapping[str, ListMergeStrategyEnum]) -> typing.Sequence[str]:
+    '''
+    @param config_paths - the `--config` layers
+    @param list_merge_strategies - see merge_config_layers()
+    @return the resolved paths of the layers and every file they include, or just the layers
+    if they include something that isn't a file (like a url)
+    '''
+
+    from cloud_init_utils.config_cache import ParsedConfigCache
+
+    cache_key_and_inputs = ParsedConfigCache.get_layered_cache_key(config_paths, list_merge_strategies)
+
+    if cache_key_and_inputs is None:
+        return [str(pathlib.Path(iter_path).expanduser().resolve()) for iter_path in config_paths]
+
+    return list(cache_key_and_inputs[1])
+
+
+def parse_hocon_file(config_path:pathlib.Path):
+    '''
+    parse a HOCON file, each file is only parsed once per process (unless it changes)
+
+    the same ConfigTree is handed back to every caller, so don't modify it, see
+    apply_host_overrides() which works on a copy
+
+    @param config_path - the path to the HOCON file
+    @return the ConfigTree
+    '''
+
+    resolved_path = pathlib.Path(config_path).expanduser().resolve()
+    path_stat = resolved_path.stat()
+
+    return _parse_hocon_file_memoized(str(resolved_path), path_stat.st_mtime_ns, path_stat.st_size)
+
+
+def _merge_lists_by_file_path(base_list:list, layer_list:list, key:str) -> list:
+
+    file_path_key = constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_FILE_PATH
+
+    for iter_entry in base_list + layer_list:
+        if not hasattr(iter_entry, "get"):
+            raise Exception(f"`{key}` can only be merged by `{file_path_key}` if every entry is an object, got `{iter_entry}`")
+
+    merged_list = list(base_list)
+    index_by_file_path = {iter_entry.get(file_path_key, None): iter_index for iter_index, iter_entry in enumerate(merged_list)}
+
+    for iter_entry in layer_list:
+
+        file_path = iter_entry.get(file_path_key, None)
+
+        # the entry takes the place of the earlier one, so the order of write_files stays the same
+        if file_path in index_by_file_path:
+            merged_list[index_by_file_path[file_path]] = iter_entry
+        else:
+            index_by_file_path[file_path] = len(merged_list)
+            merged_list.append(iter_entry)
+
+    return merged_list
+
+
+def merge_config_layers(config_objs:typing.Sequence, list_merge_strategies:typing.Mapping[str, ListMergeStrategyEnum]):
+    '''
+    merge the `--config` layers (like base, role and host) into one config, later layers
+    win like they would in a HOCON file, except for the lists in `list_merge_strategies`
+
+    each layer is parsed on its own, so a substitution in one layer can't refer to a key
+    that only an earlier layer has
+
+    @param config_objs - the root config object of each layer, in order, these are left untouched
+    @param list_merge_strategies - a dict of dotted key (relative to the top level group) -> ListMergeStrategyEnum
+    @return a new ConfigTree
+    '''
+
+    merged_config_obj = copy.deepcopy(config_objs[0])
+    top_level_prefix = f"{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}."
+
+    for iter_config_obj in config_objs[1:]:
+
+        for iter_key, iter_value in _flatten_config_tree(iter_config_obj).items():
+
+            relative_key = iter_key[len(top_level_prefix):] if iter_key.startswith(top_level_prefix) else iter_key
+            strategy = list_merge_strategies.get(relative_key, ListMergeStrategyEnum.REPLACE)
+            existing_value = merged_config_obj.get(iter_key, None)
+
+            if strategy != ListMergeStrategyEnum.REPLACE and isinstance(existing_value, list) and isinstance(iter_value, list):
+
+                if strategy == ListMergeStrategyEnum.APPEND:
+                    iter_value = existing_value + iter_value
+                elif strategy == ListMergeStrategyEnum.MERGE_BY_FILE_PATH:
+                    iter_value = _merge_lists_by_file_path(existing_value, iter_value, relative_key)
+                else:
+                    raise Exception(f"unknown ListMergeStrategyEnum type `{strategy}`")
+
+            merged_config_obj.put(iter_key, copy.deepcopy(iter_value))
+
+    return merged_config_obj
+
+
+def _parse_config_layers_memoized(layer_stat_keys:tuple, list_merge_strategies:tuple):
+
+    memo_key = (tuple(iter_stat_key[0] for iter_stat_key in layer_stat_keys), list_merge_strategies)
+    memo_entry = _parsed_config_layers.get(memo_key)
+
+    if memo_entry is not None and memo_entry[0] == layer_stat_keys:
+        return memo_entry[1]
+
+    config_objs = [_parse_hocon_file_memoized(*iter_stat_key) for iter_stat_key in layer_stat_keys]
+    merged_config_obj = merge_config_layers(config_objs, dict(list_merge_strategies))
+
+    _parsed_config_layers[memo_key] = (layer_stat_keys, merged_config_obj)
+
+    return merged_config_obj
+
+
+def parse_config_layers(config_paths:typing.Sequence[pathlib.Path], list_merge_strategies:typing.Mapping[str, ListMergeStrategyEnum]):
+    '''
+    parse the `--config` layers and merge them, each file is only parsed once per process
+    (unless it changes) however many layer stacks it is in, and the same stack is only merged once
+
+    like parse_hocon_file(), the same ConfigTree is handed back to every caller, so don't modify it
+
+    @param config_paths - the HOCON files, in order
+    @param list_merge_strategies - see merge_config_layers()
+    @return the ConfigTree
+    '''
+
+    if len(config_paths) == 1:
+        return parse_hocon_file(config_paths[0])
+
+    layer_stat_keys = []
+
+    for iter_config_path in config_paths:
+
+        resolved_path = pathlib.Path(iter_config_path).expanduser().resolve()
+        path_stat = resolved_path.stat()
+        layer_stat_keys.append((str(resolved_path), path_stat.st_mtime_ns, path_stat.st_size))
+
+    list_merge_strategies_key = tuple(sorted(list_merge_strategies.items(), key=lambda iter_item: iter_item[0]))
+
+    return _parse_config_layers_memoized(tuple(layer_stat_keys), list_merge_strategies_key)
+
+
+def load_config_settings(config_paths:typing.Sequence[pathlib.Path], config_cache=None, list_merge_strategies=None) -> ConfigFileSettings:
+    '''
+    get the ConfigFileSettings for the `--config` layers, from the ParsedConfigCache if none of the
+    files that went into it have changed, or by parsing it (and caching the result) if they have
+
+    @param config_paths - the HOCON files, in order, later ones are merged on top of the earlier ones
+    @param config_cache - an optional ParsedConfigCache
+    @param list_merge_strategies - see merge_config_layers(), defaults to CONFIG_LAYER_DEFAULT_LIST_MERGE_STRATEGIES
+    @return the ConfigFileSettings
+    '''
+
+    if list_merge_strategies is None:
+        list_merge_strategies = get_default_list_merge_strategies()
+
+    cache_key_and_inputs = config_cache.get_layered_cache_key(config_paths, list_merge_strategies) if config_cache is not None else None
+
+    if cache_key_and_inputs is not None:
+
+        cache_key, input_paths = cache_key_and_inputs
+        config_settings = config_cache.load(config_paths, cache_key)
+
+        if config_settings is not None:
+            logger.debug("loaded the config `%s` from the parsed config cache", ", ".join(str(iter_path) for iter_path in config_paths))
+            return config_settings
+
+    config_settings = parse_config(parse_config_layers(config_paths, list_merge_strategies))
+
+    if cache_key_and_inputs is not None:
+        config_cache.store(config_paths, cache_key, input_paths, config_settings)
+
+    return config_settings
+
+
 def hocon_config_file_type(stringArg):
     ''' argparse type method that returns a pyhocon Config object
     or raises an argparse.ArgumentTypeError if this file doesn't exist
@@ -141,7 +866,7 @@ def hocon_config_file_type(stringArg):
 
     conf = None
     try:
-        conf = pyhocon.ConfigFactory.parse_file(str(resolved_path))
+        conf = parse_hocon_file(resolved_path)
     except Exception as e:
         raise argparse.ArgumentTypeError(
             "Failed to parse the file `{}` as a HOCON file due to an exception: `{}`".format(resolved_path, e))
@@ -149,151 +874,336 @@ def hocon_config_file_type(stringArg):
     return conf
 
 
-def _parse_commands_to_run_list(
-     config_obj_list:typing.Sequence[pyhocon.config_tree.ConfigTree]) -> typing.Sequence[FileToWrite]:
+def parse_config(config_obj) -> ConfigFileSettings:
+    ''' parse the config into our settings object
 
+    this goes through the schema compiled from the attrs classes in model.py, so
+    every problem with the config is reported at once in a ConfigValidationException
 
-    list_of_commands_to_run = []
+    @param config_obj - the root config object
+    @return a ConfigFileSettings
+    '''
 
-    for iter_command_to_run_config_obj in config_obj_list:
+    top_level_key = f"{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}"
 
-        cmd_line_key = f"{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMAND_LINE}"
-        cmd_line_list = _get_key_or_throw(iter_command_to_run_config_obj, cmd_line_key, HoconTypesEnum.LIST)
+    with metrics.span("parse_config"):
+        return config_schema.get_schema(ConfigFileSettings).convert(config_obj, top_level_key)
 
 
-        acceptable_status_codes_list_key = f"{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ACCEPTABLE_STATUS_CODES_LIST}"
-        acceptable_status_codes_list = _get_key_or_throw(iter_command_to_run_config_obj, acceptable_status_codes_list_key, HoconTypesEnum.LIST)
+def _flatten_config_tree(config_obj, prefix:str="") -> typing.Mapping[str, typing.Any]:
+    '''
+    flattens a (possibly nested) ConfigTree into a mapping of dotted keys to
+    leaf values, lists are treated as leaves so they get replaced wholesale
 
-        list_of_commands_to_run.append(CommandToRun(
-            command_line=cmd_line_list,
-            acceptable_status_codes=acceptable_status_codes_list))
+    @param config_obj - the ConfigTree to flatten
+    @param prefix - the dotted key prefix to prepend to every key
+    @return a dict of dotted key -> value
+    '''
 
-    return list_of_commands_to_run
+    import pyhocon
 
-def _parse_files_to_write_list(
-    config_obj_list:typing.Sequence[pyhocon.config_tree.ConfigTree]) -> typing.Sequence[FileToWrite]:
+    flattened = dict()
 
-    list_of_files_to_write_objs = []
+    for iter_key, iter_value in config_obj.items():
 
-    for iter_file_to_write_config_obj in config_obj_list:
+        full_key = f"{prefix}.{iter_key}" if prefix else f"{iter_key}"
 
-        file_path_key = f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_FILE_PATH}"
-        file_path = _get_key_or_throw(iter_file_to_write_config_obj, file_path_key, HoconTypesEnum.STRING)
+        if isinstance(iter_value, pyhocon.config_tree.ConfigTree):
+            flattened.update(_flatten_config_tree(iter_value, full_key))
+        else:
+            flattened[full_key] = iter_value
 
-        owner_username_key =  f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_OWNER_USERNAME}"
-        owner_username = _get_key_or_throw(iter_file_to_write_config_obj, owner_username_key, HoconTypesEnum.STRING)
+    return flattened
 
-        owner_group_key =  f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_OWNER_GROUP}"
-        owner_group = _get_key_or_throw(iter_file_to_write_config_obj, owner_group_key, HoconTypesEnum.STRING)
 
-        use_mustache_template_key = f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_USE_MUSTACHE_TEMPLATE}"
-        use_mustache_template = _get_key_or_throw(iter_file_to_write_config_obj, use_mustache_template_key, HoconTypesEnum.BOOLEAN)
+def _get_hosts_manifest_format(manifest_path:pathlib.Path) -> HostsManifestFormatEnum:
+    '''
+    figure out what format the hosts manifest is in based on its extension
 
-        permission_octal_key =  f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PERMISSION_OCTAL}"
-        permission_octal = _get_key_or_throw(iter_file_to_write_config_obj, permission_octal_key, HoconTypesEnum.STRING)
+    @param manifest_path - the path to the manifest
+    @return a member of HostsManifestFormatEnum
+    '''
 
-        payload_is_base64_key =  f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_IS_BASE64}"
-        payload_is_base64 = _get_key_or_throw(iter_file_to_write_config_obj, payload_is_base64_key, HoconTypesEnum.BOOLEAN)
+    suffix = manifest_path.suffix.lower()
 
-        payload_content_key =  f"{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_PAYLOAD_CONTENT}"
-        payload_content = _get_key_or_throw(iter_file_to_write_config_obj, payload_content_key, HoconTypesEnum.STRING)
+    if suffix == ".csv":
+        return HostsManifestFormatEnum.CSV
+    elif suffix in (".jsonl", ".json"):
+        return HostsManifestFormatEnum.JSONL
+    elif suffix in (".conf", ".hocon"):
+        return HostsManifestFormatEnum.HOCON
+    else:
+        raise Exception(f"unknown hosts manifest extension `{suffix}` for `{manifest_path}`, expected .csv, .jsonl or .conf")
 
 
-        new_obj = FileToWrite(
-            file_path=file_path,
-            owner_username=owner_username,
-            owner_group=owner_group,
-            permission_octal=permission_octal,
-            use_mustache_template=use_mustache_template,
-            payload_is_base64=payload_is_base64,
-            payload_content=payload_content)
+def _host_overrides_from_config_tree(row_config_obj, row_description:str) -> HostOverrides:
+    '''
+    turns a single manifest row (as a ConfigTree) into a HostOverrides object
 
-        list_of_files_to_write_objs.append(new_obj)
+    @param row_config_obj - the ConfigTree for the row
+    @param row_description - a description of where this row came from, for error messages
+    @return a HostOverrides object
+    '''
 
-    return list_of_files_to_write_objs
+    hostname_key = f"{constants.HOSTS_MANIFEST_KEY_HOSTNAME}"
 
-def parse_config(config_obj) -> ConfigFileSettings:
-    ''' parse the config into our settings object
+    try:
+        hostname = _get_key_or_throw(row_config_obj, hostname_key, HoconTypesEnum.STRING)
+    except Exception as e:
+        raise Exception(f"hosts manifest row {row_description} is missing a hostname: `{e}`") from e
+
+    # the hostname ends up as a file name, so don't let it escape the output folder
+    if not hostname or hostname in (".", "..") or "/" in hostname or "\\" in hostname:
+        raise Exception(f"hosts manifest row {row_description} has an invalid hostname `{hostname}`")
 
+    overrides = _flatten_config_tree(row_config_obj)
+    del overrides[hostname_key]
+
+    return HostOverrides(hostname=hostname, overrides=overrides)
+
+
+def _parse_hosts_manifest_cell(cell:str, key:str, row_description:str):
     '''
+    turns a CSV cell into the value of its override
 
+    cells are taken as literal strings (the config schema converts them to numbers and
+    booleans where it needs to), so a `#` or a `${VAR}` in a password is kept as is. Only a
+    cell that is a JSON list or object is parsed, as JSON
 
-    top_level_key = f"{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}"
-    top_level_obj = _get_key_or_throw(config_obj, top_level_key, HoconTypesEnum.CONFIG)
+    @param cell - the text of the cell
+    @param key - the column, for error messages
+    @param row_description - a description of where this row came from, for error messages
+    @return the value
+    '''
 
-    # bootstrap script settings group
+    stripped_cell = cell.strip()
 
-    bootstrap_script_group_key = f"{top_level_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_GROUP}"
-    bootstrap_script_group = _get_key_or_throw(config_obj, bootstrap_script_group_key, HoconTypesEnum.CONFIG)
+    if not stripped_cell.startswith(("[", "{")):
+        return cell
 
-    root_folder_key = f"{bootstrap_script_group_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ROOT_FOLDER}"
-    root_folder = _get_key_or_throw(config_obj, root_folder_key, HoconTypesEnum.STRING)
+    try:
+        return json.loads(stripped_cell)
+    except ValueError as e:
+        raise Exception(f"hosts manifest row {row_description} has a `{key}` that isn't a valid JSON list or object: `{e}`") from e
 
-    zip_url_key = f"{bootstrap_script_group_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ZIP_URL}"
-    zip_url = _get_key_or_throw(config_obj, zip_url_key, HoconTypesEnum.STRING)
 
-    zip_root_folder_key = f"{bootstrap_script_group_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_ZIP_ROOT_FOLDER}"
-    zip_root_folder = _get_key_or_throw(config_obj, zip_root_folder_key, HoconTypesEnum.STRING)
+def _add_hosts_manifest_row(list_of_host_overrides:list, seen_hostnames:set, row_config_obj, row_description:str):
+    '''
+    add a row to the HostOverrides, a hostname can only be in one row, the ones after
+    the first are rejected rather than rendering over each other
 
+    @param seen_hostnames - the hostnames of the rows so far, including the ones that failed
+    '''
 
-    commands_to_run_key = f"{bootstrap_script_group_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_COMMANDS_TO_RUN_LIST}"
-    commands_to_run_obj = _get_key_or_throw(config_obj, commands_to_run_key, HoconTypesEnum.LIST)
-    commands_to_run = _parse_commands_to_run_list(commands_to_run_obj)
+    host_overrides = _host_overrides_from_config_tree(row_config_obj, row_description)
 
+    if host_overrides.hostname in seen_hostnames:
+        raise Exception(f"hosts manifest row {row_description} has the hostname `{host_overrides.hostname}`, which an earlier row already has")
 
-    bootstrap_files_to_write_list_key = f"{bootstrap_script_group_key}.{constants.HOCON_CONFIG_KEY_BOOTSTRAP_SCRIPT_SETTINGS_FILES_TO_WRITE_LIST}"
-    bootstrap_files_to_write_list = _get_key_or_throw(config_obj, bootstrap_files_to_write_list_key, HoconTypesEnum.LIST)
+    seen_hostnames.add(host_overrides.hostname)
+    list_of_host_overrides.append(host_overrides)
 
-    list_of_bootstrap_files_to_write = _parse_files_to_write_list(bootstrap_files_to_write_list)
 
-    bootstrap_script_settings = BootstrapScriptSettings(
-        root_folder=root_folder,
-        zip_url=zip_url,
-        zip_root_folder=zip_root_folder,
-        commands_to_run=commands_to_run,
-        files_to_write=list_of_bootstrap_files_to_write
-    )
+def _add_failed_hosts_manifest_row(failed_rows:typing.Optional[dict], seen_hostnames:set, hostname, row_description:str, exception:Exception):
+    '''
+    record a row that couldn't be parsed, or raise the exception if the caller doesn't
+    want the rest of the rows
 
+    @param failed_rows - the dict of hostname -> exception that was given to parse_hosts_manifest(), a
+    row without a hostname is under its row description, and one whose hostname an earlier row already
+    has is under the hostname and the row description, so it doesn't stand in for the earlier row
+    @param seen_hostnames - see _add_hosts_manifest_row()
+    '''
 
-    # cloud init settings group
+    if failed_rows is None:
+        raise exception
 
-    cloud_init_settings_key = f"{top_level_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_SETTINGS_GROUP}"
+    if not isinstance(hostname, str) or not hostname:
+        failed_rows[row_description] = exception
 
-    username_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_USER_NAME}"
-    username = _get_key_or_throw(config_obj, username_key, HoconTypesEnum.STRING)
+    elif hostname in seen_hostnames:
+        failed_rows[f"{hostname} ({row_description})"] = exception
 
-    password_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_PASSWORD}"
-    password = _get_key_or_throw(config_obj, password_key, HoconTypesEnum.STRING)
+    else:
+        seen_hostnames.add(hostname)
+        failed_rows[hostname] = exception
 
-    ssh_auths_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_SSH_AUTH_KEYS}"
-    ssh_auths_list = _get_key_or_throw(config_obj, ssh_auths_key, HoconTypesEnum.LIST)
 
-    byobu_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_BYOBU_ENABLE}"
-    byobu_enable = _get_key_or_throw(config_obj, byobu_key, HoconTypesEnum.BOOLEAN)
+def parse_hosts_manifest(manifest_path:pathlib.Path, failed_rows:typing.Optional[dict]=None) -> typing.Sequence[HostOverrides]:
+    '''
+    parse a hosts manifest file into a list of HostOverrides
+
+    the manifest can be one of:
+
+    * a CSV file with a header row, one column has to be `hostname`, the rest of
+    the columns are dotted HOCON keys (relative to the top level group). Each cell is
+    the value as is, unless it is a JSON list or object like `["nginx", "git"]`.
+    empty cells mean 'no override'
+    * a JSONL file, one JSON object per line, with a `hostname` key, the rest of the keys
+    are dotted HOCON keys (or nested objects)
+    * a HOCON file with a `hosts` list of objects, each with a `hostname` key
+
+    @param manifest_path - the path to the manifest file
+    @param failed_rows - if given, a row that can't be parsed (or has a bad hostname, or the
+    same hostname as an earlier row) is added to this dict of hostname -> exception and the rest
+    of the rows are still returned, otherwise the first bad row raises
+    @return a list of HostOverrides objects
+    '''
 
-    install_list_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_PACKAGES_TO_INSTALL_LIST}"
-    to_install_list = _get_key_or_throw(config_obj, install_list_key, HoconTypesEnum.LIST)
+    import pyhocon
 
+    manifest_format = _get_hosts_manifest_format(manifest_path)
 
-    files_to_write_key = f"{cloud_init_settings_key}.{constants.HOCON_CONFIG_KEY_CLOUD_INIT_FILES_TO_WRITE_LIST}"
-    files_to_write_list = _get_key_or_throw(config_obj, files_to_write_key, HoconTypesEnum.LIST)
+    list_of_host_overrides = []
+    seen_hostnames = set()
 
+    if manifest_format == HostsManifestFormatEnum.CSV:
 
-    list_of_files_to_write_objs = _parse_files_to_write_list(files_to_write_list)
+        with open(manifest_path, "r", encoding="utf-8", newline="") as f:
 
+            reader = csv.DictReader(f)
 
-    cloud_init_settings = CloudInitSettings(
-        user_name=username,
-        ssh_authorized_keys=ssh_auths_list,
-        password=password,
-        packages_to_install=to_install_list,
-        byobu_enable=byobu_enable,
-        files_to_write=list_of_files_to_write_objs)
+            # line 1 is the header
+            for iter_line_number, iter_row in enumerate(reader, start=2):
 
+                row_description = f"on line `{iter_line_number}` of `{manifest_path}`"
 
-    config_settings = ConfigFileSettings(
-        cloud_init_settings=cloud_init_settings,
-        bootstrap_script_settings=bootstrap_script_settings)
+                try:
 
-    return config_settings
+                    row_dict = dict()
+                    for iter_key, iter_cell in iter_row.items():
+
+                        if iter_cell is None or iter_cell == "":
+                            continue
+
+                        if iter_key == constants.HOSTS_MANIFEST_KEY_HOSTNAME:
+                            row_dict[iter_key] = iter_cell
+                        else:
+                            row_dict[iter_key] = _parse_hosts_manifest_cell(iter_cell, iter_key, row_description)
+
+                    row_config_obj = pyhocon.ConfigFactory.from_dict(row_dict)
+                    _add_hosts_manifest_row(list_of_host_overrides, seen_hostnames, row_config_obj, row_description)
+
+                except Exception as e:
+                    _add_failed_hosts_manifest_row(failed_rows, seen_hostnames, iter_row.get(constants.HOSTS_MANIFEST_KEY_HOSTNAME), row_description, e)
+
+    elif manifest_format == HostsManifestFormatEnum.JSONL:
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+
+            for iter_line_number, iter_line in enumerate(f, start=1):
+
+                if not iter_line.strip():
+                    continue
+
+                row_description = f"on line `{iter_line_number}` of `{manifest_path}`"
+                row = None
+
+                try:
+                    try:
+                        row = json.loads(iter_line)
+                    except ValueError as e:
+                        raise Exception(f"hosts manifest row {row_description} isn't valid JSON: `{e}`") from e
+
+                    if not isinstance(row, dict):
+                        raise Exception(f"hosts manifest row {row_description} isn't a JSON object")
+
+                    row_config_obj = pyhocon.ConfigFactory.from_dict(row)
+                    _add_hosts_manifest_row(list_of_host_overrides, seen_hostnames, row_config_obj, row_description)
+
+                except Exception as e:
+                    hostname = row.get(constants.HOSTS_MANIFEST_KEY_HOSTNAME) if isinstance(row, dict) else None
+                    _add_failed_hosts_manifest_row(failed_rows, seen_hostnames, hostname, row_description, e)
+
+    elif manifest_format == HostsManifestFormatEnum.HOCON:
+
+        manifest_config_obj = pyhocon.ConfigFactory.parse_file(str(manifest_path))
+
+        hosts_list_key = f"{constants.HOCON_CONFIG_KEY_HOSTS_MANIFEST_HOSTS_LIST}"
+        hosts_list = _get_key_or_throw(manifest_config_obj, hosts_list_key, HoconTypesEnum.LIST)
+
+        for iter_index, iter_row_config_obj in enumerate(hosts_list):
+
+            row_description = f"at index `{iter_index}` of `{manifest_path}`"
+
+            try:
+                _add_hosts_manifest_row(list_of_host_overrides, seen_hostnames, iter_row_config_obj, row_description)
+            except Exception as e:
+                hostname = iter_row_config_obj.get(constants.HOSTS_MANIFEST_KEY_HOSTNAME, None) if hasattr(iter_row_config_obj, "get") else None
+                _add_failed_hosts_manifest_row(failed_rows, seen_hostnames, hostname, row_description, e)
+
+    else:
+        raise Exception(f"unknown HostsManifestFormatEnum type `{manifest_format}`")
+
+    return list_of_host_overrides
+
+
+def _shallow_copy_config_tree(config_obj):
+    '''
+    @return a new ConfigTree with the same keys and (shared) values as `config_obj`
+    '''
+
+    import pyhocon
+
+    copied_config_obj = pyhocon.ConfigTree(root=config_obj.root)
+
+    # the raw items, since ConfigTree's own constructor re-parents any ConfigValues in it (which
+    # are shared) and its __getitem__ copies lists
+    collections.OrderedDict.update(copied_config_obj, dict.items(config_obj))
+
+    if config_obj.root:
+        copied_config_obj.history = {iter_key: list(iter_history) for iter_key, iter_history in config_obj.history.items()}
+
+    return copied_config_obj
+
+
+def apply_host_overrides(config_obj, host_overrides:HostOverrides):
+    '''
+    returns a copy of the given HOCON config with the host's overrides applied,
+    the original config is left untouched so it can be reused for every host
+
+    only the ConfigTrees on the way to an overridden key are copied, everything else
+    (like the payloads) is shared with the original config
+
+    @param config_obj - the base config object (the root object)
+    @param host_overrides - the HostOverrides for the host
+    @return a new ConfigTree
+    '''
+
+    import pyhocon
+
+    host_config_obj = _shallow_copy_config_tree(config_obj)
+
+    # the ids of the trees that belong to this host already, so they aren't copied twice
+    copied_tree_ids = {id(host_config_obj)}
+
+    for iter_key, iter_value in host_overrides.overrides.items():
+
+        full_key = f"{constants.HOCON_CONFIG_KEY_TOP_LEVEL_GROUP}.{iter_key}"
+        key_parts = pyhocon.ConfigTree.parse_key(full_key)
+
+        current_config_obj = host_config_obj
+
+        for iter_index, iter_key_part in enumerate(key_parts):
+
+            child_config_obj = dict.get(current_config_obj, iter_key_part)
+
+            if not isinstance(child_config_obj, pyhocon.ConfigTree):
+                break
+
+            if id(child_config_obj) not in copied_tree_ids:
+
+                # putting a ConfigTree merges it into the one that is there, all the way down
+                if iter_index == len(key_parts) - 1 and isinstance(iter_value, pyhocon.ConfigTree):
+                    child_config_obj = copy.deepcopy(child_config_obj)
+                else:
+                    child_config_obj = _shallow_copy_config_tree(child_config_obj)
+
+                collections.OrderedDict.__setitem__(current_config_obj, iter_key_part, child_config_obj)
+                copied_tree_ids.add(id(child_config_obj))
+
+            current_config_obj = child_config_obj
+
+        host_config_obj.put(full_key, iter_value)
 
+    return host_config_obj
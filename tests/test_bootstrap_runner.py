@@ -0,0 +1,128 @@
+import os
+import grp
+import pwd
+import sys
+import pathlib
+import tempfile
+import unittest
+import zipfile
+import subprocess
+
+from cloud_init_utils import utils
+from cloud_init_utils.bootstrap_script import render_bootstrap_runner
+
+
+# the zip is extracted into root_folder, the commands run from `bootstrap` inside it. `prepare` has
+# to finish first, then `left` and `right` can run at the same time, and `finish` waits for both
+COMMANDS_TO_RUN = '''[
+      { name = "prepare", command_line = ["sh", "prepare.sh"], acceptable_status_codes = [0] }
+      { name = "left", command_line = ["sh", "append.sh", "left"], acceptable_status_codes = [0], depends_on = ["prepare"] }
+      { name = "right", command_line = ["sh", "append.sh", "right"], acceptable_status_codes = [0], depends_on = ["prepare"] }
+      { name = "finish", command_line = ["sh", "append.sh", "finish"], acceptable_status_codes = [0], depends_on = ["left", "right"] }
+    ]'''
+
+CONFIG_TEMPLATE = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "ROOT_FOLDER"
+    zip_url = "ZIP_URL"
+    zip_root_folder = "bootstrap"
+    max_parallel_commands = 2
+    commands_to_run = COMMANDS_TO_RUN
+    files_to_write = [
+      { file_path = "ROOT_FOLDER/etc/app.conf", owner_username = "OWNER_USERNAME", owner_group = "OWNER_GROUP",
+        permission_octal = "0600", use_mustache_template = false, payload_is_base64 = false,
+        payload_content = "setting = 1\\n" }
+    ]
+  }
+  cloud_init_yaml_settings {
+    user_name = "mark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = []
+    files_to_write = []
+  }
+}
+'''
+
+
+class TestBootstrapRunner(unittest.TestCase):
+    '''
+    renders the bootstrap runner for a config and runs the script it renders, like cloud-init would
+    '''
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+        self.root_folder = self.temp_dir / "root"
+
+        zip_path = self.temp_dir / "bootstrap.zip"
+
+        with zipfile.ZipFile(zip_path, "w") as zip_file:
+            zip_file.writestr("bootstrap/prepare.sh", "echo prepare > ../order.txt\n")
+            zip_file.writestr("bootstrap/append.sh", "echo \"$1\" >> ../order.txt\n")
+            zip_file.writestr("bootstrap/fail.sh", "exit 3\n")
+
+        self.zip_url = zip_path.as_uri()
+
+    def render_and_run(self, commands_to_run:str) -> subprocess.CompletedProcess:
+
+        config_text = (CONFIG_TEMPLATE
+            .replace("COMMANDS_TO_RUN", commands_to_run)
+            .replace("ROOT_FOLDER", str(self.root_folder))
+            .replace("ZIP_URL", self.zip_url)
+            .replace("OWNER_USERNAME", pwd.getpwuid(os.getuid()).pw_name)
+            .replace("OWNER_GROUP", grp.getgrgid(os.getgid()).gr_name))
+
+        config_path = self.temp_dir / "test.conf"
+        config_path.write_text(config_text, encoding="utf-8")
+
+        config = utils.load_config_settings([config_path])
+
+        script_path = self.temp_dir / "bootstrap.py"
+        script_path.write_text(render_bootstrap_runner(config.bootstrap_script_settings), encoding="utf-8")
+
+        return subprocess.run([sys.executable, str(script_path)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+
+    def test_runs_the_commands_in_dependency_order(self):
+
+        completed = self.render_and_run(COMMANDS_TO_RUN)
+
+        self.assertEqual(completed.returncode, 0, completed.stdout.decode("utf-8"))
+
+        order = (self.root_folder / "order.txt").read_text(encoding="utf-8").split()
+
+        self.assertEqual(order[0], "prepare")
+        self.assertEqual(sorted(order[1:3]), ["left", "right"])
+        self.assertEqual(order[3], "finish")
+
+        app_config_path = self.root_folder / "etc" / "app.conf"
+
+        self.assertEqual(app_config_path.read_text(encoding="utf-8"), "setting = 1\n")
+        self.assertEqual(app_config_path.stat().st_mode & 0o777, 0o600)
+
+        # running it again doesn't download the zip again, but does run the commands again
+        completed = self.render_and_run(COMMANDS_TO_RUN)
+
+        self.assertEqual(completed.returncode, 0, completed.stdout.decode("utf-8"))
+        self.assertIn(b"was already extracted", completed.stdout)
+
+    def test_failed_command_stops_its_dependents(self):
+
+        commands_to_run = COMMANDS_TO_RUN.replace('["sh", "append.sh", "left"]', '["sh", "fail.sh"]')
+        completed = self.render_and_run(commands_to_run)
+
+        self.assertEqual(completed.returncode, 1, completed.stdout.decode("utf-8"))
+
+        order = (self.root_folder / "order.txt").read_text(encoding="utf-8").split()
+
+        self.assertNotIn("finish", order)
+        self.assertIn(b"`1` command(s) failed: `['left']`", completed.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
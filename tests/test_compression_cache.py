@@ -0,0 +1,72 @@
+import os
+import gzip
+import pickle
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from cloud_init_utils.compression_cache import CompressionCache
+
+
+_SETTINGS = "gzip:level=9:mtime=0"
+
+
+def _compress(raw_content_bytes:bytes) -> bytes:
+    return gzip.compress(raw_content_bytes, 9, mtime=0)
+
+
+class TestCompressionCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.cache_dir = pathlib.Path(self.temp_dir.name) / "compression"
+
+    def test_hit_when_the_mtime_cant_be_updated(self):
+
+        compression_cache = CompressionCache(self.cache_dir, 1024 * 1024)
+        expected = compression_cache.get_or_compress(b"hello world", _SETTINGS, _compress)
+
+        with mock.patch.object(os, "utime", side_effect=PermissionError("read only")):
+            with self.assertLogs("cloud_init_utils.compression_cache", level="WARNING"):
+                self.assertEqual(compression_cache.get_or_compress(b"hello world", _SETTINGS, _compress), expected)
+
+        self.assertEqual(compression_cache.get_stats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+    def test_pickled_copies_dont_scan_the_cache(self):
+
+        compression_cache = CompressionCache(self.cache_dir, 1024 * 1024)
+
+        for iter_index in range(5):
+            compression_cache.get_or_compress(f"payload {iter_index}".encode("utf-8"), _SETTINGS, _compress)
+
+        parent_cache = CompressionCache(self.cache_dir, 1024 * 1024)
+        pickled_cache = pickle.dumps(parent_cache)
+
+        # every copy starts with the size the parent worked out once
+        with mock.patch.object(CompressionCache, "_iter_entries", side_effect=AssertionError("scanned the cache")):
+            for iter_index in range(3):
+                pickle.loads(pickled_cache).get_or_compress(f"new payload {iter_index}".encode("utf-8"), _SETTINGS, _compress)
+
+            pickle.dumps(parent_cache)
+
+    def test_eviction(self):
+
+        payloads = [os.urandom(1000) for _ in range(5)]
+
+        compression_cache = CompressionCache(self.cache_dir, 2500)
+
+        for iter_payload in payloads:
+            compression_cache.get_or_compress(iter_payload, _SETTINGS, _compress)
+
+        entry_sizes = [iter_entry.stat().st_size for iter_entry in compression_cache._iter_entries()]
+
+        self.assertLessEqual(sum(entry_sizes), 2500)
+        self.assertEqual(compression_cache.evictions, 5 - len(entry_sizes))
+
+
+if __name__ == "__main__":
+    unittest.main()
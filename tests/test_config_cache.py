@@ -0,0 +1,91 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import config_cache
+from cloud_init_utils.config_cache import ParsedConfigCache
+
+
+BASE_CONFIG = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "USER_NAME"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = ["htop"]
+    files_to_write = []
+  }
+}
+'''
+
+
+class TestParsedConfigCache(unittest.TestCase):
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+
+    def test_layer_stacks_with_the_same_last_layer(self):
+
+        staging_path = self.temp_dir / "staging.conf"
+        production_path = self.temp_dir / "production.conf"
+        host_path = self.temp_dir / "host.conf"
+
+        staging_path.write_text(BASE_CONFIG.replace("USER_NAME", "staging"), encoding="utf-8")
+        production_path.write_text(BASE_CONFIG.replace("USER_NAME", "production"), encoding="utf-8")
+        host_path.write_text("cloud_init_utils.cloud_init_yaml_settings.packages_to_install = [git]\n", encoding="utf-8")
+
+        config_cache = ParsedConfigCache(self.temp_dir / "parsed_configs")
+
+        for _ in range(2):
+            staging_settings = utils.load_config_settings([staging_path, host_path], config_cache)
+            production_settings = utils.load_config_settings([production_path, host_path], config_cache)
+
+        self.assertEqual(staging_settings.cloud_init_settings.user_name, "staging")
+        self.assertEqual(production_settings.cloud_init_settings.user_name, "production")
+
+        # each stack keeps its own entry, so the second time around both are hits
+        self.assertEqual(config_cache.get_stats()["hits"], 2)
+        self.assertEqual(len(list(config_cache.iter_entries())), 2)
+
+    def test_key_changes_with_the_parsing_code(self):
+
+        config_path = self.temp_dir / "test.conf"
+        config_path.write_text(BASE_CONFIG, encoding="utf-8")
+
+        self.addCleanup(config_cache._get_parser_digest.cache_clear)
+
+        config_cache._get_parser_digest.cache_clear()
+        original_key = ParsedConfigCache.get_cache_key(config_path)[0]
+
+        # the HOCON key names and the layer merging aren't in the models, but change what gets parsed too
+        for iter_module in (constants, utils):
+            with self.subTest(module=iter_module.__name__):
+
+                changed_source_path = self.temp_dir / f"{iter_module.__name__}.py"
+                changed_source_path.write_text(pathlib.Path(iter_module.__file__).read_text(encoding="utf-8") + "\n# changed\n", encoding="utf-8")
+
+                with mock.patch.object(iter_module, "__file__", str(changed_source_path)):
+                    config_cache._get_parser_digest.cache_clear()
+                    self.assertNotEqual(ParsedConfigCache.get_cache_key(config_path)[0], original_key)
+
+        config_cache._get_parser_digest.cache_clear()
+        self.assertEqual(ParsedConfigCache.get_cache_key(config_path)[0], original_key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import time
+import pathlib
+import tempfile
+import unittest
+import threading
+
+from cloud_init_utils.file_watcher import FileWatcher, DependencyGraph
+
+
+class TestFileWatcher(unittest.TestCase):
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        # resolved, since the watcher gets the resolved paths back out of the DependencyGraph
+        self.temp_dir = pathlib.Path(temp_dir.name).resolve()
+
+        self.base_path = self.temp_dir / "base.conf"
+        self.host_path = self.temp_dir / "web1.conf"
+        self.payload_path = self.temp_dir / "payloads" / "motd.txt"
+
+        self.payload_path.parent.mkdir()
+
+        for iter_path in (self.base_path, self.host_path, self.payload_path):
+            iter_path.write_text("version 0\n", encoding="utf-8")
+
+    def test_affected_outputs(self):
+
+        dependency_graph = DependencyGraph()
+
+        dependency_graph.add(self.base_path, "web1")
+        dependency_graph.add(self.base_path, "web2")
+        dependency_graph.add(self.host_path, "web1")
+
+        # relative paths are relative to the current directory, like payload_source_path
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.payload_path.parent)
+        dependency_graph.add("motd.txt", "web2")
+
+        self.assertEqual(dependency_graph.get_input_paths(), set(DependencyGraph.normalize_path(iter_path)
+            for iter_path in (self.base_path, self.host_path, self.payload_path)))
+
+        self.assertEqual(dependency_graph.get_affected_outputs([DependencyGraph.normalize_path(self.base_path)]), {"web1", "web2"})
+        self.assertEqual(dependency_graph.get_affected_outputs([DependencyGraph.normalize_path(self.host_path)]), {"web1"})
+        self.assertEqual(dependency_graph.get_affected_outputs([DependencyGraph.normalize_path(self.payload_path)]), {"web2"})
+        self.assertEqual(dependency_graph.get_affected_outputs([str(self.temp_dir / "other.conf")]), set())
+
+    def test_polling_debounce(self):
+
+        dependency_graph = DependencyGraph()
+
+        dependency_graph.add(self.base_path, "web1")
+        dependency_graph.add(self.base_path, "web2")
+        dependency_graph.add(self.host_path, "web1")
+        dependency_graph.add(self.payload_path, "web3")
+
+        debounce_seconds = 0.3
+
+        file_watcher = FileWatcher(debounce_seconds, 0.01, use_inotify=False)
+        self.addCleanup(file_watcher.close)
+
+        self.assertEqual(file_watcher.mode, "polling")
+
+        file_watcher.set_paths(dependency_graph.get_input_paths())
+
+        last_write_times = []
+
+        # like a `git checkout`, a burst of writes that are closer together than the debounce time
+        def write_burst():
+
+            for iter_version in range(1, 5):
+                time.sleep(0.1)
+                path = self.host_path if iter_version % 2 else self.base_path
+                path.write_text(f"version {iter_version}\n" * iter_version, encoding="utf-8")
+                last_write_times.append(time.monotonic())
+
+        writer_thread = threading.Thread(target=write_burst)
+        writer_thread.start()
+        self.addCleanup(writer_thread.join)
+
+        changed_paths = file_watcher.wait_for_changes()
+        returned_at = time.monotonic()
+
+        writer_thread.join()
+
+        # it only came back once the whole burst was over, with every file in it
+        self.assertEqual(len(last_write_times), 4)
+        self.assertGreaterEqual(returned_at - last_write_times[-1], debounce_seconds)
+        self.assertEqual(changed_paths, {str(self.base_path), str(self.host_path)})
+        self.assertEqual(dependency_graph.get_affected_outputs(changed_paths), {"web1", "web2"})
+
+        # the new signatures are what the next call compares against, so only the payload shows up
+        self.payload_path.write_text("version 5\n", encoding="utf-8")
+
+        self.assertEqual(file_watcher.wait_for_changes(), {str(self.payload_path)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import pathlib
+import tempfile
+import unittest
+
+from cloud_init_utils import main
+from cloud_init_utils import utils
+
+
+CONFIG = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "mark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = ["htop"]
+    files_to_write = []
+  }
+}
+'''
+
+# web1 is in there twice, and the second row of web2 comes after its first row failed
+HOSTS_CSV = '''hostname,cloud_init_yaml_settings.user_name,cloud_init_yaml_settings.packages_to_install
+web1,alice,"[""nginx""]"
+web2,bob,"[not json"
+web1,carol,
+web2,dave,
+web3,erin,
+'''
+
+
+class TestHostsManifest(unittest.TestCase):
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+
+        self.manifest_path = self.temp_dir / "hosts.csv"
+        self.manifest_path.write_text(HOSTS_CSV, encoding="utf-8")
+
+    def test_duplicate_hostnames_are_rejected(self):
+
+        failed_rows = dict()
+        list_of_host_overrides = utils.parse_hosts_manifest(self.manifest_path, failed_rows)
+
+        self.assertEqual([iter_host_overrides.hostname for iter_host_overrides in list_of_host_overrides], ["web1", "web3"])
+        self.assertEqual(list_of_host_overrides[0].overrides["cloud_init_yaml_settings.user_name"], "alice")
+
+        # the rows after the first one with a hostname don't take its place in the failures
+        self.assertEqual(sorted(failed_rows), sorted([
+            "web2",
+            f"web1 (on line `4` of `{self.manifest_path}`)",
+            f"web2 (on line `5` of `{self.manifest_path}`)",
+        ]))
+
+        with self.assertRaisesRegex(Exception, "isn't a valid JSON list or object"):
+            utils.parse_hosts_manifest(self.manifest_path)
+
+    def test_fleet_exits_non_zero_after_rendering_the_rest(self):
+
+        config_path = self.temp_dir / "base.conf"
+        config_path.write_text(CONFIG, encoding="utf-8")
+
+        output_dir = self.temp_dir / "fleet"
+        output_dir.mkdir()
+
+        parsed_args = main.get_argument_parser().parse_args([
+            "--no-cache", "--config", str(config_path),
+            "create_yaml_fleet", "--hosts", str(self.manifest_path), "--output-dir", str(output_dir), "--workers", "1"])
+
+        with self.assertLogs("cloud_init_utils.modules.create_yaml_fleet", level="ERROR") as captured_logs:
+            with self.assertRaises(SystemExit) as captured_exit:
+                parsed_args.func_to_run(None, parsed_args)
+
+        self.assertEqual(captured_exit.exception.code, 1)
+        self.assertEqual(sorted(iter_path.name for iter_path in output_dir.iterdir()), ["web1.yaml", "web3.yaml"])
+        self.assertIn("name: alice", (output_dir / "web1.yaml").read_text(encoding="utf-8"))
+        self.assertTrue(any("`3` hosts failed to render" in iter_line for iter_line in captured_logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
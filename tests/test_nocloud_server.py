@@ -0,0 +1,147 @@
+import os
+import asyncio
+import pathlib
+import tempfile
+import unittest
+import concurrent.futures
+
+from cloud_init_utils import constants
+from cloud_init_utils.nocloud_server import NoCloudServer
+
+
+BASE_CONFIG = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "mark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = ["htop"]
+    files_to_write = []
+  }
+}
+'''
+
+
+class TestNoCloudServer(unittest.TestCase):
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+
+        self.config_dir = self.temp_dir / "instances"
+        self.config_dir.mkdir()
+
+        self.base_config_path = self.temp_dir / "base.conf"
+        self.base_config_path.write_text(BASE_CONFIG, encoding="utf-8")
+
+        # rendering in a thread is enough here, the server only needs something to run_in_executor on
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+
+        self.executor = executor
+
+    def make_server(self, **kwargs) -> NoCloudServer:
+
+        return NoCloudServer(config_dir=self.config_dir, base_config_paths=[self.base_config_path], vendor_data=b"",
+            executor=self.executor, list_merge_strategies=dict(), **kwargs)
+
+    def test_base_only_entries_are_bounded(self):
+
+        (self.config_dir / "web1.conf").write_text("cloud_init_utils.cloud_init_yaml_settings.user_name = alice\n", encoding="utf-8")
+
+        nocloud_server = self.make_server(max_base_only_entries=3)
+
+        async def get_meta_data(instance_id:str) -> bytes:
+            status_code, _, body = await nocloud_server._get_response("GET", f"/{instance_id}/{constants.NOCLOUD_META_DATA_FILE_NAME}", dict())
+            self.assertEqual(status_code, 200)
+            return body
+
+        async def request_everything():
+
+            await get_meta_data("web1")
+
+            for iter_index in range(10):
+                self.assertIn(f"instance-id: made-up-{iter_index}\n".encode("utf-8"), await get_meta_data(f"made-up-{iter_index}"))
+
+            # asking for one again makes it the most recently used, so it outlives the next one
+            await get_meta_data("made-up-7")
+            await get_meta_data("made-up-10")
+
+        asyncio.run(request_everything())
+
+        self.assertEqual(list(nocloud_server._entries), ["web1"])
+        self.assertEqual(list(nocloud_server._base_only_entries), ["made-up-9", "made-up-7", "made-up-10"])
+        self.assertEqual(nocloud_server.stats["renders"], 12)
+        self.assertEqual(nocloud_server.stats["evictions"], 8)
+
+    def test_etags_and_rebuilding_on_change(self):
+
+        host_path = self.config_dir / "web1.conf"
+        host_path.write_text("cloud_init_utils.cloud_init_yaml_settings.user_name = alice\n", encoding="utf-8")
+
+        nocloud_server = self.make_server(check_interval=0)
+        user_data_target = f"/web1/{constants.NOCLOUD_USER_DATA_FILE_NAME}"
+
+        async def request_everything() -> list:
+
+            responses = [
+                await nocloud_server._get_response("GET", user_data_target, dict()),
+                await nocloud_server._get_response("GET", user_data_target, {"accept-encoding": "gzip"}),
+            ]
+
+            etag, gzip_etag = responses[0][1]["ETag"], responses[1][1]["ETag"]
+
+            responses += [
+                await nocloud_server._get_response("GET", user_data_target, {"if-none-match": etag}),
+                await nocloud_server._get_response("GET", user_data_target, {"if-none-match": f'"other", W/{gzip_etag}', "accept-encoding": "gzip"}),
+                # the gzip ETag doesn't match the plain representation
+                await nocloud_server._get_response("GET", user_data_target, {"if-none-match": gzip_etag}),
+            ]
+
+            # a newer mtime (and size) makes the next request render it again
+            host_path.write_text("cloud_init_utils.cloud_init_yaml_settings.user_name = bob\n", encoding="utf-8")
+            os.utime(host_path, ns=(10**18, 10**18))
+
+            responses += [
+                await nocloud_server._get_response("GET", user_data_target, {"if-none-match": etag}),
+                await nocloud_server._get_response("POST", user_data_target, dict()),
+                await nocloud_server._get_response("GET", "/web1/../../etc/passwd", dict()),
+            ]
+
+            return responses
+
+        responses = asyncio.run(request_everything())
+        status_codes = [iter_response[0] for iter_response in responses]
+
+        self.assertEqual(status_codes, [200, 200, 304, 304, 200, 200, 405, 404])
+
+        plain_headers, gzip_headers = responses[0][1], responses[1][1]
+
+        self.assertIn(b"name: alice", responses[0][2])
+        self.assertEqual(gzip_headers["Content-Encoding"], "gzip")
+        self.assertNotEqual(plain_headers["ETag"], gzip_headers["ETag"])
+
+        # a 304 has no body, and says nothing about an encoding
+        self.assertEqual(responses[3][2], b"")
+        self.assertNotIn("Content-Encoding", responses[3][1])
+
+        self.assertIn(b"name: bob", responses[5][2])
+        self.assertNotEqual(responses[5][1]["ETag"], plain_headers["ETag"])
+
+        self.assertEqual(nocloud_server.stats["renders"], 2)
+        self.assertEqual(nocloud_server.stats["not_modified"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import gzip
+import pathlib
+import tempfile
+import unittest
+
+from cloud_init_utils import main
+from cloud_init_utils import package_index
+from cloud_init_utils.package_index import AptPackageIndex
+
+
+PACKAGES_FILE = '''Package: nginx
+Version: 1.18.0-6ubuntu14
+Depends: nginx-core (<< 1.18.0-6ubuntu14.1~)
+
+Package: nginx-core
+Version: 1.18.0-6ubuntu14
+Provides: httpd (= 1.0), nginx-full
+
+Package: git
+Version: 1:2.34.1-1ubuntu1
+'''
+
+CONFIG_TEMPLATE = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "mark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = PACKAGES_TO_INSTALL
+    files_to_write = []
+  }
+}
+'''
+
+
+class TestAptPackageIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+        self.cache_dir = self.temp_dir / "package_index"
+
+        self.packages_path = self.temp_dir / "Packages.gz"
+        self.packages_path.write_bytes(gzip.compress(PACKAGES_FILE.encode("utf-8")))
+
+    def open_index(self) -> AptPackageIndex:
+
+        package_index_obj = AptPackageIndex(self.packages_path, self.cache_dir)
+        self.addCleanup(package_index_obj.close)
+
+        return package_index_obj
+
+    def test_lookups(self):
+
+        package_index_obj = self.open_index()
+
+        for iter_entry in ("nginx", "nginx=1.18.0-6ubuntu14", "git=1:2.34.1-1ubuntu1", "httpd", "nginx-full"):
+            with self.subTest(entry=iter_entry):
+                self.assertIn(iter_entry, package_index_obj)
+
+        # the version in `Provides:` isn't a version of the virtual package
+        for iter_entry in ("nginx=1.0", "httpd=1.0", "ngin", "nginx-cor", "zsh"):
+            with self.subTest(entry=iter_entry):
+                self.assertNotIn(iter_entry, package_index_obj)
+
+        self.assertEqual(package_index_obj.get_close_matches("ngnix"), ["nginx"])
+        self.assertEqual(package_index_obj.get_close_matches("zsh"), [])
+
+        # opening it again uses the index that was built the first time
+        self.assertEqual(len(list(self.cache_dir.iterdir())), 1)
+        self.assertEqual(len(self.open_index()), len(package_index_obj))
+
+    def test_package_problems(self):
+
+        package_indexes = [self.open_index()]
+
+        problems = package_index.get_package_problems([
+            "nginx=1.18.0-6ubuntu14", "nginx=1.18*", "nginx=9.9", "git:amd64", "httpd", "ngnix", "lib*-dev", ["git", "1:2.34.1-1ubuntu1"], ["git"],
+        ], package_indexes)
+
+        self.assertEqual(problems, [
+            "the package `nginx` doesn't have the version `9.9` in the package indexes",
+            "the package `ngnix` isn't in the package indexes, did you mean `nginx`?",
+            "`['git']` should be a package name and a version",
+        ])
+
+        # a version glob only needs the name to be there
+        self.assertEqual(package_index.get_package_problems(["ngnix=1.18*"], package_indexes), [
+            "the package `ngnix` isn't in the package indexes, did you mean `nginx`?",
+        ])
+
+    def test_validate_configs_exits_non_zero(self):
+
+        config_dir = self.temp_dir / "configs"
+        config_dir.mkdir()
+
+        (config_dir / "good.conf").write_text(CONFIG_TEMPLATE.replace("PACKAGES_TO_INSTALL", '["nginx=1.18*", "git"]'), encoding="utf-8")
+        (config_dir / "bad.conf").write_text(CONFIG_TEMPLATE.replace("PACKAGES_TO_INSTALL", '["nginx=9.9"]'), encoding="utf-8")
+
+        parsed_args = main.get_argument_parser().parse_args([
+            "--no-cache", "validate_configs", "--config-dir", str(config_dir), "--apt-packages-file", str(self.packages_path)])
+
+        with self.assertLogs("cloud_init_utils.modules.validate_configs", level="ERROR") as captured_logs:
+            with self.assertRaises(SystemExit) as captured_exit:
+                parsed_args.func_to_run(None, parsed_args)
+
+        self.assertEqual(captured_exit.exception.code, 1)
+        self.assertTrue(any("`1` of `2` config files were invalid" in iter_line for iter_line in captured_logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+from cloud_init_utils import utils
+
+
+class TestParsedConfigMemos(unittest.TestCase):
+    '''
+    a long running process (serve, --watch) keeps parsing the same files as they change, the
+    memos have to hand back the latest parse without holding on to every old one
+    '''
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(utils.clear_parsed_config_memos)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+
+    def write_layer(self, path:pathlib.Path, content:str, mtime_s:int):
+
+        path.write_text(content, encoding="utf-8")
+        os.utime(path, ns=(mtime_s * 10**9, mtime_s * 10**9))
+
+    def test_changed_files_replace_their_entries(self):
+
+        base_path = self.temp_dir / "base.conf"
+        host_path = self.temp_dir / "host.conf"
+
+        utils.clear_parsed_config_memos()
+
+        for iter_version in range(20):
+
+            self.write_layer(base_path, f"base_version = {iter_version}\n", iter_version)
+            self.write_layer(host_path, f"host_version = {iter_version}\n", iter_version)
+
+            config_obj = utils.parse_config_layers([base_path, host_path], {})
+
+            self.assertEqual(config_obj.get("base_version"), iter_version)
+            self.assertEqual(config_obj.get("host_version"), iter_version)
+            self.assertEqual(utils.parse_hocon_file(base_path).get("base_version"), iter_version)
+
+        self.assertEqual(len(utils._parsed_hocon_files), 2)
+        self.assertEqual(len(utils._parsed_config_layers), 1)
+
+    def test_unchanged_files_are_reused(self):
+
+        base_path = self.temp_dir / "base.conf"
+        self.write_layer(base_path, "base_version = 1\n", 1)
+
+        self.assertIs(utils.parse_hocon_file(base_path), utils.parse_hocon_file(base_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
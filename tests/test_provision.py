@@ -0,0 +1,173 @@
+import os
+import json
+import pathlib
+import argparse
+import tempfile
+import threading
+import unittest
+import http.server
+import importlib.util
+from unittest import mock
+
+from cloud_init_utils import main
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+TOKEN_ENV_VAR = "CLOUD_INIT_UTILS_TEST_DIGITALOCEAN_TOKEN"
+
+CONFIG = '''
+cloud_init_utils {
+  bootstrap_script_settings {
+    root_folder = "/opt/bootstrap"
+    zip_url = "https://example.com/bootstrap.zip"
+    zip_root_folder = "bootstrap"
+    commands_to_run = [ { command_line = ["true"], acceptable_status_codes = [0] } ]
+    files_to_write = []
+  }
+  cloud_init_yaml_settings {
+    user_name = "mark"
+    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+    password = "hunter2"
+    byobu_enable = false
+    packages_to_install = ["htop"]
+    files_to_write = [
+      { file_path = "/etc/motd", owner_username = "root", owner_group = "root",
+        permission_octal = "0644", use_mustache_template = false, payload_is_base64 = false,
+        payload_content = "hello world\\n" }
+    ]
+  }
+}
+'''
+
+
+def _load_stub_api_module():
+
+    module_path = REPO_ROOT / "benchmarks" / "digitalocean_stub_api.py"
+
+    spec = importlib.util.spec_from_file_location("digitalocean_stub_api", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+digitalocean_stub_api = _load_stub_api_module()
+
+
+class TestProvision(unittest.TestCase):
+    '''
+    runs `provision` against benchmarks/digitalocean_stub_api.py on a local port
+    '''
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        config_path = pathlib.Path(self.temp_dir.name) / "test.conf"
+        config_path.write_text(CONFIG, encoding="utf-8")
+
+        self.config_path = config_path
+        self.config = utils.load_config_settings([config_path])
+        self.output_path = pathlib.Path(self.temp_dir.name) / "droplets.json"
+
+        patcher = mock.patch.dict(os.environ, {TOKEN_ENV_VAR: "stub"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_stub_api(self, rate_limit:int, rate_limit_window:float, active_after:float, latency:float=0.0):
+
+        stub_args = argparse.Namespace(latency=latency, rate_limit=rate_limit, rate_limit_window=rate_limit_window,
+            active_after=active_after, verbose=False)
+
+        self.stub_state = digitalocean_stub_api.StubApiState(stub_args)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), digitalocean_stub_api.make_handler(self.stub_state))
+
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return f"http://127.0.0.1:{server.server_address[1]}/v2/"
+
+    def run_provision(self, api_url:str, extra_args:list):
+
+        parsed_args = main.get_argument_parser().parse_args([
+            "--no-cache", "--config", str(self.config_path),
+            "provision", "--api-url", api_url, "--token-env-var", TOKEN_ENV_VAR,
+            "--region", "nyc3", "--size", "s-1vcpu-1gb", "--image", "ubuntu-22-04-x64",
+            "--tag", "web", "--poll-interval", "0.05", "--droplets-output-file", str(self.output_path)] + extra_args)
+
+        parsed_args.func_to_run(self.config, parsed_args)
+
+    def read_output_file(self) -> list:
+        return json.loads(self.output_path.read_text(encoding="utf-8"))
+
+    def test_rate_limited_requests_are_retried(self):
+
+        # 12 names are two create requests, sent at the same time before the client has seen the
+        # rate limit headers, so one of them gets a 429 and has to wait for the reset
+        api_url = self.start_stub_api(rate_limit=1, rate_limit_window=0.5, active_after=0.1, latency=0.1)
+
+        # a droplet that isn't from this run, it shouldn't be looked at
+        self.stub_state.create_droplets({"names": ["someone-elses"], "tags": ["web"]})
+
+        list_droplets = mock.patch.object(self.stub_state, "list_droplets", wraps=self.stub_state.list_droplets)
+
+        with list_droplets as list_droplets_mock, self.assertLogs("cloud_init_utils.digitalocean_api", level="WARNING") as captured_logs:
+            self.run_provision(api_url, ["--count", "12", "--name-prefix", "web", "--threads", "2", "--timeout", "30"])
+
+        self.assertTrue(any("`429`" in iter_line for iter_line in captured_logs.output))
+
+        droplets = self.read_output_file()
+
+        self.assertEqual([iter_droplet["name"] for iter_droplet in droplets], sorted(f"web-{iter_index}" for iter_index in range(1, 13)))
+        self.assertTrue(all(iter_droplet["status"] == constants.DIGITALOCEAN_DROPLET_ACTIVE_STATUS for iter_droplet in droplets))
+        self.assertTrue(all(iter_droplet["public_ipv4"] for iter_droplet in droplets))
+
+        # each droplet got the --tag and the tag of the run
+        created_droplets = [iter_droplet for iter_droplet in self.stub_state.droplets.values() if iter_droplet["name"] != "someone-elses"]
+        run_tags = set(iter_tag for iter_droplet in created_droplets for iter_tag in iter_droplet["tags"]
+            if iter_tag.startswith(constants.PROVISION_RUN_TAG_PREFIX))
+
+        self.assertEqual(len(run_tags), 1)
+        self.assertTrue(all("web" in iter_droplet["tags"] for iter_droplet in created_droplets))
+
+        # and every poll only asked for the droplets with that tag
+        self.assertTrue(list_droplets_mock.called)
+        self.assertEqual(set(iter_call.args for iter_call in list_droplets_mock.call_args_list), {(run_tags.pop(),)})
+
+        self.assertGreater(self.stub_state.rate_limited_count, 0)
+
+    def test_droplet_that_never_becomes_active(self):
+
+        api_url = self.start_stub_api(rate_limit=1000, rate_limit_window=60, active_after=3600)
+
+        with self.assertRaisesRegex(Exception, "`1` didn't become active in time"):
+            self.run_provision(api_url, ["--name", "stuck", "--timeout", "0.2"])
+
+        # the droplet was still created, so it has to be in the output file
+        droplets = self.read_output_file()
+
+        self.assertEqual(len(droplets), 1)
+        self.assertEqual(droplets[0]["name"], "stuck")
+        self.assertEqual(droplets[0]["status"], "new")
+
+    def test_output_file_is_written_when_polling_fails(self):
+
+        # only enough requests for the create, and the polls get a 429 until the client gives up
+        api_url = self.start_stub_api(rate_limit=1, rate_limit_window=3600, active_after=0)
+
+        with mock.patch.object(constants, "DIGITALOCEAN_API_BACKOFF_MAX_SECONDS", 0.0):
+            with self.assertRaisesRegex(Exception, "failed `6` times"):
+                self.run_provision(api_url, ["--name", "created", "--timeout", "30"])
+
+        self.assertEqual([iter_droplet["name"] for iter_droplet in self.read_output_file()], ["created"])
+
+
+if __name__ == "__main__":
+    unittest.main()
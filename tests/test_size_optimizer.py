@@ -0,0 +1,86 @@
+import io
+import random
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from cloud_init_utils import utils
+from cloud_init_utils.model import StreamedGzipPayload
+from cloud_init_utils.size_optimizer import UserDataSizeOptimizer
+
+
+def _get_yaml_dict(write_files:list) -> dict:
+
+    return {
+        "users": [{"name": "mark", "ssh_authorized_keys": ["ssh-ed25519 AAAA mark@host"]}],
+        "packages": ["htop", "git"],
+        "write_files": write_files,
+        "runcmd": [["bash", "/opt/bootstrap/run.sh"]],
+    }
+
+
+class TestBuildReport(unittest.TestCase):
+
+    def get_written_size(self, yaml_dict:dict) -> int:
+
+        yaml_buffer = io.StringIO()
+        utils.write_yaml_file_from_dict(yaml_dict, yaml_buffer)
+
+        return len(yaml_buffer.getvalue().encode("utf-8"))
+
+    def test_streamed_payload_is_compressed_once(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            for iter_size in [0, 1, 56, 57, 58, 57 * 1024, 57 * 1024 + 1, 200000]:
+
+                source_path = pathlib.Path(temp_dir) / f"payload_{iter_size}"
+                source_path.write_bytes(random.Random(iter_size).randbytes(iter_size))
+
+                payload = StreamedGzipPayload(source_path=source_path, compression_level=9)
+                yaml_dict = _get_yaml_dict([
+                    {"path": "/etc/motd", "owner": "root:root", "permissions": "0644", "content": "hello world\n"},
+                    {"path": "/opt/payload.bin", "owner": "root:root", "permissions": "0644", "encoding": "gzip", "content": payload},
+                ])
+
+                with self.subTest(size=iter_size):
+
+                    with mock.patch.object(StreamedGzipPayload, "_iter_compressed_chunks",
+                            autospec=True, side_effect=StreamedGzipPayload._iter_compressed_chunks) as compress_mock:
+
+                        size_report = UserDataSizeOptimizer(try_all_encodings=False).build_report(yaml_dict, 16384)
+                        written_size = self.get_written_size(yaml_dict)
+
+                    # once to measure it, and once to write it out
+                    self.assertEqual(compress_mock.call_count, 2)
+                    self.assertEqual(size_report.total_size, written_size)
+
+    def test_streamed_payload_is_measured_again_when_the_file_changes(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            source_path = pathlib.Path(temp_dir) / "payload"
+            source_path.write_bytes(b"a" * 1000)
+
+            payload = StreamedGzipPayload(source_path=source_path, compression_level=9)
+            first_size = payload.get_compressed_size()
+
+            source_path.write_bytes(random.Random(0).randbytes(5000))
+
+            self.assertNotEqual(payload.get_compressed_size(), first_size)
+            self.assertEqual(payload.get_compressed_size(), len(payload.read_all()))
+
+    def test_total_matches_the_written_yaml(self):
+
+        for iter_write_files in [[], [{"path": "/etc/motd", "owner": "root:root", "permissions": "0644", "content": "yes"}]]:
+            with self.subTest(write_files=iter_write_files):
+
+                yaml_dict = _get_yaml_dict(iter_write_files)
+                size_report = UserDataSizeOptimizer(try_all_encodings=False).build_report(yaml_dict, 16384)
+
+                self.assertEqual(size_report.total_size, self.get_written_size(yaml_dict))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import gzip
+import base64
+import random
+import hashlib
+import pathlib
+import tempfile
+import unittest
+
+from cloud_init_utils import utils
+from cloud_init_utils import constants
+from cloud_init_utils import user_data_verifier
+from cloud_init_utils.model import StreamedGzipPayload
+
+
+class TestHashWriteFilesContent(unittest.TestCase):
+    '''
+    the content of every encoding the renderer writes has to hash the same as the bytes it
+    came from once it is written out and loaded back in like verify_user_data() does
+    '''
+
+    def setUp(self):
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.temp_dir = pathlib.Path(temp_dir.name)
+
+    def load_write_files(self, write_files:list, gzip_whole_file:bool=False) -> list:
+
+        user_data_path = self.temp_dir / "user-data.yaml"
+
+        with open(user_data_path, "w", encoding="utf-8") as f:
+            utils.write_yaml_file_from_dict({"write_files": write_files}, f)
+
+        if gzip_whole_file:
+            user_data_path.write_bytes(gzip.compress(user_data_path.read_bytes()))
+
+        return user_data_verifier.load_user_data(user_data_path)["write_files"]
+
+    def test_round_trip(self):
+
+        # bigger than a decode chunk, so the chunks have to join up
+        big_bytes = random.Random(0).randbytes(constants.VERIFY_BASE64_DECODE_CHUNK_SIZE + 12345)
+        text = "line one\nline two: with a colon\n  indented\n"
+
+        source_path = self.temp_dir / "payload.bin"
+        source_path.write_bytes(big_bytes)
+
+        write_files = [
+            {"path": "/etc/gzip", "encoding": "gzip", "content": gzip.compress(big_bytes, mtime=0)},
+            {"path": "/etc/streamed", "encoding": "gzip", "content": StreamedGzipPayload(source_path=source_path, compression_level=6)},
+            # two gzip members one after the other decompress to both of them
+            {"path": "/etc/gz+b64", "encoding": "gz+b64", "content": base64.b64encode(gzip.compress(big_bytes[:100]) + gzip.compress(big_bytes[100:])).decode("ascii")},
+            {"path": "/etc/b64", "encoding": "b64", "content": base64.b64encode(big_bytes).decode("ascii")},
+            {"path": "/etc/text", "content": text},
+            {"path": "/etc/text-plain", "encoding": "text/plain", "content": text},
+            {"path": "/etc/empty", "encoding": "b64", "content": ""},
+        ]
+
+        expected_bytes = [big_bytes, big_bytes, big_bytes, big_bytes, text.encode("utf-8"), text.encode("utf-8"), b""]
+
+        for iter_gzip_whole_file in (False, True):
+            for iter_entry, iter_expected_bytes in zip(self.load_write_files(write_files, iter_gzip_whole_file), expected_bytes):
+                with self.subTest(path=iter_entry["path"], gzip_whole_file=iter_gzip_whole_file):
+                    self.assertEqual(user_data_verifier.hash_write_files_content(iter_entry),
+                        (hashlib.sha256(iter_expected_bytes).hexdigest(), len(iter_expected_bytes)))
+
+    def test_bad_content(self):
+
+        gzip_bytes = gzip.compress(b"hello world", mtime=0)
+
+        bad_entries = [
+            ({"encoding": "gzip", "content": base64.b64encode(gzip_bytes[:-4]).decode("ascii")}, "truncated"),
+            ({"encoding": "b64", "content": "aGVsbG8"}, "left over"),
+            ({"encoding": "rot13", "content": "uryyb"}, "unknown write_files encoding"),
+        ]
+
+        for iter_entry, iter_message in bad_entries:
+            with self.subTest(encoding=iter_entry["encoding"]):
+                with self.assertRaisesRegex(ValueError, iter_message):
+                    user_data_verifier.hash_write_files_content(iter_entry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import io
+import os
+import gzip
+import base64
+import random
+import pathlib
+import tempfile
+import unittest
+
+from cloud_init_utils import utils
+from cloud_init_utils.model import StreamedGzipPayload
+
+
+# base64.encodebytes() puts 57 bytes on a line, and utils streams the content 57 * 1024 bytes at a time
+_BASE64_LINE_BYTES = 57
+_STREAM_CHUNK_BYTES = 57 * 1024
+
+# strings that YAML would read back as something else if they weren't quoted
+_AWKWARD_SCALARS = [
+    "",
+    " leading space",
+    "trailing space ",
+    "yes",
+    "No",
+    "null",
+    "~",
+    "123",
+    "0755",
+    "1e3",
+    "0x1F",
+    "#not a comment",
+    "key: value",
+    "- not a list",
+    "'single quoted'",
+    "\"double quoted\"",
+    "multi\nline\n",
+    "tab\tseparated",
+    "unicode é中文 \U0001f600",
+    "!!binary",
+    "&anchor *alias",
+    "{flow: mapping}",
+    "[flow, sequence]",
+]
+
+
+def _get_random_bytes(size:int) -> bytes:
+    return random.Random(size).randbytes(size)
+
+
+def _get_yaml_dict(write_files:list) -> dict:
+    '''
+    @return a dict shaped like the one CloudInitSettings.format_as_yaml_dict() returns
+    '''
+
+    return {
+        "users": [{"name": "mark", "ssh_authorized_keys": ["ssh-ed25519 AAAA mark@host"]}],
+        "chpasswd": {"list": ["mark:hunter2"], "expire": False},
+        "package_update": True,
+        "packages": ["htop", "git"],
+        "write_files": write_files,
+        "runcmd": [["bash", "/opt/bootstrap/run.sh"]],
+    }
+
+
+def _get_binary_entry(content) -> dict:
+
+    return {"path": "/opt/payload.bin", "owner": "root:root", "permissions": "0644", "encoding": "gzip", "content": content}
+
+
+class TestWriteYamlFileFromDict(unittest.TestCase):
+    '''
+    write_yaml_file_from_dict() has to write exactly what get_yaml_file_string_from_dict() does
+    '''
+
+    def assert_same_yaml(self, yaml_dict:dict):
+
+        streamed = io.StringIO()
+        utils.write_yaml_file_from_dict(yaml_dict, streamed)
+
+        self.assertEqual(streamed.getvalue(), utils.get_yaml_file_string_from_dict(yaml_dict))
+
+    def test_binary_content_sizes(self):
+
+        sizes = [0, 1, _BASE64_LINE_BYTES - 1, _BASE64_LINE_BYTES, _BASE64_LINE_BYTES + 1,
+            _STREAM_CHUNK_BYTES - 1, _STREAM_CHUNK_BYTES, _STREAM_CHUNK_BYTES + 1, _STREAM_CHUNK_BYTES * 2 + _BASE64_LINE_BYTES]
+
+        for iter_size in sizes:
+            with self.subTest(size=iter_size):
+                self.assert_same_yaml(_get_yaml_dict([_get_binary_entry(_get_random_bytes(iter_size))]))
+
+    def test_streamed_gzip_payload(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            for iter_size in [0, _BASE64_LINE_BYTES, _BASE64_LINE_BYTES + 1, _STREAM_CHUNK_BYTES, _STREAM_CHUNK_BYTES + 1]:
+
+                source_path = pathlib.Path(temp_dir) / f"payload_{iter_size}"
+                source_path.write_bytes(_get_random_bytes(iter_size))
+
+                # a read size that doesn't line up with the base64 lines, so the chunks have to be split up
+                payload = StreamedGzipPayload(source_path=source_path, compression_level=9, read_chunk_size=1000)
+
+                with self.subTest(size=iter_size):
+                    self.assert_same_yaml(_get_yaml_dict([_get_binary_entry(payload)]))
+                    self.assertEqual(gzip.decompress(payload.read_all()), source_path.read_bytes())
+
+    def test_text_plain_content(self):
+
+        for iter_content in _AWKWARD_SCALARS:
+            with self.subTest(content=iter_content):
+
+                # text/plain is written without an `encoding` key
+                entry = {"path": "/etc/motd", "owner": "root:root", "permissions": "0644", "content": iter_content}
+                self.assert_same_yaml(_get_yaml_dict([entry]))
+
+    def test_base64_string_content(self):
+
+        for iter_encoding in ["b64", "gz+b64"]:
+            for iter_size in [0, 1, _BASE64_LINE_BYTES, _BASE64_LINE_BYTES + 1, _STREAM_CHUNK_BYTES, _STREAM_CHUNK_BYTES + 1]:
+                with self.subTest(encoding=iter_encoding, size=iter_size):
+
+                    content = base64.b64encode(_get_random_bytes(iter_size)).decode("ascii")
+                    entry = {"path": "/etc/b64", "owner": "root:root", "permissions": "0644", "encoding": iter_encoding, "content": content}
+                    self.assert_same_yaml(_get_yaml_dict([entry]))
+
+    def test_base64_string_that_looks_like_a_number(self):
+
+        # only base64 characters, but YAML would read these back as an int and a float if they weren't quoted
+        for iter_content in ["1" * 200, "12e+3" + "4" * 200]:
+            with self.subTest(content=iter_content):
+
+                entry = {"path": "/etc/b64", "owner": "root:root", "permissions": "0644", "encoding": "b64", "content": iter_content}
+                self.assert_same_yaml(_get_yaml_dict([entry]))
+
+    def test_awkward_scalars_outside_write_files(self):
+
+        for iter_value in _AWKWARD_SCALARS:
+            with self.subTest(value=iter_value):
+
+                yaml_dict = _get_yaml_dict([_get_binary_entry(b"payload")])
+                yaml_dict["users"][0]["name"] = iter_value
+                yaml_dict["packages"] = [iter_value, "git"]
+
+                entry = {"path": f"/etc/{iter_value}", "owner": iter_value, "permissions": "0644", "encoding": "gzip", "content": b"payload"}
+                yaml_dict["write_files"].append(entry)
+
+                self.assert_same_yaml(yaml_dict)
+
+    def test_empty_and_several_write_files(self):
+
+        self.assert_same_yaml(_get_yaml_dict([]))
+
+        write_files = [
+            _get_binary_entry(b""),
+            {"path": "/etc/motd", "owner": "root:root", "permissions": "0644", "content": "hello world\n"},
+            _get_binary_entry(_get_random_bytes(_STREAM_CHUNK_BYTES + 1)),
+        ]
+        self.assert_same_yaml(_get_yaml_dict(write_files))
+
+    def test_rendered_config(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            payload_path = pathlib.Path(temp_dir) / "payload.bin"
+            payload_path.write_bytes(os.urandom(_STREAM_CHUNK_BYTES + 1))
+
+            config_path = pathlib.Path(temp_dir) / "test.conf"
+            config_path.write_text(f'''
+                cloud_init_utils {{
+                  bootstrap_script_settings {{
+                    root_folder = "/opt/bootstrap"
+                    zip_url = "https://example.com/bootstrap.zip"
+                    zip_root_folder = "bootstrap"
+                    commands_to_run = [ {{ command_line = ["true"], acceptable_status_codes = [0] }} ]
+                    files_to_write = []
+                  }}
+                  cloud_init_yaml_settings {{
+                    user_name = "yes"
+                    ssh_authorized_keys = ["ssh-ed25519 AAAA mark@host"]
+                    password = "p#ss: 0755"
+                    byobu_enable = true
+                    packages_to_install = ["htop", "null"]
+                    files_to_write = [
+                      {{ file_path = "/etc/motd", owner_username = "root", owner_group = "root",
+                        permission_octal = "0644", use_mustache_template = false, payload_is_base64 = false,
+                        payload_content = "hello world\\n" }}
+                      {{ file_path = "/opt/payload.bin", owner_username = "root", owner_group = "root",
+                        permission_octal = "0755", use_mustache_template = false, payload_is_base64 = false,
+                        payload_source_path = "{payload_path}" }}
+                    ]
+                  }}
+                }}
+                ''', encoding="utf-8")
+
+            config_settings = utils.load_config_settings([config_path])
+
+            self.assert_same_yaml(config_settings.cloud_init_settings.format_as_yaml_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()